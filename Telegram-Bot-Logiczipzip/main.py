@@ -1,18 +1,39 @@
 import asyncio
+import functools
 import logging
+import signal
 
 from aiogram import Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
 
-from src.config import BOT_TOKEN
+from src.config import (
+    BOT_TOKEN, DB_UNIT_OF_WORK, DB_POOL_MAX_SIZE, UPDATE_CONCURRENCY, JOB_WORKERS, TELEGRAM_WEBHOOK_URL, TELEGRAM_WEBHOOK_PATH, TELEGRAM_WEBHOOK_SECRET,
+    SUBSCRIPTION_WARM_DAYS, FSM_STORAGE, FSM_STATE_TTL, FSM_MEMORY_MAX_ENTRIES, FSM_MEMORY_MAX_ENTRY_BYTES,
+)
 from src.bot.instance import create_bot
 from src.db.database import init_db, close_db
 from src.handlers import start, profile, sim_sign, orders, help, admin, operator, review
-from src.handlers.payment import start_payment_check
+from src.handlers.payment import start_payment_check, payment_poller
 from src.db.payments import get_pending_payments
 from src.db.orders import expire_old_orders
 from src.db.accounts import release_expired_reservations
-from src.utils.preorders import run_preorder_fulfillment
+from src.db.inventory import reconcile_inventory
+from src.db.signatures import compact_signatures
+from src.db.listener import start_listener, stop_listener
+from src.middlewares.roles import RolesMiddleware
+from src.middlewares.uow import UnitOfWorkMiddleware
+from src.middlewares.fsm import FSMBatchMiddleware
+from src.storage.postgres import PostgresStorage, cleanup_fsm_states
+from src.storage.memory import BoundedMemoryStorage
+from src.web.server import start_web_server, stop_web_server
+from src.utils.expiry import wait_for_expiry, schedule_expiry, lead_expiry, lose_expiry, RETRY_DELAY
+from src.utils.preorders import run_preorder_fulfillment, wake_preorders, wait_for_preorder_wake
+from src.utils.broadcasts import resume_broadcasts
+from src.utils.messaging import flush_unreachable
+from src.utils.outbox import enqueue, start_outbox, stop_outbox
+from src.utils.subscriptions import warm_subscriptions
+from src.utils.singletons import register_job, start_jobs, stop_jobs
+from src.utils.taskqueue import start_job_workers, stop_job_workers
+from src.db.jobs import prune_jobs
 
 
 async def resume_pending_payments():
@@ -23,38 +44,116 @@ async def resume_pending_payments():
         logging.info(f"Resumed {len(pending)} pending payment checks")
 
 
-async def expiry_checker(bot):
-    while True:
-        try:
-            expired = await expire_old_orders()
+async def expire_due(due: set[str]):
+    try:
+        if "reservation" in due:
             await release_expired_reservations()
+        if "order" in due:
+            expired = await expire_old_orders()
             for order in expired:
-                try:
-                    await bot.send_message(
-                        order["user_id"],
-                        f"⏰ <b>Заказ #{order['id']} истёк</b>\n\n"
-                        f"Срок действия заказа (72ч) закончился.\n"
-                        f"Неиспользованные подписи аннулированы.",
-                        parse_mode="HTML",
-                    )
-                except Exception:
-                    pass
+                if not order["user_active"]:
+                    continue
+                enqueue(
+                    order["user_id"],
+                    f"⏰ <b>Заказ #{order['id']} истёк</b>\n\n"
+                    f"Срок действия заказа (72ч) закончился.\n"
+                    f"Неиспользованные подписи аннулированы.",
+                    parse_mode="HTML",
+                )
+            await flush_unreachable()
             if expired:
                 logging.info(f"Expired {len(expired)} orders")
+    except Exception:
+        for kind in due:
+            schedule_expiry(kind, RETRY_DELAY)
+        raise
+
+
+async def reconcile():
+    drift = await reconcile_inventory()
+    if drift:
+        logging.warning(f"Inventory reconciler fixed {len(drift)} categories")
+
+
+async def prune_finished_jobs():
+    removed = await prune_jobs(7)
+    if removed:
+        logging.info(f"Pruned {removed} finished queue jobs")
+
+
+def register_singleton_jobs(bot):
+    register_job("resume_pending_payments", resume_pending_payments)
+    register_job("expiry_checker", expire_due, wait=wait_for_expiry, on_lead=lead_expiry, on_lose=lose_expiry)
+    register_job(
+        "preorder_fulfiller", functools.partial(run_preorder_fulfillment, bot),
+        wait=wait_for_preorder_wake, on_lead=wake_preorders,
+    )
+    register_job("inventory_reconciler", reconcile, interval=600, run_first=False)
+    register_job("signature_compactor", compact_signatures, interval=3600)
+    register_job("job_pruner", prune_finished_jobs, interval=3600)
+
+
+async def fsm_cleaner(storage):
+    while True:
+        try:
+            if isinstance(storage, PostgresStorage):
+                removed = await cleanup_fsm_states(FSM_STATE_TTL)
+            else:
+                removed = storage.evict_expired()
+                stats = storage.get_stats()
+                logging.info(
+                    f"FSM memory: {stats['entries']} entries, ~{stats['bytes'] // 1024} KB, "
+                    f"evicted ttl={stats['evicted_ttl']} lru={stats['evicted_lru']}, rejected={stats['rejected']}"
+                )
+            if removed:
+                logging.info(f"Removed {removed} abandoned FSM states")
         except Exception as e:
-            logging.error(f"Expiry checker error: {e}")
-        await asyncio.sleep(300)
+            logging.error(f"FSM cleaner error: {e}")
+        await asyncio.sleep(3600)
 
 
-async def preorder_fulfiller(bot):
+async def subscription_warmer(bot):
+    try:
+        from src.db.channels import get_required_channels
+        from src.db.users import get_recent_buyer_ids
+        channels = await get_required_channels()
+        if not channels:
+            return
+        user_ids = await get_recent_buyer_ids(SUBSCRIPTION_WARM_DAYS)
+        warmed = await warm_subscriptions(bot, user_ids, [ch["channel_id"] for ch in channels])
+        if warmed:
+            logging.info(f"Warmed {warmed} subscription checks for {len(user_ids)} recent buyers")
+    except Exception as e:
+        logging.error(f"Subscription warmer error: {e}")
+
+
+async def broadcast_resumer(bot):
     while True:
         try:
-            await run_preorder_fulfillment(bot)
+            resumed = await resume_broadcasts(bot)
+            if resumed:
+                logging.info(f"Resumed {resumed} interrupted broadcasts")
         except Exception as e:
-            logging.error(f"Preorder fulfiller error: {e}")
+            logging.error(f"Broadcast resumer error: {e}")
         await asyncio.sleep(60)
 
 
+async def run_webhook(dp: Dispatcher, bot):
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await bot.set_webhook(
+        TELEGRAM_WEBHOOK_URL.rstrip("/") + TELEGRAM_WEBHOOK_PATH,
+        secret_token=TELEGRAM_WEBHOOK_SECRET,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+    await start_web_server(dp, bot)
+    logging.info("Bot started (webhook)")
+    await stop.wait()
+    logging.info("Shutdown requested, draining updates")
+
+
 async def main():
     logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
 
@@ -63,11 +162,33 @@ async def main():
         await asyncio.sleep(5)
         return
 
+    if TELEGRAM_WEBHOOK_URL and not TELEGRAM_WEBHOOK_SECRET:
+        logging.error("TELEGRAM_WEBHOOK_SECRET is not set. Webhook mode needs it to reject forged updates.")
+        await asyncio.sleep(5)
+        return
+
+    if DB_UNIT_OF_WORK and UPDATE_CONCURRENCY + JOB_WORKERS >= DB_POOL_MAX_SIZE:
+        logging.error(
+            f"DB_UNIT_OF_WORK=1 pins a connection per update: UPDATE_CONCURRENCY={UPDATE_CONCURRENCY} "
+            f"plus JOB_WORKERS={JOB_WORKERS} must stay below DB_POOL_MAX_SIZE={DB_POOL_MAX_SIZE}."
+        )
+        await asyncio.sleep(5)
+        return
+
     bot = create_bot()
     await init_db()
-    await resume_pending_payments()
-
-    dp = Dispatcher(storage=MemoryStorage())
+    await start_listener()
+
+    if FSM_STORAGE == "postgres":
+        storage = PostgresStorage()
+    else:
+        storage = BoundedMemoryStorage(FSM_STATE_TTL, FSM_MEMORY_MAX_ENTRIES, FSM_MEMORY_MAX_ENTRY_BYTES)
+    dp = Dispatcher(storage=storage)
+    if DB_UNIT_OF_WORK:
+        dp.update.outer_middleware(UnitOfWorkMiddleware())
+    dp.update.outer_middleware(RolesMiddleware())
+    if isinstance(storage, PostgresStorage):
+        dp.update.outer_middleware(FSMBatchMiddleware(storage))
 
     dp.include_router(admin.router)
     dp.include_router(operator.router)
@@ -78,15 +199,31 @@ async def main():
     dp.include_router(help.router)
     dp.include_router(review.router)
 
-    asyncio.create_task(expiry_checker(bot))
-    asyncio.create_task(preorder_fulfiller(bot))
+    start_outbox(bot)
+    start_job_workers()
+    register_singleton_jobs(bot)
+    start_jobs()
+    asyncio.create_task(payment_poller())
+    asyncio.create_task(broadcast_resumer(bot))
+    asyncio.create_task(subscription_warmer(bot))
+    asyncio.create_task(fsm_cleaner(storage))
 
-    logging.info("Bot started")
     try:
-        await dp.start_polling(bot)
+        if TELEGRAM_WEBHOOK_URL:
+            await run_webhook(dp, bot)
+        else:
+            await start_web_server()
+            await bot.delete_webhook()
+            logging.info("Bot started")
+            await dp.start_polling(bot, tasks_concurrency_limit=UPDATE_CONCURRENCY)
     finally:
+        await stop_web_server()
+        await stop_jobs()
+        await stop_job_workers()
+        await stop_outbox()
         from src.utils.cryptobot import close_crypto_session
         await close_crypto_session()
+        await stop_listener()
         await close_db()
 
 
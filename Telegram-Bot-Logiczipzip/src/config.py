@@ -7,3 +7,37 @@ SEED_ADMIN_IDS = [8181792806, 1083294848, 7699005037]
 CRYPTO_BOT_TOKEN = os.getenv("CRYPTO_BOT_TOKEN", "")
 
 DATABASE_URL = os.getenv("DATABASE_URL", "")
+
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "40"))
+DB_UNIT_OF_WORK = os.getenv("DB_UNIT_OF_WORK", "0") == "1"
+
+WEB_SERVER_HOST = os.getenv("WEB_SERVER_HOST", "0.0.0.0")
+WEB_SERVER_PORT = int(os.getenv("WEB_SERVER_PORT", "8080"))
+
+CRYPTO_WEBHOOK_PATH = os.getenv("CRYPTO_WEBHOOK_PATH", "")
+
+TELEGRAM_WEBHOOK_URL = os.getenv("TELEGRAM_WEBHOOK_URL", "")
+TELEGRAM_WEBHOOK_PATH = os.getenv("TELEGRAM_WEBHOOK_PATH", "/telegram/webhook")
+TELEGRAM_WEBHOOK_SECRET = os.getenv("TELEGRAM_WEBHOOK_SECRET", "")
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "32"))
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "30"))
+
+TELEGRAM_RATE = float(os.getenv("TELEGRAM_RATE", "28"))
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", "8"))
+
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "10"))
+
+PREORDER_RESCAN_INTERVAL = float(os.getenv("PREORDER_RESCAN_INTERVAL", "600"))
+
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "10"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+
+SUBSCRIPTION_TTL = float(os.getenv("SUBSCRIPTION_TTL", "600"))
+SUBSCRIPTION_NEGATIVE_TTL = float(os.getenv("SUBSCRIPTION_NEGATIVE_TTL", "30"))
+SUBSCRIPTION_WARM_DAYS = int(os.getenv("SUBSCRIPTION_WARM_DAYS", "3"))
+
+FSM_STORAGE = os.getenv("FSM_STORAGE", "postgres")
+FSM_STATE_TTL = float(os.getenv("FSM_STATE_TTL", "172800"))
+FSM_MEMORY_MAX_ENTRIES = int(os.getenv("FSM_MEMORY_MAX_ENTRIES", "50000"))
+FSM_MEMORY_MAX_ENTRY_BYTES = int(os.getenv("FSM_MEMORY_MAX_ENTRY_BYTES", "262144"))
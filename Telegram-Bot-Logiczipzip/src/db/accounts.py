@@ -1,6 +1,9 @@
 import re
 import logging
+from collections import deque
 from src.db.database import get_pool
+from src.db.inventory import update_signatures, apply_accounts_delta
+from src.db.signatures import ensure_signature_rows
 
 logger = logging.getLogger(__name__)
 
@@ -34,7 +37,7 @@ async def get_account_signatures(account_id: int) -> list[dict]:
     async with pool.acquire() as conn:
         rows = await conn.fetch(
             """SELECT s.*, c.name as category_name, c.max_signatures as cat_max_signatures
-               FROM account_signatures s
+               FROM signature_matrix s
                JOIN categories c ON s.category_id = c.id
                WHERE s.account_id = $1
                ORDER BY c.name""",
@@ -53,7 +56,7 @@ async def is_account_exhausted(account_id: int) -> bool:
     pool = await get_pool()
     async with pool.acquire() as conn:
         cnt = await conn.fetchval(
-            """SELECT COUNT(*) FROM account_signatures s
+            """SELECT COUNT(*) FROM signature_matrix s
                JOIN categories c ON s.category_id = c.id
                WHERE s.account_id = $1
                  AND s.used_signatures < COALESCE(s.max_signatures, c.max_signatures)""",
@@ -71,76 +74,124 @@ async def update_account_totp(account_id: int, new_totp: str):
         )
 
 
-def parse_accounts_text(text: str) -> list[dict]:
-    results = []
-    lines = [l.strip() for l in text.strip().split("\n")]
-    i = 0
-    while i < len(lines):
-        line = lines[i]
+_INDEX_PREFIX = re.compile(r"^\d+[\.\)]\s*")
+_BLOCK_INDEX = re.compile(r"^\d+$")
+
+
+class AccountLineParser:
+    def __init__(self):
+        self._lines: deque[tuple[int, str]] = deque()
+        self._line_no = 0
+        self.rejected: list[tuple[int, str]] = []
+
+    def feed(self, line: str) -> list[dict]:
+        self._line_no += 1
+        self._lines.append((self._line_no, line.strip()))
+        results = []
+        while len(self._lines) >= 4:
+            self._step(results)
+        return results
+
+    def finish(self) -> list[dict]:
+        results = []
+        while self._lines:
+            self._step(results)
+        return results
+
+    def _take(self, count: int) -> list[str]:
+        return [self._lines.popleft()[1] for _ in range(count)]
+
+    def _step(self, results: list[dict]):
+        line_no, line = self._lines[0]
         if not line:
-            i += 1
-            continue
-        cleaned = re.sub(r"^\d+[\.\)]\s*", "", line)
+            self._lines.popleft()
+            return
+        cleaned = _INDEX_PREFIX.sub("", line)
         parts = cleaned.split()
+        ahead = [l for _, l in list(self._lines)[1:4]]
         if len(parts) >= 3:
-            results.append({
-                "phone": parts[0],
-                "password": parts[1],
-                "totp_secret": parts[2],
-            })
-            i += 1
-            continue
-        if re.match(r"^\d+$", cleaned) and len(cleaned) <= 5:
-            if i + 3 < len(lines):
-                phone = lines[i + 1].strip()
-                password = lines[i + 2].strip()
-                totp_secret = lines[i + 3].strip()
-                if phone and password and totp_secret:
-                    results.append({
-                        "phone": phone,
-                        "password": password,
-                        "totp_secret": totp_secret,
-                    })
-                    i += 4
-                    continue
-        if len(parts) == 1 and len(cleaned) >= 7:
-            if i + 2 < len(lines):
-                password = lines[i + 1].strip()
-                totp_secret = lines[i + 2].strip()
-                if password and totp_secret:
-                    results.append({
-                        "phone": cleaned,
-                        "password": password,
-                        "totp_secret": totp_secret,
-                    })
-                    i += 3
-                    continue
-        i += 1
+            self._lines.popleft()
+            results.append({"phone": parts[0], "password": parts[1], "totp_secret": parts[2]})
+            return
+        if _BLOCK_INDEX.match(cleaned) and len(cleaned) <= 5 and len(ahead) >= 3 and all(ahead[:3]):
+            _, phone, password, totp_secret = self._take(4)
+            results.append({"phone": phone, "password": password, "totp_secret": totp_secret})
+            return
+        if len(parts) == 1 and len(cleaned) >= 7 and len(ahead) >= 2 and all(ahead[:2]):
+            phone, password, totp_secret = self._take(3)
+            results.append({"phone": _INDEX_PREFIX.sub("", phone), "password": password, "totp_secret": totp_secret})
+            return
+        self._lines.popleft()
+        self.rejected.append((line_no, line))
+
+
+def parse_accounts_text(text: str) -> list[dict]:
+    parser = AccountLineParser()
+    results = []
+    for line in text.strip().split("\n"):
+        results.extend(parser.feed(line))
+    results.extend(parser.finish())
     return results
 
 
-async def bulk_add_accounts(accounts_data: list[dict], added_by_admin_id: int = None) -> tuple[int, list[int]]:
+_IMPORT_LOCK_KEY = "account_import"
+
+_IMPORT_INSERT_SQL = """
+    WITH fresh AS (
+        SELECT DISTINCT ON (s.phone) s.ord, s.phone, s.password, s.totp_secret
+        FROM account_import s
+        WHERE NOT EXISTS (SELECT 1 FROM accounts a WHERE a.phone = s.phone)
+        ORDER BY s.phone, s.ord
+    )
+    INSERT INTO accounts (phone, password, totp_secret, added_by_admin_id, is_enabled)
+    SELECT phone, password, totp_secret, $1, 0 FROM fresh ORDER BY ord
+    RETURNING id, phone
+"""
+
+
+async def import_accounts(accounts_data: list[dict], added_by_admin_id: int = None) -> dict:
+    records = [
+        (i, acc["phone"], acc["password"], acc["totp_secret"])
+        for i, acc in enumerate(accounts_data)
+    ]
+    if not records:
+        return {"added_ids": [], "duplicates": []}
     pool = await get_pool()
     async with pool.acquire() as conn:
-        categories = await conn.fetch("SELECT id, max_signatures FROM categories")
-        categories = [dict(c) for c in categories]
-
-        added = 0
-        added_ids = []
         async with conn.transaction():
-            for acc in accounts_data:
-                account_id = await conn.fetchval(
-                    "INSERT INTO accounts (phone, password, totp_secret, added_by_admin_id, is_enabled) VALUES ($1, $2, $3, $4, 0) RETURNING id",
-                    acc["phone"], acc["password"], acc["totp_secret"], added_by_admin_id
-                )
-                added_ids.append(account_id)
-                for cat in categories:
-                    await conn.execute(
-                        "INSERT INTO account_signatures (account_id, category_id, used_signatures) VALUES ($1, $2, 0)",
-                        account_id, cat["id"]
-                    )
-                added += 1
-        return added, added_ids
+            await conn.execute("SELECT pg_advisory_xact_lock(hashtext($1))", _IMPORT_LOCK_KEY)
+            await conn.execute(
+                """CREATE TEMP TABLE account_import (
+                       ord INTEGER, phone TEXT, password TEXT, totp_secret TEXT
+                   ) ON COMMIT DROP"""
+            )
+            await conn.copy_records_to_table(
+                "account_import", records=records,
+                columns=["ord", "phone", "password", "totp_secret"],
+            )
+            rows = await conn.fetch(_IMPORT_INSERT_SQL, added_by_admin_id)
+            inserted = {r["phone"]: r["id"] for r in rows}
+    added_ids = []
+    duplicates = []
+    for acc in accounts_data:
+        account_id = inserted.pop(acc["phone"], None)
+        if account_id is None:
+            duplicates.append(acc["phone"])
+        else:
+            added_ids.append(account_id)
+    return {"added_ids": added_ids, "duplicates": duplicates}
+
+
+async def _set_accounts_enabled(conn, enabled: bool, where_sql: str, *args) -> list[int]:
+    target = 1 if enabled else 0
+    async with conn.transaction():
+        rows = await conn.fetch(
+            f"UPDATE accounts SET is_enabled = {target} WHERE ({where_sql}) AND COALESCE(is_enabled, 1) <> {target} RETURNING id",
+            *args
+        )
+        changed = [r["id"] for r in rows]
+        await apply_accounts_delta(conn, changed, 1 if enabled else -1)
+    return changed
 
 
 async def enable_accounts_by_ids(account_ids: list[int]) -> int:
@@ -148,10 +199,7 @@ async def enable_accounts_by_ids(account_ids: list[int]) -> int:
         return 0
     pool = await get_pool()
     async with pool.acquire() as conn:
-        await conn.execute(
-            "UPDATE accounts SET is_enabled = 1 WHERE id = ANY($1)",
-            account_ids
-        )
+        await _set_accounts_enabled(conn, True, "id = ANY($1)", account_ids)
         return len(account_ids)
 
 
@@ -182,25 +230,22 @@ async def enable_accounts_by_phones(phones: list[str], account_ids: list[int]) -
                 matched_phones.append(r["phone"])
         if not matched_ids:
             return 0, []
-        await conn.execute(
-            "UPDATE accounts SET is_enabled = 1 WHERE id = ANY($1)",
-            matched_ids
-        )
+        await _set_accounts_enabled(conn, True, "id = ANY($1)", matched_ids)
         return len(matched_ids), matched_phones
 
 
 async def mass_enable_all_accounts() -> int:
     pool = await get_pool()
     async with pool.acquire() as conn:
-        result = await conn.execute("UPDATE accounts SET is_enabled = 1 WHERE is_enabled = 0")
-        return int(result.split()[-1])
+        changed = await _set_accounts_enabled(conn, True, "is_enabled = 0")
+        return len(changed)
 
 
 async def mass_disable_all_accounts() -> int:
     pool = await get_pool()
     async with pool.acquire() as conn:
-        result = await conn.execute("UPDATE accounts SET is_enabled = 0 WHERE is_enabled = 1")
-        return int(result.split()[-1])
+        changed = await _set_accounts_enabled(conn, False, "is_enabled = 1")
+        return len(changed)
 
 
 async def mass_enable_by_phones(phones: list[str]) -> tuple[int, list[str]]:
@@ -223,7 +268,7 @@ async def mass_enable_by_phones(phones: list[str]) -> tuple[int, list[str]]:
                 matched_phones.append(r["phone"])
         if not matched_ids:
             return 0, []
-        await conn.execute("UPDATE accounts SET is_enabled = 1 WHERE id = ANY($1)", matched_ids)
+        await _set_accounts_enabled(conn, True, "id = ANY($1)", matched_ids)
         return len(matched_ids), matched_phones
 
 
@@ -247,7 +292,7 @@ async def mass_disable_by_phones(phones: list[str]) -> tuple[int, list[str]]:
                 matched_phones.append(r["phone"])
         if not matched_ids:
             return 0, []
-        await conn.execute("UPDATE accounts SET is_enabled = 0 WHERE id = ANY($1)", matched_ids)
+        await _set_accounts_enabled(conn, False, "id = ANY($1)", matched_ids)
         return len(matched_ids), matched_phones
 
 
@@ -268,6 +313,12 @@ async def delete_account(account_id: int):
     pool = await get_pool()
     async with pool.acquire() as conn:
         async with conn.transaction():
+            enabled = await conn.fetchval(
+                "SELECT COALESCE(is_enabled, 1) = 1 FROM accounts WHERE id = $1 FOR UPDATE",
+                account_id
+            )
+            if enabled:
+                await apply_accounts_delta(conn, [account_id], -1)
             await conn.execute("DELETE FROM account_signatures WHERE account_id = $1", account_id)
             order_ids = await conn.fetch("SELECT id FROM orders WHERE account_id = $1", account_id)
             for row in order_ids:
@@ -319,6 +370,11 @@ async def mass_delete_accounts(account_ids: list[int]) -> int:
     async with pool.acquire() as conn:
         async with conn.transaction():
             deleted = 0
+            enabled_rows = await conn.fetch(
+                "SELECT id FROM accounts WHERE id = ANY($1) AND COALESCE(is_enabled, 1) = 1 FOR UPDATE",
+                account_ids
+            )
+            await apply_accounts_delta(conn, [r["id"] for r in enabled_rows], -1)
             await conn.execute("DELETE FROM account_signatures WHERE account_id = ANY($1)", account_ids)
             order_ids_rows = await conn.fetch("SELECT id FROM orders WHERE account_id = ANY($1)", account_ids)
             if order_ids_rows:
@@ -333,227 +389,419 @@ async def mass_delete_accounts(account_ids: list[int]) -> int:
             return deleted
 
 
+_RESERVE_ONE_SQL = """
+    WITH cat AS (
+        SELECT max_signatures FROM categories WHERE id = $1
+    ),
+    candidate AS (
+        SELECT s.id AS sig_id, a.id, a.phone, a.password, a.totp_secret,
+               COALESCE(s.max_signatures, cat.max_signatures) AS effective_max,
+               s.used_signatures,
+               CASE WHEN s.reserved_by IS NULL
+                    THEN COALESCE(s.max_signatures, cat.max_signatures) - s.used_signatures
+                    ELSE 0 END AS available_before
+        FROM account_signatures s
+        JOIN accounts a ON a.id = s.account_id
+        CROSS JOIN cat
+        WHERE s.category_id = $1
+          AND COALESCE(a.is_enabled, 1) = 1
+          AND COALESCE(s.max_signatures, cat.max_signatures) - s.used_signatures >= $2
+          AND (s.reserved_by IS NULL OR s.reserved_by = $3 OR s.reserved_until <= NOW())
+          AND s.id = ANY($5::int[])
+        ORDER BY CASE WHEN s.reserved_by = $3 THEN 0 ELSE 1 END,
+                 COALESCE(a.priority, 0) DESC,
+                 COALESCE(s.max_signatures, cat.max_signatures) - s.used_signatures ASC,
+                 a.created_at ASC
+        LIMIT 1
+        FOR UPDATE OF s {lock}
+    ),
+    claim AS (
+        SELECT candidate.*,
+               COALESCE($4::int, candidate.effective_max - candidate.used_signatures) AS qty
+        FROM candidate
+    ),
+    claimed AS (
+        UPDATE account_signatures s
+        SET used_signatures = s.used_signatures + claim.qty,
+            reserved_by = CASE WHEN s.used_signatures + claim.qty >= claim.effective_max THEN $3 END,
+            reserved_until = CASE WHEN s.used_signatures + claim.qty >= claim.effective_max
+                                  THEN NOW() + INTERVAL '3 days' END
+        FROM claim
+        WHERE s.id = claim.sig_id
+        RETURNING claim.id, claim.phone, claim.password, claim.totp_secret,
+                  claim.qty AS batch_size, s.used_signatures AS new_used,
+                  s.reserved_by IS NOT NULL AS fully_used,
+                  CASE WHEN s.reserved_by IS NULL THEN claim.effective_max - s.used_signatures ELSE 0 END
+                      - claim.available_before AS available_delta
+    ),
+    inventory AS (
+        UPDATE category_inventory i
+        SET available = i.available + claimed.available_delta, updated_at = NOW()
+        FROM claimed
+        WHERE i.category_id = $1 AND claimed.available_delta <> 0
+    )
+    SELECT * FROM claimed
+"""
+
+
+_MATRIX_SQL = """
+    SELECT m.sig_id, m.account_id AS id, m.effective_max - m.used_signatures AS remaining
+    FROM signature_matrix m
+    JOIN accounts a ON a.id = m.account_id
+    WHERE m.category_id = $1
+      AND m.account_id <> ALL($2::int[])
+      AND COALESCE(a.is_enabled, 1) = 1
+      AND {where}
+    ORDER BY {order}
+    LIMIT $3
+"""
+
+_SPARSE_COVER_SQL = """
+    WITH ranked AS (
+        SELECT m.sig_id, m.account_id,
+               m.effective_max - m.used_signatures AS remaining,
+               SUM(m.effective_max - m.used_signatures) OVER w AS covered,
+               ROW_NUMBER() OVER w AS rank
+        FROM signature_matrix m
+        JOIN accounts a ON a.id = m.account_id
+        WHERE m.category_id = $1
+          AND COALESCE(a.is_enabled, 1) = 1
+          AND {where}
+        WINDOW w AS (ORDER BY {order} ROWS UNBOUNDED PRECEDING)
+    )
+    SELECT account_id FROM ranked
+    WHERE sig_id IS NULL AND (covered - remaining < $2 OR rank <= $3)
+    ORDER BY account_id
+"""
+
+_SHARED_WHERE = """m.effective_max - m.used_signatures >= $4
+          AND (m.reserved_by IS NULL OR m.reserved_by = $5 OR m.reserved_until <= NOW())"""
+_SHARED_ORDER = """CASE WHEN m.reserved_by = $5 THEN 0 ELSE 1 END,
+                            COALESCE(a.priority, 0) DESC,
+                            m.effective_max - m.used_signatures ASC,
+                            a.created_at ASC"""
+
+_EXCLUSIVE_WHERE = """m.used_signatures = 0
+          AND (m.reserved_by IS NULL OR m.reserved_until <= NOW())
+          AND NOT EXISTS (
+              SELECT 1 FROM orders o
+              WHERE o.account_id = a.id
+                AND o.category_id = $1
+                AND o.status IN ('active', 'pending_review')
+          )"""
+_EXCLUSIVE_ORDER = "COALESCE(a.priority, 0) DESC, a.created_at ASC"
+
+_MATRIX_SHARED_SQL = _MATRIX_SQL.format(where=_SHARED_WHERE, order=_SHARED_ORDER)
+_MATRIX_EXCLUSIVE_SQL = _MATRIX_SQL.format(where=_EXCLUSIVE_WHERE, order=_EXCLUSIVE_ORDER)
+_SPARSE_SHARED_SQL = _SPARSE_COVER_SQL.format(where=_SHARED_WHERE, order=_SHARED_ORDER)
+_SPARSE_EXCLUSIVE_SQL = _SPARSE_COVER_SQL.format(where=_EXCLUSIVE_WHERE, order=_EXCLUSIVE_ORDER)
+
+_CREATE_SIGNATURE_ROWS_SQL = """
+    INSERT INTO account_signatures (account_id, category_id)
+    SELECT id, $1 FROM unnest($2::int[]) AS id
+    ORDER BY id
+    ON CONFLICT (account_id, category_id) DO UPDATE SET account_id = EXCLUDED.account_id
+    RETURNING id, account_id
+"""
+
+
+async def _create_signature_rows(conn, category_id: int, account_ids: list[int], wait: bool) -> dict[int, int]:
+    if wait:
+        await conn.fetch(
+            "SELECT pg_advisory_xact_lock($1, id) FROM (SELECT unnest($2::int[]) AS id ORDER BY 1) t",
+            category_id, account_ids
+        )
+    else:
+        rows = await conn.fetch(
+            "SELECT id FROM unnest($2::int[]) AS id WHERE pg_try_advisory_xact_lock($1, id)",
+            category_id, account_ids
+        )
+        account_ids = [r["id"] for r in rows]
+    if not account_ids:
+        return {}
+    rows = await conn.fetch(_CREATE_SIGNATURE_ROWS_SQL, category_id, account_ids)
+    return {r["account_id"]: r["id"] for r in rows}
+
+
+async def _materialize_candidates(conn, category_id: int, cover: int, exclusive: int):
+    account_ids = set()
+    if cover:
+        rows = await conn.fetch(_SPARSE_SHARED_SQL, category_id, cover, _RESERVE_WINDOW, 1, 0)
+        account_ids.update(r["account_id"] for r in rows)
+    if exclusive:
+        rows = await conn.fetch(_SPARSE_EXCLUSIVE_SQL, category_id, 1, max(exclusive, _RESERVE_WINDOW))
+        account_ids.update(r["account_id"] for r in rows)
+    if account_ids:
+        await _create_signature_rows(conn, category_id, sorted(account_ids), wait=True)
+
+
+async def _claim_first(conn, claim_sql: str, claim_args: tuple, candidates_sql: str, candidate_args: tuple,
+                       category_id: int, lock: str):
+    seen = []
+    window = _RESERVE_WINDOW
+    while True:
+        candidates = await conn.fetch(candidates_sql, category_id, seen, window, *candidate_args)
+        sig_ids = []
+        for c in candidates:
+            seen.append(c["id"])
+            if c["sig_id"] is not None:
+                sig_ids.append(c["sig_id"])
+                continue
+            if sig_ids:
+                row = await conn.fetchrow(claim_sql.format(lock=lock), *claim_args, sig_ids)
+                if row:
+                    return row
+                sig_ids = []
+            created = await _create_signature_rows(conn, category_id, [c["id"]], wait=not lock)
+            if created:
+                row = await conn.fetchrow(claim_sql.format(lock=lock), *claim_args, list(created.values()))
+                if row:
+                    return row
+        if sig_ids:
+            row = await conn.fetchrow(claim_sql.format(lock=lock), *claim_args, sig_ids)
+            if row:
+                return row
+        if len(candidates) < window:
+            return None
+        window = min(window * 2, _RESERVE_WINDOW_MAX)
+
+
+async def _lock_waiting_reservations(conn, category_id: int):
+    await conn.execute("SELECT pg_advisory_xact_lock(hashtext('reserve_wait'), $1)", category_id)
+
+
+async def _reserve_one(conn, category_id: int, user_id: int, quantity: int = None, wait: bool = True) -> dict | None:
+    min_remaining = quantity if quantity else 1
+    args = (category_id, min_remaining, user_id, quantity)
+    async with conn.transaction():
+        row = await _claim_first(conn, _RESERVE_ONE_SQL, args, _MATRIX_SHARED_SQL, (min_remaining, user_id),
+                                 category_id, "SKIP LOCKED")
+    if not row and wait:
+        async with conn.transaction():
+            await _lock_waiting_reservations(conn, category_id)
+            row = await _claim_first(conn, _RESERVE_ONE_SQL, args, _MATRIX_SHARED_SQL, (min_remaining, user_id),
+                                     category_id, "")
+    if not row:
+        return None
+    logger.info(f"reserve_account: account={row['id']}, cat={category_id}, user={user_id}, qty={row['batch_size']}, new_used={row['new_used']}, fully={row['fully_used']}")
+    return {
+        "id": row["id"],
+        "phone": row["phone"],
+        "password": row["password"],
+        "totp_secret": row["totp_secret"],
+        "batch_size": row["batch_size"],
+    }
+
+
 async def try_reserve_account(category_id: int, user_id: int, quantity: int = None) -> dict | None:
     pool = await get_pool()
     async with pool.acquire() as conn:
         try:
-            async with conn.transaction():
-                min_remaining = quantity if quantity else 1
-                row = await conn.fetchrow(
-                    """SELECT a.id, a.phone, a.password, a.totp_secret,
-                              COALESCE(a.priority, 0) as prio,
-                              (COALESCE(s.max_signatures, (SELECT max_signatures FROM categories WHERE id = $1)) - s.used_signatures) as remaining
-                       FROM accounts a
-                       JOIN account_signatures s ON a.id = s.account_id
-                       WHERE s.category_id = $2
-                         AND COALESCE(a.is_enabled, 1) = 1
-                         AND (COALESCE(s.max_signatures, (SELECT max_signatures FROM categories WHERE id = $3)) - s.used_signatures) >= $4
-                         AND (s.reserved_by IS NULL OR s.reserved_by = $5 OR s.reserved_until <= NOW())
-                       ORDER BY CASE WHEN s.reserved_by = $6 THEN 0 ELSE 1 END, prio DESC, remaining ASC, a.created_at ASC
-                       LIMIT 1
-                       FOR UPDATE OF s""",
-                    category_id, category_id, category_id, min_remaining, user_id, user_id
-                )
-                if not row:
-                    return None
-                account_id = row["id"]
-                cat_row = await conn.fetchrow(
-                    "SELECT max_signatures FROM categories WHERE id = $1",
-                    category_id
-                )
-                batch_size = cat_row["max_signatures"] if cat_row else 1
-                sig_row = await conn.fetchrow(
-                    "SELECT COALESCE(s.max_signatures, $1) as effective_max, s.used_signatures FROM account_signatures s WHERE s.account_id = $2 AND s.category_id = $3",
-                    batch_size, account_id, category_id
-                )
-                effective_max = sig_row["effective_max"] if sig_row else batch_size
-                current_used = sig_row["used_signatures"] if sig_row else 0
-                remaining_capacity = effective_max - current_used
-                if quantity is not None:
-                    if quantity > remaining_capacity:
-                        return None
-                    new_used = current_used + quantity
-                    actual_qty = quantity
-                else:
-                    new_used = effective_max
-                    actual_qty = remaining_capacity
-                fully_used = new_used >= effective_max
-                if fully_used:
-                    await conn.execute(
-                        """UPDATE account_signatures 
-                           SET used_signatures = $1,
-                               reserved_by = $2,
-                               reserved_until = NOW() + INTERVAL '3 days'
-                           WHERE account_id = $3 AND category_id = $4""",
-                        new_used, user_id, account_id, category_id
-                    )
-                else:
-                    await conn.execute(
-                        """UPDATE account_signatures 
-                           SET used_signatures = $1,
-                               reserved_by = NULL,
-                               reserved_until = NULL
-                           WHERE account_id = $2 AND category_id = $3""",
-                        new_used, account_id, category_id
-                    )
-                logger.info(f"reserve_account: account={account_id}, cat={category_id}, user={user_id}, qty={actual_qty}, new_used={new_used}, fully={fully_used}")
-                return {
-                    "id": row["id"],
-                    "phone": row["phone"],
-                    "password": row["password"],
-                    "totp_secret": row["totp_secret"],
-                    "batch_size": actual_qty,
-                }
+            return await _reserve_one(conn, category_id, user_id, quantity)
         except Exception as e:
             logger.error(f"try_reserve_account error: {e}", exc_info=True)
             return None
 
 
-async def try_reserve_accounts_multi(category_id: int, user_id: int, total_quantity: int) -> list[dict]:
-    single = await try_reserve_account(category_id, user_id, quantity=total_quantity)
-    if single:
-        return [single]
-
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        try:
-            async with conn.transaction():
-                rows = await conn.fetch(
-                    """SELECT a.id, a.phone, a.password, a.totp_secret,
-                              COALESCE(a.priority, 0) as prio,
-                              (COALESCE(s.max_signatures, (SELECT max_signatures FROM categories WHERE id = $1)) - s.used_signatures) as remaining
-                       FROM accounts a
-                       JOIN account_signatures s ON a.id = s.account_id
-                       WHERE s.category_id = $2
-                         AND COALESCE(a.is_enabled, 1) = 1
-                         AND (COALESCE(s.max_signatures, (SELECT max_signatures FROM categories WHERE id = $3)) - s.used_signatures) >= 1
-                         AND (s.reserved_by IS NULL OR s.reserved_by = $4 OR s.reserved_until <= NOW())
-                       ORDER BY CASE WHEN s.reserved_by = $5 THEN 0 ELSE 1 END, prio DESC, remaining ASC, a.created_at ASC
-                       FOR UPDATE OF s""",
-                    category_id, category_id, category_id, user_id, user_id
-                )
-                if not rows:
-                    return []
-
-                allocations = []
-                left = total_quantity
-                for row in rows:
-                    if left <= 0:
-                        break
-                    avail = row["remaining"]
-                    take = min(avail, left)
-                    account_id = row["id"]
-
-                    cat_row = await conn.fetchrow(
-                        "SELECT max_signatures FROM categories WHERE id = $1",
-                        category_id
-                    )
-                    batch_size = cat_row["max_signatures"] if cat_row else 1
-
-                    sig_row = await conn.fetchrow(
-                        "SELECT COALESCE(s.max_signatures, $1) as effective_max, s.used_signatures FROM account_signatures s WHERE s.account_id = $2 AND s.category_id = $3",
-                        batch_size, account_id, category_id
-                    )
-                    effective_max = sig_row["effective_max"] if sig_row else batch_size
-                    current_used = sig_row["used_signatures"] if sig_row else 0
-                    new_used = current_used + take
-                    fully_used = new_used >= effective_max
-
-                    if fully_used:
-                        await conn.execute(
-                            """UPDATE account_signatures 
-                               SET used_signatures = $1,
-                                   reserved_by = $2,
-                                   reserved_until = NOW() + INTERVAL '3 days'
-                               WHERE account_id = $3 AND category_id = $4""",
-                            new_used, user_id, account_id, category_id
-                        )
-                    else:
-                        await conn.execute(
-                            """UPDATE account_signatures 
-                               SET used_signatures = $1,
-                                   reserved_by = NULL,
-                                   reserved_until = NULL
-                               WHERE account_id = $2 AND category_id = $3""",
-                            new_used, account_id, category_id
-                        )
-                    logger.info(f"reserve_multi: account={account_id}, cat={category_id}, user={user_id}, take={take}, new_used={new_used}, fully={fully_used}")
-                    allocations.append({
-                        "id": row["id"],
-                        "phone": row["phone"],
-                        "password": row["password"],
-                        "totp_secret": row["totp_secret"],
-                        "batch_size": take,
-                    })
-                    left -= take
+_RESERVE_WINDOW = 8
+_RESERVE_WINDOW_MAX = 256
+
+_LOCK_CANDIDATES_SQL = """
+    SELECT s.id AS sig_id, a.id, a.phone, a.password, a.totp_secret,
+           COALESCE(s.max_signatures, c.max_signatures) - s.used_signatures AS remaining,
+           CASE WHEN s.reserved_by IS NULL
+                THEN COALESCE(s.max_signatures, c.max_signatures) - s.used_signatures
+                ELSE 0 END AS available_before
+    FROM account_signatures s
+    JOIN accounts a ON a.id = s.account_id
+    JOIN categories c ON c.id = s.category_id
+    WHERE s.category_id = $1
+      AND COALESCE(a.is_enabled, 1) = 1
+      AND COALESCE(s.max_signatures, c.max_signatures) - s.used_signatures >= 1
+      AND (s.reserved_by IS NULL OR s.reserved_by = $2 OR s.reserved_until <= NOW())
+      AND s.id = ANY($3::int[])
+    ORDER BY CASE WHEN s.reserved_by = $2 THEN 0 ELSE 1 END,
+             COALESCE(a.priority, 0) DESC,
+             remaining ASC,
+             a.created_at ASC
+    FOR UPDATE OF s {lock}
+"""
+
+_APPLY_ALLOCATIONS_SQL = """
+    WITH claimed AS (
+        UPDATE account_signatures s
+        SET used_signatures = s.used_signatures + u.take,
+            reserved_by = CASE WHEN s.used_signatures + u.take >= COALESCE(s.max_signatures, c.max_signatures)
+                               THEN u.user_id END,
+            reserved_until = CASE WHEN s.used_signatures + u.take >= COALESCE(s.max_signatures, c.max_signatures)
+                                  THEN NOW() + INTERVAL '3 days' END
+        FROM unnest($1::int[], $2::int[], $3::int[], $4::bigint[]) AS u(sig_id, take, available_before, user_id), categories c
+        WHERE s.id = u.sig_id AND c.id = s.category_id
+        RETURNING s.account_id, s.category_id, s.used_signatures AS new_used,
+                  s.reserved_by IS NOT NULL AS fully_used,
+                  CASE WHEN s.reserved_by IS NULL
+                       THEN COALESCE(s.max_signatures, c.max_signatures) - s.used_signatures
+                       ELSE 0 END - u.available_before AS available_delta
+    ),
+    inventory AS (
+        UPDATE category_inventory i
+        SET available = i.available + d.diff, updated_at = NOW()
+        FROM (SELECT category_id, SUM(available_delta) AS diff FROM claimed GROUP BY category_id) d
+        WHERE i.category_id = d.category_id AND d.diff <> 0
+    )
+    SELECT account_id, new_used, fully_used FROM claimed
+"""
+
+
+async def _lock_candidates(conn, category_id: int, user_id: int, quantity: int, lock: str) -> tuple[list[dict], int]:
+    picked = []
+    seen = []
+    left = quantity
+    window = _RESERVE_WINDOW
+    while left > 0:
+        limit = min(left, window)
+        candidates = await conn.fetch(_MATRIX_SHARED_SQL, category_id, seen, limit, 1, user_id)
+        sig_ids = []
+        covered = 0
+        for c in candidates:
+            if covered >= left:
+                break
+            seen.append(c["id"])
+            if c["sig_id"] is not None:
+                sig_ids.append(c["sig_id"])
+                covered += c["remaining"]
+                continue
+            created = await _create_signature_rows(conn, category_id, [c["id"]], wait=not lock)
+            if created:
+                sig_ids.extend(created.values())
+                covered += c["remaining"]
+        rows = await conn.fetch(_LOCK_CANDIDATES_SQL.format(lock=lock), category_id, user_id, sig_ids)
+        for row in rows:
+            if left <= 0:
+                break
+            take = min(row["remaining"], left)
+            picked.append({**dict(row), "take": take})
+            left -= take
+        if len(candidates) < limit:
+            break
+        window = min(window * 2, _RESERVE_WINDOW_MAX)
+    return picked, left
 
-                if left > 0:
-                    raise Exception("Not enough accounts")
 
-                return allocations
-        except Exception as e:
-            logger.error(f"try_reserve_accounts_multi error: {e}", exc_info=True)
-            return []
+class _ShortOfStock(Exception):
+    pass
 
 
-async def try_reserve_account_exclusive(category_id: int, user_id: int) -> dict | None:
-    pool = await get_pool()
-    async with pool.acquire() as conn:
+async def _reserve_multi(conn, category_id: int, user_id: int, total_quantity: int) -> list[dict]:
+    for lock in ("SKIP LOCKED", ""):
         try:
             async with conn.transaction():
-                row = await conn.fetchrow(
-                    """SELECT a.id, a.phone, a.password, a.totp_secret,
-                              COALESCE(a.priority, 0) as prio,
-                              (COALESCE(s.max_signatures, (SELECT max_signatures FROM categories WHERE id = $1)) - s.used_signatures) as remaining
-                       FROM accounts a
-                       JOIN account_signatures s ON a.id = s.account_id
-                       WHERE s.category_id = $2
-                         AND COALESCE(a.is_enabled, 1) = 1
-                         AND s.used_signatures = 0
-                         AND (s.reserved_by IS NULL OR s.reserved_until <= NOW())
-                         AND NOT EXISTS (
-                             SELECT 1 FROM orders o
-                             WHERE o.account_id = a.id
-                               AND o.category_id = $3
-                               AND o.status IN ('active', 'pending_review')
-                         )
-                       ORDER BY prio DESC, a.created_at ASC
-                       LIMIT 1
-                       FOR UPDATE OF s""",
-                    category_id, category_id, category_id
-                )
-                if not row:
-                    return None
-                account_id = row["id"]
-                cat_row = await conn.fetchrow(
-                    "SELECT max_signatures FROM categories WHERE id = $1",
-                    category_id
-                )
-                batch_size = cat_row["max_signatures"] if cat_row else 1
-                sig_row = await conn.fetchrow(
-                    "SELECT COALESCE(s.max_signatures, $1) as effective_max FROM account_signatures s WHERE s.account_id = $2 AND s.category_id = $3",
-                    batch_size, account_id, category_id
-                )
-                effective_max = sig_row["effective_max"] if sig_row else batch_size
-                await conn.execute(
-                    """UPDATE account_signatures 
-                       SET used_signatures = $1,
-                           reserved_by = $2,
-                           reserved_until = NOW() + INTERVAL '3 days'
-                       WHERE account_id = $3 AND category_id = $4""",
-                    effective_max, user_id, account_id, category_id
+                if not lock:
+                    await _lock_waiting_reservations(conn, category_id)
+                picked, left = await _lock_candidates(conn, category_id, user_id, total_quantity, lock)
+                if left > 0:
+                    raise _ShortOfStock(left)
+                rows = await conn.fetch(
+                    _APPLY_ALLOCATIONS_SQL,
+                    [p["sig_id"] for p in picked], [p["take"] for p in picked],
+                    [p["available_before"] for p in picked], [user_id] * len(picked)
                 )
-                logger.info(f"BB_RESERVE: account={account_id}, phone={row['phone']}, cat={category_id}, user={user_id}, used_set={effective_max}")
-                return {
-                    "id": row["id"],
-                    "phone": row["phone"],
-                    "password": row["password"],
-                    "totp_secret": row["totp_secret"],
-                    "batch_size": effective_max,
-                }
-        except Exception as e:
-            logger.error(f"try_reserve_account_exclusive error: {e}", exc_info=True)
-            return None
+                return _applied_allocations(category_id, user_id, picked, rows)
+        except _ShortOfStock as e:
+            left = e.args[0]
+    logger.info(f"reserve_multi: cat={category_id}, user={user_id}, qty={total_quantity} — not enough stock, short by {left}")
+    return []
+
+
+def _applied_allocations(category_id: int, user_id: int, picked: list[dict], rows) -> list[dict]:
+    applied = {r["account_id"]: r for r in rows}
+    allocations = []
+    for p in picked:
+        r = applied[p["id"]]
+        logger.info(f"reserve_multi: account={p['id']}, cat={category_id}, user={user_id}, take={p['take']}, new_used={r['new_used']}, fully={r['fully_used']}")
+        allocations.append({
+            "id": p["id"],
+            "phone": p["phone"],
+            "password": p["password"],
+            "totp_secret": p["totp_secret"],
+            "batch_size": p["take"],
+        })
+    return allocations
+
+
+async def _reserve_allocations(conn, category_id: int, user_id: int, total_quantity: int) -> list[dict]:
+    single = await _reserve_one(conn, category_id, user_id, quantity=total_quantity, wait=False)
+    if single:
+        return [single]
+    return await _reserve_multi(conn, category_id, user_id, total_quantity)
+
+
+_RESERVE_EXCLUSIVE_SQL = """
+    WITH cat AS (
+        SELECT max_signatures FROM categories WHERE id = $1
+    ),
+    candidate AS (
+        SELECT s.id AS sig_id, a.id, a.phone, a.password, a.totp_secret,
+               COALESCE(s.max_signatures, cat.max_signatures) AS effective_max,
+               CASE WHEN s.reserved_by IS NULL
+                    THEN COALESCE(s.max_signatures, cat.max_signatures) - s.used_signatures
+                    ELSE 0 END AS available_before
+        FROM account_signatures s
+        JOIN accounts a ON a.id = s.account_id
+        CROSS JOIN cat
+        WHERE s.category_id = $1
+          AND COALESCE(a.is_enabled, 1) = 1
+          AND s.used_signatures = 0
+          AND (s.reserved_by IS NULL OR s.reserved_until <= NOW())
+          AND s.id = ANY($3::int[])
+          AND NOT EXISTS (
+              SELECT 1 FROM orders o
+              WHERE o.account_id = a.id
+                AND o.category_id = $1
+                AND o.status IN ('active', 'pending_review')
+          )
+        ORDER BY COALESCE(a.priority, 0) DESC, a.created_at ASC
+        LIMIT 1
+        FOR UPDATE OF s {lock}
+    ),
+    claimed AS (
+        UPDATE account_signatures s
+        SET used_signatures = candidate.effective_max,
+            reserved_by = $2,
+            reserved_until = NOW() + INTERVAL '3 days'
+        FROM candidate
+        WHERE s.id = candidate.sig_id
+        RETURNING candidate.id, candidate.phone, candidate.password, candidate.totp_secret,
+                  candidate.effective_max AS batch_size, candidate.available_before
+    ),
+    inventory AS (
+        UPDATE category_inventory i
+        SET available = i.available - claimed.available_before, updated_at = NOW()
+        FROM claimed
+        WHERE i.category_id = $1 AND claimed.available_before <> 0
+    )
+    SELECT * FROM claimed
+"""
+
+
+async def _reserve_exclusive(conn, category_id: int, user_id: int) -> dict | None:
+    args = (category_id, user_id)
+    async with conn.transaction():
+        row = await _claim_first(conn, _RESERVE_EXCLUSIVE_SQL, args, _MATRIX_EXCLUSIVE_SQL, (), category_id, "SKIP LOCKED")
+    if not row:
+        async with conn.transaction():
+            await _lock_waiting_reservations(conn, category_id)
+            row = await _claim_first(conn, _RESERVE_EXCLUSIVE_SQL, args, _MATRIX_EXCLUSIVE_SQL, (), category_id, "")
+    if not row:
+        return None
+    logger.info(f"BB_RESERVE: account={row['id']}, phone={row['phone']}, cat={category_id}, user={user_id}, used_set={row['batch_size']}")
+    return {
+        "id": row["id"],
+        "phone": row["phone"],
+        "password": row["password"],
+        "totp_secret": row["totp_secret"],
+        "batch_size": row["batch_size"],
+    }
 
 
 async def try_issue_account(category_id: int) -> dict | None:
@@ -561,29 +809,32 @@ async def try_issue_account(category_id: int) -> dict | None:
     async with pool.acquire() as conn:
         try:
             async with conn.transaction():
+                await _lock_waiting_reservations(conn, category_id)
                 row = await conn.fetchrow(
                     """SELECT a.id, a.phone, a.password, a.totp_secret,
                               COALESCE(a.priority, 0) as prio,
                               (SELECT COALESCE(SUM(s2.used_signatures), 0) FROM account_signatures s2 WHERE s2.account_id = a.id AND s2.category_id != $1) as other_used
                        FROM accounts a
-                       JOIN account_signatures s ON a.id = s.account_id
+                       JOIN signature_matrix s ON a.id = s.account_id
                        WHERE s.category_id = $2
-                         AND s.used_signatures < COALESCE(s.max_signatures, (SELECT max_signatures FROM categories WHERE id = $3))
+                         AND s.used_signatures < s.effective_max
                          AND (s.reserved_by IS NULL OR s.reserved_until <= NOW())
                        ORDER BY prio DESC, other_used DESC, a.created_at ASC
-                       LIMIT 1
-                       FOR UPDATE OF s""",
-                    category_id, category_id, category_id
+                       LIMIT 1""",
+                    category_id, category_id
                 )
                 if not row:
                     return None
                 account_id = row["id"]
-                await conn.execute(
-                    """UPDATE account_signatures 
-                       SET used_signatures = used_signatures + 1
-                       WHERE account_id = $1 AND category_id = $2""",
+                await ensure_signature_rows(conn, [account_id], [category_id])
+                issued = await update_signatures(
+                    conn,
+                    "used_signatures = s.used_signatures + 1",
+                    "s.account_id = $1 AND s.category_id = $2 AND s.used_signatures < COALESCE(s.max_signatures, c.max_signatures)",
                     account_id, category_id
                 )
+                if not issued:
+                    return None
                 return {
                     "id": row["id"],
                     "phone": row["phone"],
@@ -599,17 +850,10 @@ async def get_available_count(category_id: int) -> int:
     pool = await get_pool()
     async with pool.acquire() as conn:
         val = await conn.fetchval(
-            """SELECT COALESCE(SUM(COALESCE(s.max_signatures, c.max_signatures) - s.used_signatures), 0)
-               FROM account_signatures s
-               JOIN categories c ON s.category_id = c.id
-               JOIN accounts a ON s.account_id = a.id
-               WHERE s.category_id = $1
-                 AND COALESCE(a.is_enabled, 1) = 1
-                 AND s.used_signatures < COALESCE(s.max_signatures, c.max_signatures)
-                 AND (s.reserved_by IS NULL OR s.reserved_until <= NOW())""",
+            "SELECT GREATEST(available, 0) FROM category_inventory WHERE category_id = $1",
             category_id
         )
-        return val
+        return val or 0
 
 
 async def get_total_accounts_count() -> int:
@@ -618,52 +862,30 @@ async def get_total_accounts_count() -> int:
         return await conn.fetchval("SELECT COUNT(*) FROM accounts")
 
 
-async def sync_account_signatures(account_id: int):
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        categories = await conn.fetch("SELECT id FROM categories")
-        for cat in categories:
-            await conn.execute(
-                "INSERT INTO account_signatures (account_id, category_id, used_signatures) VALUES ($1, $2, 0) ON CONFLICT DO NOTHING",
-                account_id, cat["id"]
-            )
-
-
-async def sync_all_signatures():
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        accounts = await conn.fetch("SELECT id FROM accounts")
-        categories = await conn.fetch("SELECT id FROM categories")
-        for acc in accounts:
-            for cat in categories:
-                await conn.execute(
-                    "INSERT INTO account_signatures (account_id, category_id, used_signatures) VALUES ($1, $2, 0) ON CONFLICT DO NOTHING",
-                    acc["id"], cat["id"]
-                )
-
-
 async def update_account_signature_max(account_id: int, category_id: int, new_max: int):
     pool = await get_pool()
     async with pool.acquire() as conn:
-        row = await conn.fetchrow(
-            "SELECT used_signatures FROM account_signatures WHERE account_id = $1 AND category_id = $2",
-            account_id, category_id
-        )
-        current_used = row["used_signatures"] if row else 0
-        clamped_used = min(current_used, new_max)
-        await conn.execute(
-            "UPDATE account_signatures SET max_signatures = $1, used_signatures = $2, reserved_by = NULL, reserved_until = NULL WHERE account_id = $3 AND category_id = $4",
-            new_max, clamped_used, account_id, category_id
-        )
+        async with conn.transaction():
+            await ensure_signature_rows(conn, [account_id], [category_id])
+            await update_signatures(
+                conn,
+                "max_signatures = $1, used_signatures = LEAST(s.used_signatures, $1), reserved_by = NULL, reserved_until = NULL",
+                "s.account_id = $2 AND s.category_id = $3",
+                new_max, account_id, category_id
+            )
 
 
 async def update_account_used_signatures(account_id: int, category_id: int, new_used: int):
     pool = await get_pool()
     async with pool.acquire() as conn:
-        await conn.execute(
-            "UPDATE account_signatures SET used_signatures = $1, reserved_by = NULL, reserved_until = NULL WHERE account_id = $2 AND category_id = $3",
-            new_used, account_id, category_id
-        )
+        async with conn.transaction():
+            await ensure_signature_rows(conn, [account_id], [category_id])
+            await update_signatures(
+                conn,
+                "used_signatures = $1, reserved_by = NULL, reserved_until = NULL",
+                "s.account_id = $2 AND s.category_id = $3",
+                new_used, account_id, category_id
+            )
 
 
 async def set_account_priority(account_id: int, priority: int):
@@ -679,7 +901,7 @@ async def toggle_account_enabled(account_id: int) -> bool:
         if not row:
             return False
         new_val = 0 if row["is_enabled"] else 1
-        await conn.execute("UPDATE accounts SET is_enabled = $1 WHERE id = $2", new_val, account_id)
+        await _set_accounts_enabled(conn, bool(new_val), "id = $1", account_id)
         return bool(new_val)
 
 
@@ -696,17 +918,23 @@ async def set_mass_priority_by_operator(operator_telegram_id: int, priority: int
 async def bulk_update_all_signature_max(category_id: int, new_max: int):
     pool = await get_pool()
     async with pool.acquire() as conn:
-        await conn.execute(
-            "UPDATE account_signatures SET max_signatures = $1 WHERE category_id = $2",
-            new_max, category_id
-        )
+        async with conn.transaction():
+            await ensure_signature_rows(conn, None, [category_id])
+            await update_signatures(
+                conn,
+                "max_signatures = $1",
+                "s.category_id = $2",
+                new_max, category_id
+            )
 
 
 async def reset_account_availability(account_id: int):
     pool = await get_pool()
     async with pool.acquire() as conn:
-        await conn.execute(
-            "UPDATE account_signatures SET used_signatures = 0, reserved_by = NULL, reserved_until = NULL WHERE account_id = $1",
+        await update_signatures(
+            conn,
+            "used_signatures = 0, reserved_by = NULL, reserved_until = NULL",
+            "s.account_id = $1",
             account_id
         )
 
@@ -714,8 +942,10 @@ async def reset_account_availability(account_id: int):
 async def reset_all_accounts_availability():
     pool = await get_pool()
     async with pool.acquire() as conn:
-        await conn.execute(
-            "UPDATE account_signatures SET used_signatures = 0, reserved_by = NULL, reserved_until = NULL"
+        await update_signatures(
+            conn,
+            "used_signatures = 0, reserved_by = NULL, reserved_until = NULL",
+            "TRUE"
         )
 
 
@@ -782,7 +1012,7 @@ async def get_accounts_availability() -> list[dict]:
                       s.used_signatures,
                       COALESCE(s.max_signatures, c.max_signatures) as effective_max
                FROM accounts a
-               JOIN account_signatures s ON a.id = s.account_id
+               JOIN signature_matrix s ON a.id = s.account_id
                JOIN categories c ON s.category_id = c.id
                ORDER BY a.phone, c.name"""
         )
@@ -817,7 +1047,7 @@ async def get_accounts_availability_all() -> list[dict]:
                                 WHERE o.account_id = a.id AND o.category_id = c.id
                                 AND o.status != 'rejected'), 0) as real_revenue
                FROM accounts a
-               JOIN account_signatures s ON a.id = s.account_id
+               JOIN signature_matrix s ON a.id = s.account_id
                JOIN categories c ON s.category_id = c.id
                ORDER BY a.phone, c.name"""
         )
@@ -839,7 +1069,7 @@ async def get_accounts_availability_by_date(date_str: str) -> list[dict]:
                                 WHERE o.account_id = a.id AND o.category_id = c.id
                                 AND o.status != 'rejected'), 0) as real_revenue
                FROM accounts a
-               JOIN account_signatures s ON a.id = s.account_id
+               JOIN signature_matrix s ON a.id = s.account_id
                JOIN categories c ON s.category_id = c.id
                WHERE (a.created_at AT TIME ZONE 'UTC' AT TIME ZONE 'Europe/Moscow')::date = $1
                ORDER BY a.phone, c.name""",
@@ -862,7 +1092,7 @@ async def get_stats_by_date(date_str: str) -> list[dict]:
                FROM orders o
                JOIN accounts a ON o.account_id = a.id
                JOIN categories c ON o.category_id = c.id
-               JOIN account_signatures s ON s.account_id = a.id AND s.category_id = c.id
+               JOIN signature_matrix s ON s.account_id = a.id AND s.category_id = c.id
                WHERE (o.created_at AT TIME ZONE 'UTC' AT TIME ZONE 'Europe/Moscow')::date = $1
                  AND o.status != 'rejected'
                GROUP BY a.id, a.phone, c.name, s.max_signatures, c.max_signatures, s.used_signatures
@@ -900,7 +1130,7 @@ async def get_sales_stats_by_period(date_from: str = None, date_to: str = None)
                 FROM orders o
                 JOIN accounts a ON o.account_id = a.id
                 JOIN categories c ON o.category_id = c.id
-                JOIN account_signatures s ON s.account_id = a.id AND s.category_id = c.id
+                JOIN signature_matrix s ON s.account_id = a.id AND s.category_id = c.id
                 WHERE {where}
                 GROUP BY a.id, a.phone, a.password, c.name, c.price, s.max_signatures, c.max_signatures, s.used_signatures
                 ORDER BY a.phone, c.name""",
@@ -909,14 +1139,41 @@ async def get_sales_stats_by_period(date_from: str = None, date_to: str = None)
         return [dict(r) for r in rows]
 
 
-async def release_expired_reservations():
+RELEASE_BATCH_SIZE = 500
+
+
+async def release_expired_reservations(batch_size: int = RELEASE_BATCH_SIZE) -> int:
     pool = await get_pool()
     async with pool.acquire() as conn:
-        await conn.execute(
-            """UPDATE account_signatures 
-               SET reserved_by = NULL, reserved_until = NULL
-               WHERE reserved_until IS NOT NULL AND reserved_until <= NOW()"""
+        released = 0
+        while True:
+            count = await update_signatures(
+                conn,
+                "reserved_by = NULL, reserved_until = NULL",
+                "s.reserved_until IS NOT NULL AND s.reserved_until <= NOW()",
+                order_sql="s.reserved_until", limit=batch_size
+            )
+            released += count
+            if count < batch_size:
+                return released
+
+
+async def get_reservation_deadlines(horizon: float, limit: int) -> list[float]:
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(
+            """SELECT EXTRACT(EPOCH FROM reserved_until - NOW())::float8 AS delay
+               FROM (
+                   SELECT DISTINCT reserved_until FROM account_signatures
+                   WHERE reserved_until IS NOT NULL
+                     AND reserved_until <= NOW() + make_interval(secs => $1)
+                   ORDER BY reserved_until
+                   LIMIT $2
+               ) due
+               ORDER BY delay""",
+            horizon, limit
         )
+        return [r["delay"] for r in rows]
 
 
 async def release_account_reservation(account_id: int | None):
@@ -924,10 +1181,10 @@ async def release_account_reservation(account_id: int | None):
         return
     pool = await get_pool()
     async with pool.acquire() as conn:
-        await conn.execute(
-            """UPDATE account_signatures 
-               SET reserved_by = NULL, reserved_until = NULL
-               WHERE account_id = $1""",
+        await update_signatures(
+            conn,
+            "reserved_by = NULL, reserved_until = NULL",
+            "s.account_id = $1",
             account_id
         )
 
@@ -937,12 +1194,10 @@ async def restore_account_signatures(account_id: int, category_id: int, count: i
         return
     pool = await get_pool()
     async with pool.acquire() as conn:
-        await conn.execute(
-            """UPDATE account_signatures 
-               SET used_signatures = GREATEST(used_signatures - $1, 0),
-                   reserved_by = NULL,
-                   reserved_until = NULL
-               WHERE account_id = $2 AND category_id = $3""",
+        await update_signatures(
+            conn,
+            "used_signatures = GREATEST(s.used_signatures - $1, 0), reserved_by = NULL, reserved_until = NULL",
+            "s.account_id = $2 AND s.category_id = $3",
             count, account_id, category_id
         )
 
@@ -974,7 +1229,7 @@ async def get_accounts_availability_by_phones(phones: list[str]) -> list[dict]:
                                 WHERE o.account_id = a.id AND o.category_id = c.id
                                 AND o.status != 'rejected'), 0) as real_revenue
                FROM accounts a
-               JOIN account_signatures s ON a.id = s.account_id
+               JOIN signature_matrix s ON a.id = s.account_id
                JOIN categories c ON s.category_id = c.id
                WHERE a.phone = ANY($1)
                ORDER BY a.phone, c.name""",
@@ -1019,7 +1274,7 @@ async def get_availability_by_operator(operator_telegram_id: int) -> list[dict]:
                       s.used_signatures,
                       COALESCE(s.max_signatures, c.max_signatures) as effective_max
                FROM accounts a
-               JOIN account_signatures s ON a.id = s.account_id
+               JOIN signature_matrix s ON a.id = s.account_id
                JOIN categories c ON s.category_id = c.id
                WHERE a.operator_telegram_id = $1
                ORDER BY a.phone, c.name""",
@@ -1056,7 +1311,7 @@ async def get_sales_by_operator(operator_telegram_id: int, date_from: str = None
                 FROM orders o
                 JOIN accounts a ON o.account_id = a.id
                 JOIN categories c ON o.category_id = c.id
-                JOIN account_signatures s ON s.account_id = a.id AND s.category_id = c.id
+                JOIN signature_matrix s ON s.account_id = a.id AND s.category_id = c.id
                 WHERE {where}
                 GROUP BY a.id, a.phone, a.password, c.name, c.price, s.max_signatures, c.max_signatures, s.used_signatures
                 ORDER BY a.phone, c.name""",
@@ -1128,14 +1383,11 @@ async def get_availability_summary() -> list[dict]:
     async with pool.acquire() as conn:
         rows = await conn.fetch(
             """SELECT c.name as category_name,
-                      COUNT(DISTINCT a.id) as accounts_count,
-                      SUM(COALESCE(s.max_signatures, c.max_signatures) - s.used_signatures) as remaining_signatures,
-                      SUM(COALESCE(s.max_signatures, c.max_signatures)) as total_signatures
-               FROM accounts a
-               JOIN account_signatures s ON a.id = s.account_id
-               JOIN categories c ON s.category_id = c.id
-               WHERE a.is_enabled = 1
-               GROUP BY c.id, c.name
+                      i.accounts_count,
+                      GREATEST(i.available, 0) as remaining_signatures
+               FROM category_inventory i
+               JOIN categories c ON i.category_id = c.id
+               WHERE i.accounts_count > 0
                ORDER BY c.name"""
         )
         return [dict(r) for r in rows]
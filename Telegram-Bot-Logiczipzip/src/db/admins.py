@@ -1,21 +1,26 @@
 from src.db.database import get_pool
+from src.db.cache import publish_invalidation
+from src.db.staff import get_staff, get_route
 
 
 async def get_admin_ids() -> list[int]:
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        rows = await conn.fetch("SELECT telegram_id FROM admins")
-        return [row["telegram_id"] for row in rows]
+    return await get_route("admins")
+
+
+async def get_notified_admin_ids() -> list[int]:
+    return await get_route("notified_admins")
 
 
 async def add_admin(telegram_id: int) -> bool:
     pool = await get_pool()
     async with pool.acquire() as conn:
         try:
-            result = await conn.execute(
-                "INSERT INTO admins (telegram_id) VALUES ($1) ON CONFLICT (telegram_id) DO NOTHING",
-                telegram_id
-            )
+            async with conn.transaction():
+                result = await conn.execute(
+                    "INSERT INTO admins (telegram_id) VALUES ($1) ON CONFLICT (telegram_id) DO NOTHING",
+                    telegram_id
+                )
+                await publish_invalidation(conn, "admins")
             return result.split()[-1] != "0"
         except Exception:
             return False
@@ -24,31 +29,24 @@ async def add_admin(telegram_id: int) -> bool:
 async def remove_admin(telegram_id: int) -> bool:
     pool = await get_pool()
     async with pool.acquire() as conn:
-        result = await conn.execute(
-            "DELETE FROM admins WHERE telegram_id = $1",
-            telegram_id
-        )
+        async with conn.transaction():
+            result = await conn.execute(
+                "DELETE FROM admins WHERE telegram_id = $1",
+                telegram_id
+            )
+            await publish_invalidation(conn, "admins")
         return int(result.split()[-1]) > 0
 
 
 async def is_admin(telegram_id: int) -> bool:
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        row = await conn.fetchrow(
-            "SELECT 1 FROM admins WHERE telegram_id = $1",
-            telegram_id
-        )
-        return row is not None
+    staff = await get_staff()
+    return telegram_id in staff["admins"]
 
 
 async def is_owner(telegram_id: int) -> bool:
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        row = await conn.fetchrow(
-            "SELECT 1 FROM admins WHERE telegram_id = $1 AND role = 'owner'",
-            telegram_id
-        )
-        return row is not None
+    staff = await get_staff()
+    admin = staff["admins"].get(telegram_id)
+    return admin is not None and admin["role"] == "owner"
 
 
 async def get_all_admins() -> list[dict]:
@@ -0,0 +1,91 @@
+from src.db.database import get_pool
+
+
+async def create_broadcast(text: str, created_by: int, status_chat_id: int, status_message_id: int) -> dict:
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        row = await conn.fetchrow(
+            """INSERT INTO broadcasts (text, created_by, status_chat_id, status_message_id, total, heartbeat_at)
+               VALUES ($1, $2, $3, $4, (SELECT COUNT(*) FROM users WHERE is_active = 1), NOW())
+               RETURNING *""",
+            text, created_by, status_chat_id, status_message_id
+        )
+        return dict(row)
+
+
+async def count_broadcast_recipients() -> int:
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        return await conn.fetchval("SELECT COUNT(*) FROM users WHERE is_active = 1")
+
+
+async def claim_stale_broadcasts(stale_seconds: int) -> list[dict]:
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(
+            """UPDATE broadcasts SET heartbeat_at = NOW()
+               WHERE status = 'running'
+                 AND (heartbeat_at IS NULL OR heartbeat_at < NOW() - make_interval(secs => $1))
+               RETURNING *""",
+            stale_seconds
+        )
+        return [dict(r) for r in rows]
+
+
+async def touch_broadcast(broadcast_id: int):
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        await conn.execute("UPDATE broadcasts SET heartbeat_at = NOW() WHERE id = $1", broadcast_id)
+
+
+async def get_recipient_page(broadcast_id: int, after_id: int, limit: int) -> list[dict]:
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(
+            """SELECT u.id, u.telegram_id FROM users u
+               WHERE u.is_active = 1
+                 AND u.id > $2
+                 AND NOT EXISTS (
+                     SELECT 1 FROM broadcast_deliveries d
+                     WHERE d.broadcast_id = $1 AND d.user_id = u.telegram_id
+                 )
+               ORDER BY u.id
+               LIMIT $3""",
+            broadcast_id, after_id, limit
+        )
+        return [dict(r) for r in rows]
+
+
+async def record_deliveries(broadcast_id: int, results: list[tuple[int, str, str | None]], cursor_id: int) -> dict:
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        row = await conn.fetchrow(
+            """WITH ins AS (
+                   INSERT INTO broadcast_deliveries (broadcast_id, user_id, status, error)
+                   SELECT $1, u.user_id, u.status, u.error
+                   FROM unnest($2::bigint[], $3::text[], $4::text[]) AS u(user_id, status, error)
+                   ON CONFLICT (broadcast_id, user_id) DO NOTHING
+                   RETURNING status
+               )
+               UPDATE broadcasts SET
+                   sent = sent + (SELECT COUNT(*) FROM ins WHERE status = 'sent'),
+                   failed = failed + (SELECT COUNT(*) FROM ins WHERE status <> 'sent'),
+                   cursor_id = GREATEST(cursor_id, $5),
+                   heartbeat_at = NOW()
+               WHERE id = $1
+               RETURNING *""",
+            broadcast_id,
+            [r[0] for r in results], [r[1] for r in results], [r[2] for r in results],
+            cursor_id
+        )
+        return dict(row)
+
+
+async def finish_broadcast(broadcast_id: int) -> dict:
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        row = await conn.fetchrow(
+            "UPDATE broadcasts SET status = 'done', finished_at = NOW() WHERE id = $1 RETURNING *",
+            broadcast_id
+        )
+        return dict(row)
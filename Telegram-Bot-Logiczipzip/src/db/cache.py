@@ -0,0 +1,118 @@
+import logging
+from typing import Awaitable, Callable, Generic, TypeVar
+
+from src.db.database import get_pool
+from src.db.listener import subscribe, on_reset, is_listening, notify
+
+logger = logging.getLogger(__name__)
+
+CACHE_CHANNEL = "cache_invalidate"
+
+T = TypeVar("T")
+
+
+class TableCache(Generic[T]):
+    def __init__(self, name: str, loader: Callable[[], Awaitable[T]], tables: tuple[str, ...] = ()):
+        self.name = name
+        self.loader = loader
+        self.tables = tables or (name,)
+        self.value: T | None = None
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self) -> T:
+        if self.value is not None and is_listening():
+            self.hits += 1
+            return self.value
+        self.misses += 1
+        version = self.version
+        value = await self.loader()
+        if version == self.version and is_listening():
+            self.value = value
+        return value
+
+    def invalidate(self):
+        self.version += 1
+        self.value = None
+
+
+async def _load_settings() -> dict[str, str]:
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch("SELECT key, value FROM settings")
+        return {r["key"]: r["value"] for r in rows}
+
+
+async def _load_categories() -> dict[int, dict]:
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch("SELECT * FROM categories ORDER BY id")
+        return {r["id"]: dict(r) for r in rows}
+
+
+async def _load_required_channels() -> list[dict]:
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch("SELECT * FROM required_channels ORDER BY id ASC")
+        return [dict(r) for r in rows]
+
+
+async def _load_reputation_links() -> list[dict]:
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch("SELECT * FROM reputation_links ORDER BY sort_order ASC, id ASC")
+        return [dict(r) for r in rows]
+
+
+async def _load_staff() -> dict[str, dict[int, dict]]:
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        admins = await conn.fetch("SELECT telegram_id, role FROM admins ORDER BY added_at ASC")
+        operators = await conn.fetch("SELECT telegram_id, username, role, notifications_enabled FROM operators ORDER BY added_at DESC")
+        return {
+            "admins": {r["telegram_id"]: dict(r) for r in admins},
+            "operators": {r["telegram_id"]: dict(r) for r in operators},
+        }
+
+
+settings_cache: TableCache[dict[str, str]] = TableCache("settings", _load_settings)
+categories_cache: TableCache[dict[int, dict]] = TableCache("categories", _load_categories)
+channels_cache: TableCache[list[dict]] = TableCache("required_channels", _load_required_channels)
+reputation_cache: TableCache[list[dict]] = TableCache("reputation_links", _load_reputation_links)
+staff_cache: TableCache[dict[str, dict[int, dict]]] = TableCache("staff", _load_staff, ("admins", "operators"))
+
+_caches = {
+    table: c
+    for c in (settings_cache, categories_cache, channels_cache, reputation_cache, staff_cache)
+    for table in c.tables
+}
+
+
+def invalidate(name: str):
+    cache = _caches.get(name)
+    if cache is None:
+        logger.warning(f"Unknown cache invalidation: {name}")
+        return
+    cache.invalidate()
+
+
+def invalidate_all():
+    for cache in set(_caches.values()):
+        cache.invalidate()
+
+
+async def publish_invalidation(conn, name: str):
+    await notify(conn, CACHE_CHANNEL, name)
+    invalidate(name)
+
+
+def get_cache_stats() -> dict[str, dict]:
+    return {
+        c.name: {"hits": c.hits, "misses": c.misses, "cached": c.value is not None}
+        for c in set(_caches.values())
+    }
+
+
+subscribe(CACHE_CHANNEL, invalidate)
+on_reset(invalidate_all)
@@ -1,30 +1,35 @@
 from src.db.database import get_pool
+from src.db.cache import channels_cache, publish_invalidation
 
 
 async def get_required_channels() -> list[dict]:
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        rows = await conn.fetch("SELECT * FROM required_channels ORDER BY id ASC")
-        return [dict(r) for r in rows]
+    channels = await channels_cache.get()
+    return [dict(c) for c in channels]
 
 
 async def add_required_channel(channel_id: int, title: str, url: str) -> int:
     pool = await get_pool()
     async with pool.acquire() as conn:
-        return await conn.fetchval(
-            "INSERT INTO required_channels (channel_id, title, url) VALUES ($1, $2, $3) RETURNING id",
-            channel_id, title, url
-        )
+        async with conn.transaction():
+            rec_id = await conn.fetchval(
+                "INSERT INTO required_channels (channel_id, title, url) VALUES ($1, $2, $3) RETURNING id",
+                channel_id, title, url
+            )
+            await publish_invalidation(conn, "required_channels")
+        return rec_id
 
 
 async def delete_required_channel(rec_id: int):
     pool = await get_pool()
     async with pool.acquire() as conn:
-        await conn.execute("DELETE FROM required_channels WHERE id = $1", rec_id)
+        async with conn.transaction():
+            await conn.execute("DELETE FROM required_channels WHERE id = $1", rec_id)
+            await publish_invalidation(conn, "required_channels")
 
 
 async def get_required_channel(rec_id: int) -> dict | None:
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        row = await conn.fetchrow("SELECT * FROM required_channels WHERE id = $1", rec_id)
-        return dict(row) if row else None
+    channels = await channels_cache.get()
+    for c in channels:
+        if c["id"] == rec_id:
+            return dict(c)
+    return None
@@ -1,10 +1,15 @@
 import os
 import asyncpg
 
+from src.config import DB_POOL_MAX_SIZE
+from src.db.uow import ConnectionSource, current_unit_of_work
+
 DATABASE_URL = os.getenv("DATABASE_URL", "")
 
 _pool: asyncpg.Pool | None = None
 
+_DDL_LOCK_KEY = "init_db_ddl"
+
 DEFAULT_CATEGORIES = [
     ("МТС'Физ", 5.00, 2),
     ("МТС'Есим", 3.00, 2),
@@ -16,14 +21,17 @@ DEFAULT_CATEGORIES = [
 ]
 
 
-async def get_pool() -> asyncpg.Pool:
+async def get_pool() -> ConnectionSource:
     global _pool
+    uow = current_unit_of_work()
+    if uow is not None:
+        return uow
     if _pool is not None:
         return _pool
     _pool = await asyncpg.create_pool(
         DATABASE_URL,
         min_size=5,
-        max_size=40,
+        max_size=DB_POOL_MAX_SIZE,
         command_timeout=30,
     )
     return _pool
@@ -247,6 +255,7 @@ async def init_db():
             CREATE INDEX IF NOT EXISTS idx_orders_expiry ON orders(expires_at) WHERE status IN ('active', 'pending_review') AND expires_at IS NOT NULL;
             CREATE INDEX IF NOT EXISTS idx_accounts_enabled ON accounts(id) WHERE is_enabled = 1;
             CREATE INDEX IF NOT EXISTS idx_signatures_available ON account_signatures(category_id, account_id) WHERE reserved_by IS NULL;
+            CREATE INDEX IF NOT EXISTS idx_signatures_reserved_until ON account_signatures(reserved_until) WHERE reserved_until IS NOT NULL;
             CREATE INDEX IF NOT EXISTS idx_deposits_user ON deposits(user_id);
             CREATE INDEX IF NOT EXISTS idx_order_documents_order_id ON order_documents(order_id);
             CREATE INDEX IF NOT EXISTS idx_order_documents_user_id ON order_documents(user_id);
@@ -280,8 +289,162 @@ async def init_db():
             CREATE INDEX IF NOT EXISTS idx_referral_earnings_referral ON referral_earnings(referral_id);
             CREATE INDEX IF NOT EXISTS idx_users_referred_by ON users(referred_by);
             CREATE UNIQUE INDEX IF NOT EXISTS idx_referral_earnings_order ON referral_earnings(order_id);
+            CREATE INDEX IF NOT EXISTS idx_users_active ON users(id) WHERE is_active = 1;
+        """)
+
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS category_inventory (
+                category_id INTEGER PRIMARY KEY REFERENCES categories(id) ON DELETE CASCADE,
+                available INTEGER NOT NULL DEFAULT 0,
+                accounts_count INTEGER NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP DEFAULT NOW()
+            )
+        """)
+
+        async with conn.transaction():
+            await conn.execute("SELECT pg_advisory_xact_lock(hashtext($1))", _DDL_LOCK_KEY)
+            await conn.execute("""
+                CREATE OR REPLACE FUNCTION notify_inventory_increase() RETURNS trigger AS $$
+                BEGIN
+                    IF NEW.available > 0 AND (TG_OP = 'INSERT' OR NEW.available > OLD.available) THEN
+                        PERFORM pg_notify('inventory_changed', NEW.category_id::text);
+                    END IF;
+                    RETURN NEW;
+                END
+                $$ LANGUAGE plpgsql
+            """)
+            trigger_exists = await conn.fetchval(
+                "SELECT 1 FROM pg_trigger WHERE tgname = 'trg_inventory_increase'"
+            )
+            if not trigger_exists:
+                await conn.execute("""
+                    CREATE TRIGGER trg_inventory_increase
+                    AFTER INSERT OR UPDATE OF available ON category_inventory
+                    FOR EACH ROW EXECUTE FUNCTION notify_inventory_increase()
+                """)
+
+        async with conn.transaction():
+            await conn.execute("SELECT pg_advisory_xact_lock(hashtext($1))", _DDL_LOCK_KEY)
+            await conn.execute("""
+                CREATE OR REPLACE FUNCTION notify_expiry_scheduled() RETURNS trigger AS $$
+                BEGIN
+                    IF TG_TABLE_NAME = 'orders' THEN
+                        IF NEW.expires_at IS NOT NULL AND NEW.status IN ('active', 'pending_review')
+                           AND (TG_OP = 'INSERT' OR NEW.expires_at IS DISTINCT FROM OLD.expires_at) THEN
+                            PERFORM pg_notify('expiry_scheduled', 'order:' || EXTRACT(EPOCH FROM NEW.expires_at - NOW())::text);
+                        END IF;
+                    ELSIF NEW.reserved_until IS NOT NULL
+                          AND (TG_OP = 'INSERT' OR NEW.reserved_until IS DISTINCT FROM OLD.reserved_until) THEN
+                        PERFORM pg_notify('expiry_scheduled', 'reservation:' || EXTRACT(EPOCH FROM NEW.reserved_until - NOW())::text);
+                    END IF;
+                    RETURN NEW;
+                END
+                $$ LANGUAGE plpgsql
+            """)
+            for trigger, table, column in (
+                ("trg_order_expiry", "orders", "expires_at"),
+                ("trg_reservation_expiry", "account_signatures", "reserved_until"),
+            ):
+                trigger_exists = await conn.fetchval("SELECT 1 FROM pg_trigger WHERE tgname = $1", trigger)
+                if not trigger_exists:
+                    await conn.execute(f"""
+                        CREATE TRIGGER {trigger}
+                        AFTER INSERT OR UPDATE OF {column} ON {table}
+                        FOR EACH ROW EXECUTE FUNCTION notify_expiry_scheduled()
+                    """)
+
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id BIGSERIAL PRIMARY KEY,
+                kind TEXT NOT NULL,
+                idempotency_key TEXT UNIQUE NOT NULL,
+                payload TEXT NOT NULL DEFAULT '{}',
+                status TEXT NOT NULL DEFAULT 'queued',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL DEFAULT 8,
+                run_at TIMESTAMP NOT NULL DEFAULT NOW(),
+                last_error TEXT DEFAULT NULL,
+                created_at TIMESTAMP DEFAULT NOW(),
+                finished_at TIMESTAMP DEFAULT NULL
+            );
+
+            CREATE INDEX IF NOT EXISTS idx_jobs_due ON jobs(run_at) WHERE status IN ('queued', 'running');
+            CREATE INDEX IF NOT EXISTS idx_jobs_finished ON jobs(finished_at) WHERE status = 'done'
+        """)
+
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS job_leases (
+                name TEXT PRIMARY KEY,
+                leader TEXT DEFAULT NULL,
+                leader_since TIMESTAMP DEFAULT NULL,
+                heartbeat_at TIMESTAMP DEFAULT NULL,
+                runs INTEGER DEFAULT 0,
+                failures INTEGER DEFAULT 0,
+                last_run_at TIMESTAMP DEFAULT NULL,
+                last_duration_ms INTEGER DEFAULT NULL,
+                total_duration_ms BIGINT DEFAULT 0,
+                last_error TEXT DEFAULT NULL
+            )
         """)
 
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS broadcasts (
+                id SERIAL PRIMARY KEY,
+                text TEXT NOT NULL,
+                created_by BIGINT NOT NULL,
+                status TEXT DEFAULT 'running',
+                status_chat_id BIGINT,
+                status_message_id INTEGER,
+                cursor_id INTEGER DEFAULT 0,
+                total INTEGER DEFAULT 0,
+                sent INTEGER DEFAULT 0,
+                failed INTEGER DEFAULT 0,
+                heartbeat_at TIMESTAMP DEFAULT NULL,
+                created_at TIMESTAMP DEFAULT NOW(),
+                finished_at TIMESTAMP DEFAULT NULL
+            );
+
+            CREATE TABLE IF NOT EXISTS broadcast_deliveries (
+                broadcast_id INTEGER NOT NULL REFERENCES broadcasts(id) ON DELETE CASCADE,
+                user_id BIGINT NOT NULL,
+                status TEXT NOT NULL,
+                error TEXT DEFAULT NULL,
+                delivered_at TIMESTAMP DEFAULT NOW(),
+                PRIMARY KEY (broadcast_id, user_id)
+            )
+        """)
+
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS fsm_state (
+                bot_id BIGINT NOT NULL,
+                chat_id BIGINT NOT NULL,
+                user_id BIGINT NOT NULL,
+                thread_id BIGINT NOT NULL DEFAULT 0,
+                business_connection_id TEXT NOT NULL DEFAULT '',
+                destiny TEXT NOT NULL DEFAULT 'default',
+                state TEXT DEFAULT NULL,
+                data JSONB NOT NULL DEFAULT '{}',
+                updated_at TIMESTAMP DEFAULT NOW(),
+                PRIMARY KEY (bot_id, chat_id, user_id, thread_id, business_connection_id, destiny)
+            );
+
+            CREATE INDEX IF NOT EXISTS idx_fsm_state_updated ON fsm_state(updated_at);
+        """)
+
+        async with conn.transaction():
+            await conn.execute("SELECT pg_advisory_xact_lock(hashtext($1))", _DDL_LOCK_KEY)
+            await conn.execute("""
+                CREATE OR REPLACE VIEW signature_matrix AS
+                SELECT s.id AS sig_id, a.id AS account_id, c.id AS category_id,
+                       s.max_signatures,
+                       COALESCE(s.used_signatures, 0) AS used_signatures,
+                       s.reserved_by, s.reserved_until, s.last_issued_at,
+                       COALESCE(s.max_signatures, c.max_signatures) AS effective_max
+                FROM accounts a
+                CROSS JOIN categories c
+                LEFT JOIN account_signatures s ON s.account_id = a.id AND s.category_id = c.id
+            """)
+
         await conn.execute(
             "INSERT INTO settings (key, value) VALUES ($1, $2) ON CONFLICT (key) DO NOTHING",
             "referral_percent", "5"
@@ -300,6 +463,9 @@ async def init_db():
                     name, price, max_sigs
                 )
 
+        from src.db.inventory import refresh_inventory
+        await refresh_inventory(conn)
+
         from src.config import SEED_ADMIN_IDS
         for i, admin_id in enumerate(SEED_ADMIN_IDS):
             if i == 0:
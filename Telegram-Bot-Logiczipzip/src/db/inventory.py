@@ -0,0 +1,193 @@
+import logging
+
+from src.db.database import get_pool
+
+logger = logging.getLogger(__name__)
+
+INVENTORY_CHANNEL = "inventory_changed"
+
+
+def available_expr(sig: str = "s", cat: str = "c", acc: str | None = "a") -> str:
+    effective_max = f"COALESCE({sig}.max_signatures, {cat}.max_signatures)"
+    enabled = f"COALESCE({acc}.is_enabled, 1) = 1 AND " if acc else ""
+    return (
+        f"CASE WHEN {enabled}{sig}.reserved_by IS NULL"
+        f" AND {sig}.used_signatures < {effective_max}"
+        f" THEN {effective_max} - {sig}.used_signatures ELSE 0 END"
+    )
+
+
+def default_available_expr(cat: str = "c") -> str:
+    return f"CASE WHEN {cat}.max_signatures > 0 THEN {cat}.max_signatures ELSE 0 END"
+
+
+_INVENTORY_SQL = f"""
+    SELECT c.id AS category_id,
+           (e.accounts_count * {default_available_expr()} + COALESCE(d.diff, 0))::int AS available,
+           e.accounts_count::int AS accounts_count
+    FROM categories c
+    CROSS JOIN (SELECT COUNT(*) AS accounts_count FROM accounts WHERE COALESCE(is_enabled, 1) = 1) e
+    LEFT JOIN (
+        SELECT s.category_id, SUM({available_expr(acc=None)} - {default_available_expr()}) AS diff
+        FROM account_signatures s
+        JOIN accounts a ON a.id = s.account_id
+        JOIN categories c ON c.id = s.category_id
+        WHERE COALESCE(a.is_enabled, 1) = 1
+          AND ($1::int[] IS NULL OR s.category_id = ANY($1::int[]))
+        GROUP BY s.category_id
+    ) d ON d.category_id = c.id
+    WHERE $1::int[] IS NULL OR c.id = ANY($1::int[])
+"""
+
+
+async def refresh_inventory(conn, category_ids: list[int] | None = None):
+    async with conn.transaction():
+        await conn.execute(
+            "SELECT 1 FROM category_inventory WHERE $1::int[] IS NULL OR category_id = ANY($1::int[]) ORDER BY category_id FOR UPDATE",
+            category_ids
+        )
+        await conn.execute(
+            f"""INSERT INTO category_inventory (category_id, available, accounts_count, updated_at)
+                SELECT category_id, available, accounts_count, NOW() FROM ({_INVENTORY_SQL}) t
+                ON CONFLICT (category_id) DO UPDATE
+                SET available = EXCLUDED.available,
+                    accounts_count = EXCLUDED.accounts_count,
+                    updated_at = NOW()""",
+            category_ids
+        )
+
+
+async def adjust_inventory(conn, category_id: int, delta: int):
+    if not delta:
+        return
+    await conn.execute(
+        "UPDATE category_inventory SET available = available + $1, updated_at = NOW() WHERE category_id = $2",
+        delta, category_id
+    )
+
+
+_LOCK_COUNTERS_SQL = """
+    SELECT i.category_id, d.diff
+    FROM category_inventory i
+    JOIN delta d ON d.category_id = i.category_id
+    WHERE d.diff <> 0
+    ORDER BY i.category_id
+    FOR UPDATE OF i
+"""
+
+
+async def update_signatures(conn, set_sql: str, where_sql: str, *args,
+                            order_sql: str = "s.id", limit: int | None = None) -> int:
+    lock = f"LIMIT {int(limit)} FOR UPDATE OF s SKIP LOCKED" if limit else "FOR UPDATE OF s"
+    return await conn.fetchval(
+        f"""WITH old AS (
+                SELECT s.id, {available_expr()} AS available_before
+                FROM account_signatures s
+                JOIN categories c ON c.id = s.category_id
+                JOIN accounts a ON a.id = s.account_id
+                WHERE {where_sql}
+                ORDER BY {order_sql}
+                {lock}
+            ),
+            changed AS (
+                UPDATE account_signatures s
+                SET {set_sql}
+                FROM old
+                WHERE s.id = old.id
+                RETURNING s.*, old.available_before
+            ),
+            delta AS (
+                SELECT s.category_id, SUM({available_expr()} - s.available_before) AS diff
+                FROM changed s
+                JOIN categories c ON c.id = s.category_id
+                JOIN accounts a ON a.id = s.account_id
+                GROUP BY s.category_id
+            ),
+            inventory AS (
+                UPDATE category_inventory i
+                SET available = i.available + locked.diff, updated_at = NOW()
+                FROM ({_LOCK_COUNTERS_SQL}) locked
+                WHERE i.category_id = locked.category_id
+            )
+            SELECT COUNT(*) FROM changed""",
+        *args
+    )
+
+
+async def apply_accounts_delta(conn, account_ids: list[int], sign: int):
+    if not account_ids:
+        return
+    await conn.execute(
+        f"""WITH sigs AS (
+                SELECT s.category_id, {available_expr(acc=None)} - {default_available_expr()} AS diff
+                FROM account_signatures s
+                JOIN categories c ON c.id = s.category_id
+                WHERE s.account_id = ANY($1::int[])
+                ORDER BY s.id
+                FOR UPDATE OF s
+            ),
+            adjust AS (
+                SELECT category_id, SUM(diff) AS diff FROM sigs GROUP BY category_id
+            ),
+            delta AS (
+                SELECT c.id AS category_id,
+                       cardinality($1::int[]) * {default_available_expr()} + COALESCE(adjust.diff, 0) AS available,
+                       cardinality($1::int[]) AS accounts_count
+                FROM categories c
+                LEFT JOIN adjust ON adjust.category_id = c.id
+            ),
+            locked AS (
+                SELECT i.category_id, delta.available, delta.accounts_count
+                FROM category_inventory i
+                JOIN delta ON delta.category_id = i.category_id
+                ORDER BY i.category_id
+                FOR UPDATE OF i
+            )
+            UPDATE category_inventory i
+            SET available = i.available + $2 * locked.available,
+                accounts_count = i.accounts_count + $2 * locked.accounts_count,
+                updated_at = NOW()
+            FROM locked
+            WHERE i.category_id = locked.category_id""",
+        account_ids, sign
+    )
+
+
+async def get_category_available(category_id: int) -> int:
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        val = await conn.fetchval(
+            "SELECT GREATEST(available, 0) FROM category_inventory WHERE category_id = $1",
+            category_id
+        )
+        return val or 0
+
+
+async def reconcile_inventory() -> list[dict]:
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            await conn.execute("SELECT 1 FROM category_inventory ORDER BY category_id FOR UPDATE")
+            rows = await conn.fetch(
+                f"""SELECT t.category_id, c.name AS category_name,
+                           i.available AS stored_available, t.available AS actual_available,
+                           i.accounts_count AS stored_accounts, t.accounts_count AS actual_accounts
+                    FROM ({_INVENTORY_SQL}) t
+                    JOIN categories c ON c.id = t.category_id
+                    LEFT JOIN category_inventory i ON i.category_id = t.category_id
+                    WHERE i.category_id IS NULL
+                       OR i.available <> t.available
+                       OR i.accounts_count <> t.accounts_count
+                    ORDER BY t.category_id""",
+                None
+            )
+            drift = [dict(r) for r in rows]
+            if drift:
+                await refresh_inventory(conn, [d["category_id"] for d in drift])
+        for d in drift:
+            logger.warning(
+                f"INVENTORY_DRIFT: cat={d['category_id']} ({d['category_name']}), "
+                f"available {d['stored_available']} -> {d['actual_available']}, "
+                f"accounts {d['stored_accounts']} -> {d['actual_accounts']}"
+            )
+        return drift
@@ -0,0 +1,115 @@
+import json
+
+from src.db.database import get_pool
+from src.db.listener import notify
+
+JOBS_CHANNEL = "jobs_ready"
+JOB_LEASE = 300
+DEFAULT_MAX_ATTEMPTS = 8
+
+_CLAIM_SQL = """
+    UPDATE jobs j
+    SET status = 'running', attempts = j.attempts + 1, run_at = NOW() + make_interval(secs => $2)
+    FROM (
+        SELECT id FROM jobs
+        WHERE status IN ('queued', 'running') AND run_at <= NOW()
+        ORDER BY run_at
+        LIMIT $1
+        FOR UPDATE SKIP LOCKED
+    ) due
+    WHERE j.id = due.id
+    RETURNING j.id, j.kind, j.idempotency_key, j.payload, j.attempts, j.max_attempts
+"""
+
+_FAIL_SQL = """
+    UPDATE jobs
+    SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END,
+        run_at = NOW() + make_interval(secs => $4),
+        finished_at = CASE WHEN attempts >= max_attempts THEN NOW() END,
+        last_error = $3
+    WHERE id = $1 AND attempts = $2 AND status = 'running'
+    RETURNING status
+"""
+
+
+async def enqueue_job(kind: str, idempotency_key: str, payload: dict, delay: float = 0,
+                      max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> int | None:
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        job_id = await conn.fetchval(
+            """INSERT INTO jobs (kind, idempotency_key, payload, run_at, max_attempts)
+               VALUES ($1, $2, $3, NOW() + make_interval(secs => $4), $5)
+               ON CONFLICT (idempotency_key) DO NOTHING
+               RETURNING id""",
+            kind, idempotency_key, json.dumps(payload), float(delay), max_attempts
+        )
+        if job_id is not None:
+            await notify(conn, JOBS_CHANNEL, kind)
+        return job_id
+
+
+async def enqueue_jobs(kind: str, jobs: list[tuple[str, dict]], max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> list[int]:
+    if not jobs:
+        return []
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(
+            """INSERT INTO jobs (kind, idempotency_key, payload, max_attempts)
+               SELECT $1, k.key, k.payload, $4
+               FROM unnest($2::text[], $3::text[]) AS k(key, payload)
+               ON CONFLICT (idempotency_key) DO NOTHING
+               RETURNING id""",
+            kind, [key for key, _ in jobs], [json.dumps(payload) for _, payload in jobs], max_attempts
+        )
+        if rows:
+            await notify(conn, JOBS_CHANNEL, kind)
+        return [r["id"] for r in rows]
+
+
+async def claim_jobs(limit: int, lease: float = JOB_LEASE) -> list[dict]:
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(_CLAIM_SQL, limit, float(lease))
+        return [dict(r) for r in rows]
+
+
+async def lock_claimed_job(conn, job_id: int, attempts: int) -> bool:
+    row = await conn.fetchval(
+        "SELECT 1 FROM jobs WHERE id = $1 AND attempts = $2 AND status = 'running' FOR UPDATE",
+        job_id, attempts
+    )
+    return row is not None
+
+
+async def complete_job(job_id: int, attempts: int) -> bool:
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        result = await conn.execute(
+            """UPDATE jobs SET status = 'done', finished_at = NOW(), last_error = NULL
+               WHERE id = $1 AND attempts = $2 AND status = 'running'""",
+            job_id, attempts
+        )
+        return result.split()[-1] != "0"
+
+
+async def fail_job(job_id: int, attempts: int, error: str, delay: float) -> str | None:
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        return await conn.fetchval(_FAIL_SQL, job_id, attempts, error, float(delay))
+
+
+async def get_job_queue_stats() -> dict[str, int]:
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status")
+        return {r["status"]: r["n"] for r in rows}
+
+
+async def prune_jobs(retention_days: int) -> int:
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        result = await conn.execute(
+            "DELETE FROM jobs WHERE status = 'done' AND finished_at < NOW() - make_interval(days => $1)",
+            retention_days
+        )
+        return int(result.split()[-1])
@@ -0,0 +1,57 @@
+import os
+import socket
+
+import asyncpg
+
+from src.db.database import DATABASE_URL, get_pool
+
+INSTANCE_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+async def connect_leases() -> asyncpg.Connection:
+    return await asyncpg.connect(DATABASE_URL)
+
+
+async def try_acquire_lease(conn: asyncpg.Connection, name: str) -> bool:
+    acquired = await conn.fetchval(
+        "SELECT pg_try_advisory_lock(hashtext('job_lease'), hashtext($1))", name
+    )
+    if acquired:
+        await conn.execute(
+            """INSERT INTO job_leases (name, leader, leader_since, heartbeat_at)
+               VALUES ($1, $2, NOW(), NOW())
+               ON CONFLICT (name) DO UPDATE
+               SET leader = EXCLUDED.leader, leader_since = NOW(), heartbeat_at = NOW()""",
+            name, INSTANCE_ID
+        )
+    return bool(acquired)
+
+
+async def heartbeat_leases(conn: asyncpg.Connection, names: list[str], timeout: float):
+    await conn.execute(
+        "UPDATE job_leases SET heartbeat_at = NOW() WHERE name = ANY($1::text[]) AND leader = $2",
+        names, INSTANCE_ID, timeout=timeout
+    )
+
+
+async def record_job_run(name: str, duration: float, error: str | None = None):
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        await conn.execute(
+            """UPDATE job_leases
+               SET runs = runs + 1,
+                   failures = failures + CASE WHEN $3::text IS NULL THEN 0 ELSE 1 END,
+                   last_run_at = NOW(),
+                   last_duration_ms = $2::int,
+                   total_duration_ms = total_duration_ms + $2::int,
+                   last_error = COALESCE($3, last_error)
+               WHERE name = $1""",
+            name, int(duration * 1000), error
+        )
+
+
+async def get_job_leases() -> list[dict]:
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch("SELECT * FROM job_leases ORDER BY name")
+        return [dict(r) for r in rows]
@@ -0,0 +1,98 @@
+import asyncio
+import logging
+
+import asyncpg
+
+from src.db.database import DATABASE_URL
+
+logger = logging.getLogger(__name__)
+
+_handlers: dict[str, list] = {}
+_reset_handlers: list = []
+_task: asyncio.Task | None = None
+_conn: asyncpg.Connection | None = None
+_connected = asyncio.Event()
+
+
+def subscribe(channel: str, handler):
+    _handlers.setdefault(channel, []).append(handler)
+
+
+def on_reset(handler):
+    _reset_handlers.append(handler)
+
+
+def is_listening() -> bool:
+    return _connected.is_set()
+
+
+def _dispatch(conn, pid, channel, payload):
+    for handler in _handlers.get(channel, []):
+        try:
+            handler(payload)
+        except Exception as e:
+            logger.error(f"Listener handler error on {channel}: {e}", exc_info=True)
+
+
+def _reset():
+    _connected.clear()
+    for handler in _reset_handlers:
+        try:
+            handler()
+        except Exception as e:
+            logger.error(f"Listener reset handler error: {e}", exc_info=True)
+
+
+async def _run():
+    global _conn
+    while True:
+        lost = asyncio.Event()
+        try:
+            _conn = await asyncpg.connect(DATABASE_URL)
+            _conn.add_termination_listener(lambda c: lost.set())
+            for channel in _handlers:
+                await _conn.add_listener(channel, _dispatch)
+            _reset()
+            _connected.set()
+            logger.info(f"Listening on {', '.join(_handlers) or 'no channels'}")
+            while not lost.is_set():
+                try:
+                    await asyncio.wait_for(lost.wait(), timeout=60)
+                except asyncio.TimeoutError:
+                    await _conn.fetchval("SELECT 1", timeout=10)
+            logger.warning("Listener connection lost, reconnecting")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Listener connection error: {e}")
+        finally:
+            _reset()
+            if _conn is not None and not _conn.is_closed():
+                await _conn.close()
+            _conn = None
+        await asyncio.sleep(5)
+
+
+async def start_listener():
+    global _task
+    if _task is None:
+        _task = asyncio.create_task(_run())
+        try:
+            await asyncio.wait_for(_connected.wait(), timeout=10)
+        except asyncio.TimeoutError:
+            logger.warning("Listener not connected yet, caches stay disabled until it is")
+
+
+async def stop_listener():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
+
+
+async def notify(conn, channel: str, payload: str = ""):
+    await conn.execute("SELECT pg_notify($1, $2)", channel, payload)
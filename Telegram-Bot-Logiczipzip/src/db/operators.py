@@ -1,24 +1,31 @@
 from src.db.database import get_pool
+from src.db.cache import publish_invalidation
+from src.db.staff import get_staff, get_route
 
 
-async def add_operator(telegram_id: int, username: str = None, role: str = "orders") -> bool:
+async def _write_operators(sql: str, *args) -> str:
     pool = await get_pool()
     async with pool.acquire() as conn:
-        result = await conn.execute(
-            "INSERT INTO operators (telegram_id, username, role) VALUES ($1, $2, $3) ON CONFLICT (telegram_id) DO NOTHING",
-            telegram_id, username, role
-        )
-        return result.split()[-1] != "0"
+        async with conn.transaction():
+            result = await conn.execute(sql, *args)
+            await publish_invalidation(conn, "operators")
+        return result
+
+
+async def add_operator(telegram_id: int, username: str = None, role: str = "orders") -> bool:
+    result = await _write_operators(
+        "INSERT INTO operators (telegram_id, username, role) VALUES ($1, $2, $3) ON CONFLICT (telegram_id) DO NOTHING",
+        telegram_id, username, role
+    )
+    return result.split()[-1] != "0"
 
 
 async def remove_operator(telegram_id: int) -> bool:
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        result = await conn.execute(
-            "DELETE FROM operators WHERE telegram_id = $1",
-            telegram_id
-        )
-        return int(result.split()[-1]) > 0
+    result = await _write_operators(
+        "DELETE FROM operators WHERE telegram_id = $1",
+        telegram_id
+    )
+    return int(result.split()[-1]) > 0
 
 
 async def get_all_operators() -> list[dict]:
@@ -29,47 +36,32 @@ async def get_all_operators() -> list[dict]:
 
 
 async def is_operator(telegram_id: int) -> bool:
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        row = await conn.fetchrow(
-            "SELECT 1 FROM operators WHERE telegram_id = $1",
-            telegram_id
-        )
-        return row is not None
+    staff = await get_staff()
+    return telegram_id in staff["operators"]
 
 
 async def get_operator_ids(role: str = None) -> list[int]:
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        if role:
-            rows = await conn.fetch(
-                "SELECT telegram_id FROM operators WHERE role = $1",
-                role
-            )
-        else:
-            rows = await conn.fetch("SELECT telegram_id FROM operators")
-        return [r["telegram_id"] for r in rows]
+    staff = await get_staff()
+    return [t for t, o in staff["operators"].items() if role is None or o["role"] == role]
 
 
 async def get_order_operator_ids() -> list[int]:
-    return await get_operator_ids("orders")
+    return await get_route("order_operators")
 
 
 async def get_ticket_operator_ids() -> list[int]:
-    return await get_operator_ids("support")
+    return await get_route("support_operators")
 
 
 async def get_preorder_operator_ids() -> list[int]:
-    return await get_operator_ids("preorders")
+    return await get_route("preorder_operators")
 
 
 async def update_operator_role(telegram_id: int, role: str):
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        await conn.execute(
-            "UPDATE operators SET role = $1 WHERE telegram_id = $2",
-            role, telegram_id
-        )
+    await _write_operators(
+        "UPDATE operators SET role = $1 WHERE telegram_id = $2",
+        role, telegram_id
+    )
 
 
 async def get_operator(telegram_id: int) -> dict | None:
@@ -85,34 +77,23 @@ async def get_operator(telegram_id: int) -> dict | None:
 async def toggle_operator_notifications(telegram_id: int) -> bool:
     pool = await get_pool()
     async with pool.acquire() as conn:
-        row = await conn.fetchrow(
-            "SELECT notifications_enabled FROM operators WHERE telegram_id = $1",
-            telegram_id
-        )
-        if not row:
-            return False
-        new_val = 0 if row["notifications_enabled"] else 1
-        await conn.execute(
-            "UPDATE operators SET notifications_enabled = $1 WHERE telegram_id = $2",
-            new_val, telegram_id
-        )
+        async with conn.transaction():
+            new_val = await conn.fetchval(
+                """UPDATE operators SET notifications_enabled = CASE WHEN notifications_enabled = 1 THEN 0 ELSE 1 END
+                   WHERE telegram_id = $1 RETURNING notifications_enabled""",
+                telegram_id
+            )
+            if new_val is None:
+                return False
+            await publish_invalidation(conn, "operators")
         return bool(new_val)
 
 
 async def is_operator_notifications_enabled(telegram_id: int) -> bool:
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        row = await conn.fetchrow(
-            "SELECT notifications_enabled FROM operators WHERE telegram_id = $1",
-            telegram_id
-        )
-        return bool(row["notifications_enabled"]) if row else True
+    staff = await get_staff()
+    operator = staff["operators"].get(telegram_id)
+    return bool(operator["notifications_enabled"]) if operator else True
 
 
 async def get_order_operators_with_notifications() -> list[int]:
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        rows = await conn.fetch(
-            "SELECT telegram_id FROM operators WHERE role = 'orders' AND notifications_enabled = 1"
-        )
-        return [r["telegram_id"] for r in rows]
+    return await get_route("notified_order_operators")
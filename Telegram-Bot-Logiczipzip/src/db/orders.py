@@ -1,6 +1,25 @@
 import uuid
 from src.db.database import get_pool
 
+EXPIRE_BATCH_SIZE = 500
+
+_EXPIRE_SQL = """
+    WITH due AS (
+        SELECT id FROM orders
+        WHERE status IN ('active', 'pending_review')
+          AND expires_at IS NOT NULL
+          AND expires_at <= NOW()
+        ORDER BY expires_at
+        LIMIT $1
+        FOR UPDATE SKIP LOCKED
+    )
+    UPDATE orders o SET status = 'expired'
+    FROM due, categories c
+    WHERE o.id = due.id AND c.id = o.category_id
+    RETURNING o.id, o.user_id, c.name AS category_name,
+              COALESCE((SELECT u.is_active FROM users u WHERE u.telegram_id = o.user_id), 1) AS user_active
+"""
+
 
 def generate_batch_group_id() -> str:
     return str(uuid.uuid4())[:8]
@@ -26,55 +45,23 @@ async def create_preorder(user_id: int, category_id: int, price_paid: float, tot
         )
 
 
-async def get_pending_preorders() -> list[dict]:
+async def get_fulfillable_preorders(category_ids: list[int] | None = None) -> list[dict]:
     pool = await get_pool()
     async with pool.acquire() as conn:
         rows = await conn.fetch(
             """SELECT o.*, c.name as category_name
                FROM orders o
                JOIN categories c ON o.category_id = c.id
+               JOIN category_inventory i ON i.category_id = o.category_id
                WHERE o.status = 'preorder'
-               ORDER BY o.created_at ASC"""
+                 AND i.available > 0
+                 AND ($1::int[] IS NULL OR o.category_id = ANY($1::int[]))
+               ORDER BY o.created_at ASC, o.id ASC""",
+            category_ids
         )
         return [dict(r) for r in rows]
 
 
-async def fulfill_preorder(order_id: int, account_id: int):
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        await conn.execute(
-            """UPDATE orders SET status = 'active', account_id = $1, expires_at = NOW() + INTERVAL '3 days'
-               WHERE id = $2 AND status = 'preorder'""",
-            account_id, order_id
-        )
-
-
-async def fulfill_preorder_multi(preorder: dict, allocations: list[dict]) -> list[int]:
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        order_ids = []
-        category_id = preorder["category_id"]
-        user_id = preorder["user_id"]
-        custom_op = preorder.get("custom_operator_name")
-        price_per_sig = preorder["price_paid"] / max(preorder["total_signatures"], 1)
-        bg_id = generate_batch_group_id() if len(allocations) > 1 else preorder.get("batch_group_id")
-        async with conn.transaction():
-            for alloc in allocations:
-                qty = alloc["batch_size"]
-                alloc_price = price_per_sig * qty
-                oid = await conn.fetchval(
-                    """INSERT INTO orders (user_id, account_id, category_id, price_paid, total_signatures, signatures_claimed, status, expires_at, custom_operator_name, is_exclusive, batch_group_id)
-                       VALUES ($1, $2, $3, $4, $5, 0, 'active', NOW() + INTERVAL '3 days', $6, 0, $7) RETURNING id""",
-                    user_id, alloc["id"], category_id, alloc_price, qty, custom_op, bg_id
-                )
-                order_ids.append(oid)
-            await conn.execute(
-                "UPDATE orders SET status = 'fulfilled_split' WHERE id = $1 AND status = 'preorder'",
-                preorder["id"]
-            )
-        return order_ids
-
-
 async def get_user_orders(user_id: int) -> list[dict]:
     pool = await get_pool()
     async with pool.acquire() as conn:
@@ -235,26 +222,34 @@ async def is_order_expired(order_id: int) -> bool:
         return bool(expired)
 
 
-async def expire_old_orders() -> list[dict]:
+async def expire_old_orders(batch_size: int = EXPIRE_BATCH_SIZE) -> list[dict]:
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        expired = []
+        while True:
+            rows = await conn.fetch(_EXPIRE_SQL, batch_size)
+            expired.extend(dict(r) for r in rows)
+            if len(rows) < batch_size:
+                return expired
+
+
+async def get_order_deadlines(horizon: float, limit: int) -> list[float]:
     pool = await get_pool()
     async with pool.acquire() as conn:
         rows = await conn.fetch(
-            """SELECT o.id, o.user_id, c.name as category_name
-               FROM orders o
-               JOIN categories c ON o.category_id = c.id
-               WHERE o.status IN ('active', 'pending_review')
-                 AND o.expires_at IS NOT NULL
-                 AND o.expires_at <= NOW()"""
-        )
-        expired = [dict(r) for r in rows]
-        if expired:
-            await conn.execute(
-                """UPDATE orders SET status = 'expired'
+            """SELECT EXTRACT(EPOCH FROM expires_at - NOW())::float8 AS delay
+               FROM (
+                   SELECT DISTINCT expires_at FROM orders
                    WHERE status IN ('active', 'pending_review')
                      AND expires_at IS NOT NULL
-                     AND expires_at <= NOW()"""
-            )
-        return expired
+                     AND expires_at <= NOW() + make_interval(secs => $1)
+                   ORDER BY expires_at
+                   LIMIT $2
+               ) due
+               ORDER BY delay""",
+            horizon, limit
+        )
+        return [r["delay"] for r in rows]
 
 
 async def get_preorders_with_users() -> list[dict]:
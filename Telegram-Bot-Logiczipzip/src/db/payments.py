@@ -36,6 +36,18 @@ async def update_payment_status(invoice_id: int, status: str):
             )
 
 
+async def claim_order_payment(invoice_id: int) -> dict | None:
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        row = await conn.fetchrow(
+            """UPDATE payments SET status = 'paid', paid_at = NOW()
+               WHERE invoice_id = $1 AND status = 'pending' AND purpose = 'order'
+               RETURNING *""",
+            invoice_id
+        )
+        return dict(row) if row else None
+
+
 async def confirm_balance_payment(invoice_id: int, user_id: int, amount: float) -> bool:
     pool = await get_pool()
     async with pool.acquire() as conn:
@@ -66,3 +78,15 @@ async def get_pending_payments() -> list[dict]:
             "SELECT * FROM payments WHERE status = 'pending' ORDER BY created_at"
         )
         return [dict(r) for r in rows]
+
+
+async def expire_payments(invoice_ids: list[int]) -> list[dict]:
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(
+            """UPDATE payments SET status = 'expired'
+               WHERE invoice_id = ANY($1::bigint[]) AND status = 'pending'
+               RETURNING invoice_id, user_id, purpose""",
+            invoice_ids
+        )
+        return [dict(r) for r in rows]
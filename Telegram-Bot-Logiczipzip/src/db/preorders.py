@@ -0,0 +1,205 @@
+import logging
+
+from src.db.database import get_pool
+from src.db.accounts import (
+    _RESERVE_WINDOW, _APPLY_ALLOCATIONS_SQL, _lock_waiting_reservations, _materialize_candidates,
+)
+from src.db.orders import generate_batch_group_id
+
+logger = logging.getLogger(__name__)
+
+WINDOW_SLACK = 2
+
+_LOCK_PREORDERS_SQL = """
+    SELECT id FROM orders
+    WHERE id = ANY($1::int[]) AND status = 'preorder' AND category_id = $2
+    ORDER BY id
+    FOR UPDATE
+"""
+
+_CANDIDATES_SQL = """
+    WITH ranked AS (
+        SELECT s.id,
+               COALESCE(a.priority, 0) AS priority, a.created_at,
+               COALESCE(s.max_signatures, c.max_signatures) - s.used_signatures AS remaining,
+               s.used_signatures = 0 AND NOT EXISTS (
+                   SELECT 1 FROM orders o
+                   WHERE o.account_id = s.account_id
+                     AND o.category_id = s.category_id
+                     AND o.status IN ('active', 'pending_review')
+               ) AS exclusive_ok
+        FROM account_signatures s
+        JOIN accounts a ON a.id = s.account_id
+        JOIN categories c ON c.id = s.category_id
+        WHERE s.category_id = $1
+          AND COALESCE(a.is_enabled, 1) = 1
+          AND COALESCE(s.max_signatures, c.max_signatures) - s.used_signatures >= 1
+          AND (s.reserved_by IS NULL OR s.reserved_until <= NOW())
+    ),
+    windowed AS (
+        SELECT id, exclusive_ok,
+               SUM(remaining) OVER packing - remaining AS covered_before,
+               ROW_NUMBER() OVER packing AS rank,
+               ROW_NUMBER() OVER (PARTITION BY exclusive_ok ORDER BY priority DESC, created_at ASC) AS exclusive_rank
+        FROM ranked
+        WINDOW packing AS (ORDER BY priority DESC, remaining ASC, created_at ASC ROWS UNBOUNDED PRECEDING)
+    )
+    SELECT s.id AS sig_id, a.id, a.phone, a.password, a.totp_secret,
+           COALESCE(a.priority, 0) AS priority, a.created_at,
+           COALESCE(s.max_signatures, c.max_signatures) AS effective_max,
+           s.used_signatures,
+           s.reserved_by IS NULL OR s.reserved_until <= NOW() AS free,
+           CASE WHEN s.reserved_by IS NULL
+                THEN COALESCE(s.max_signatures, c.max_signatures) - s.used_signatures
+                ELSE 0 END AS available_before,
+           w.exclusive_ok
+    FROM windowed w
+    JOIN account_signatures s ON s.id = w.id
+    JOIN accounts a ON a.id = s.account_id
+    JOIN categories c ON c.id = s.category_id
+    WHERE w.covered_before < $2 OR w.rank <= $3 OR (w.exclusive_ok AND w.exclusive_rank <= $4)
+    ORDER BY s.id
+    FOR UPDATE OF s
+"""
+
+_ACTIVATE_SQL = """
+    UPDATE orders o
+    SET status = 'active', account_id = u.account_id, expires_at = NOW() + INTERVAL '3 days'
+    FROM unnest($1::int[], $2::int[]) AS u(order_id, account_id)
+    WHERE o.id = u.order_id AND o.status = 'preorder'
+"""
+
+_INSERT_SPLIT_SQL = """
+    INSERT INTO orders (user_id, account_id, category_id, price_paid, total_signatures, signatures_claimed,
+                        status, expires_at, custom_operator_name, is_exclusive, batch_group_id)
+    SELECT u.user_id, u.account_id, $1, u.price, u.qty, 0, 'active', NOW() + INTERVAL '3 days',
+           u.custom_operator_name, 0, u.batch_group_id
+    FROM unnest($2::bigint[], $3::int[], $4::float8[], $5::int[], $6::text[], $7::text[])
+         WITH ORDINALITY AS u(user_id, account_id, price, qty, custom_operator_name, batch_group_id, ord)
+    ORDER BY u.ord
+    RETURNING id
+"""
+
+
+def _packing_key(c: dict):
+    return (-c["priority"], c["effective_max"] - c["used_signatures"], c["created_at"])
+
+
+def _exclusive_key(c: dict):
+    return (-c["priority"], c["created_at"])
+
+
+def _plan_regular(candidates: list[dict], qty: int) -> list[tuple[dict, int]]:
+    ordered = sorted((c for c in candidates if c["effective_max"] > c["used_signatures"]), key=_packing_key)
+    for c in ordered:
+        if c["effective_max"] - c["used_signatures"] >= qty:
+            return [(c, qty)]
+    if sum(c["effective_max"] - c["used_signatures"] for c in ordered) < qty:
+        return []
+    takes = []
+    left = qty
+    for c in ordered:
+        take = min(c["effective_max"] - c["used_signatures"], left)
+        takes.append((c, take))
+        left -= take
+        if left <= 0:
+            break
+    return takes
+
+
+def _plan_exclusive(candidates: list[dict]) -> list[tuple[dict, int]]:
+    fresh = [c for c in candidates if c["exclusive_ok"] and c["used_signatures"] == 0 and not c["touched"]]
+    if not fresh:
+        return []
+    c = min(fresh, key=_exclusive_key)
+    return [(c, c["effective_max"])]
+
+
+async def allocate_preorders(category_id: int, preorders: list[dict]) -> list[dict]:
+    if not preorders:
+        return []
+    regular_demand = sum(po.get("total_signatures", 1) for po in preorders if not po.get("is_exclusive"))
+    exclusive_demand = sum(1 for po in preorders if po.get("is_exclusive"))
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            await _lock_waiting_reservations(conn, category_id)
+            pending = {r["id"] for r in await conn.fetch(_LOCK_PREORDERS_SQL, [po["id"] for po in preorders], category_id)}
+            cover = regular_demand * WINDOW_SLACK
+            await _materialize_candidates(conn, category_id, cover, exclusive_demand)
+            rows = await conn.fetch(
+                _CANDIDATES_SQL, category_id, cover, _RESERVE_WINDOW, exclusive_demand + _RESERVE_WINDOW
+            )
+            candidates = [
+                {**dict(r), "take": 0, "touched": False, "user_id": None}
+                for r in rows
+                if r["free"] and r["effective_max"] > r["used_signatures"]
+            ]
+
+            planned = []
+            for po in preorders:
+                if po["id"] not in pending:
+                    continue
+                if po.get("is_exclusive"):
+                    takes = _plan_exclusive(candidates)
+                else:
+                    takes = _plan_regular(candidates, po.get("total_signatures", 1))
+                if not takes:
+                    continue
+                for c, take in takes:
+                    c["used_signatures"] += take
+                    c["take"] += take
+                    c["touched"] = True
+                    c["user_id"] = po["user_id"]
+                planned.append((po, takes))
+            if not planned:
+                return []
+
+            used = [c for c in candidates if c["take"]]
+            await conn.fetch(
+                _APPLY_ALLOCATIONS_SQL,
+                [c["sig_id"] for c in used], [c["take"] for c in used],
+                [c["available_before"] for c in used], [c["user_id"] for c in used]
+            )
+
+            activate = [(po["id"], takes[0][0]["id"]) for po, takes in planned if len(takes) == 1]
+            if activate:
+                await conn.execute(_ACTIVATE_SQL, [a[0] for a in activate], [a[1] for a in activate])
+
+            split = [(po, takes) for po, takes in planned if len(takes) > 1]
+            split_rows = []
+            for po, takes in split:
+                price_per_sig = po["price_paid"] / max(po["total_signatures"], 1)
+                batch_group_id = generate_batch_group_id()
+                for c, take in takes:
+                    split_rows.append((po["user_id"], c["id"], price_per_sig * take, take, po.get("custom_operator_name"), batch_group_id))
+            split_ids = []
+            if split_rows:
+                inserted = await conn.fetch(
+                    _INSERT_SPLIT_SQL, category_id,
+                    *[[r[i] for r in split_rows] for i in range(6)]
+                )
+                split_ids = sorted(r["id"] for r in inserted)
+                await conn.execute(
+                    "UPDATE orders SET status = 'fulfilled_split' WHERE id = ANY($1::int[]) AND status = 'preorder'",
+                    [po["id"] for po, _ in split]
+                )
+
+    results = []
+    next_split = iter(split_ids)
+    for po, takes in planned:
+        allocations = [
+            {"id": c["id"], "phone": c["phone"], "password": c["password"],
+             "totp_secret": c["totp_secret"], "batch_size": take}
+            for c, take in takes
+        ]
+        if len(takes) == 1:
+            order_ids = [po["id"]]
+        else:
+            order_ids = [next(next_split) for _ in takes]
+        results.append({"preorder": po, "allocations": allocations, "order_ids": order_ids})
+    logger.info(
+        f"PREORDER_ALLOC: cat={category_id}, requested={len(preorders)}, fulfilled={len(results)}, "
+        f"accounts={len(used)}, split={len(split)}"
+    )
+    return results
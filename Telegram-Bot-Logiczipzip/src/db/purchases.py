@@ -0,0 +1,126 @@
+import logging
+
+from src.db.database import get_pool
+from src.db.accounts import _reserve_allocations, _reserve_exclusive
+from src.db.inventory import INVENTORY_CHANNEL
+from src.db.listener import notify
+from src.db.orders import generate_batch_group_id
+from src.db.referrals import get_referral_percent
+
+logger = logging.getLogger(__name__)
+
+_DEBIT_SQL = """
+    UPDATE users SET balance = balance - $1
+    WHERE telegram_id = $2 AND balance >= $1
+    RETURNING balance, referred_by
+"""
+
+_INSERT_ORDERS_SQL = """
+    WITH ins AS (
+        INSERT INTO orders (user_id, account_id, category_id, price_paid, total_signatures, signatures_claimed,
+                            status, expires_at, custom_operator_name, is_exclusive, batch_group_id)
+        SELECT $1, u.account_id, $2, u.price, u.qty, 0,
+               CASE WHEN u.account_id IS NULL THEN 'preorder' ELSE 'active' END,
+               CASE WHEN u.account_id IS NULL THEN NULL ELSE NOW() + INTERVAL '3 days' END,
+               $3, $4, $5
+        FROM unnest($6::int[], $7::float8[], $8::int[]) WITH ORDINALITY AS u(account_id, price, qty, ord)
+        ORDER BY u.ord
+        RETURNING *
+    )
+    SELECT ins.*, a.phone, a.password, a.totp_secret, c.name AS category_name
+    FROM ins
+    LEFT JOIN accounts a ON ins.account_id = a.id
+    JOIN categories c ON ins.category_id = c.id
+    ORDER BY ins.id
+"""
+
+_REFERRAL_SQL = """
+    WITH earn AS (
+        INSERT INTO referral_earnings (referrer_id, referral_id, order_id, amount)
+        SELECT $1, $2, u.order_id, u.amount
+        FROM unnest($3::int[], $4::float8[]) AS u(order_id, amount)
+        WHERE u.amount > 0
+        ON CONFLICT (order_id) DO NOTHING
+        RETURNING order_id, amount
+    ),
+    credit AS (
+        UPDATE users SET balance = balance + (SELECT SUM(amount) FROM earn)
+        WHERE telegram_id = $1 AND EXISTS (SELECT 1 FROM earn)
+    )
+    SELECT order_id, amount FROM earn ORDER BY order_id
+"""
+
+
+async def _referral_rewards(conn, user_id: int, referrer_id: int | None, orders: list[dict], percent: float) -> list[dict]:
+    if not referrer_id or not orders or percent <= 0:
+        return []
+    rows = await conn.fetch(
+        _REFERRAL_SQL, referrer_id, user_id,
+        [o["id"] for o in orders],
+        [round(o["price_paid"] * percent / 100, 2) for o in orders]
+    )
+    return [{"referrer_id": referrer_id, "order_id": r["order_id"], "reward": r["amount"]} for r in rows]
+
+
+async def purchase(user_id: int, category_id: int, qty: int, unit_price: float, charge: bool = True,
+                   exclusive: bool = False, custom_operator_name: str = None, reserve: bool = True) -> dict:
+    total_price = unit_price * qty
+    percent = await get_referral_percent()
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            if charge and total_price > 0:
+                debited = await conn.fetchrow(_DEBIT_SQL, total_price, user_id)
+                if not debited:
+                    return {"status": "insufficient_funds", "total_price": total_price}
+                referrer_id = debited["referred_by"]
+            else:
+                referrer_id = await conn.fetchval("SELECT referred_by FROM users WHERE telegram_id = $1", user_id)
+
+            if exclusive:
+                max_sigs = await conn.fetchval("SELECT max_signatures FROM categories WHERE id = $1", category_id)
+                allocations = []
+                for _ in range(qty):
+                    account = await _reserve_exclusive(conn, category_id, user_id)
+                    if not account:
+                        break
+                    allocations.append(account)
+                rows = [(a["id"], unit_price, a["batch_size"]) for a in allocations]
+                rows += [(None, unit_price, max_sigs)] * (qty - len(allocations))
+                batch_group_id = generate_batch_group_id() if qty > 1 else None
+            else:
+                allocations = await _reserve_allocations(conn, category_id, user_id, qty) if reserve else []
+                if allocations:
+                    rows = [(a["id"], unit_price * a["batch_size"], a["batch_size"]) for a in allocations]
+                else:
+                    rows = [(None, total_price, qty)]
+                batch_group_id = generate_batch_group_id() if len(allocations) > 1 else None
+
+            created = await conn.fetch(
+                _INSERT_ORDERS_SQL, user_id, category_id, custom_operator_name, 1 if exclusive else 0, batch_group_id,
+                [r[0] for r in rows], [r[1] for r in rows], [r[2] for r in rows]
+            )
+            by_account = {a["id"]: a for a in allocations}
+            orders = []
+            preorder_ids = []
+            for row in created:
+                order = dict(row)
+                if order["account_id"] is None:
+                    preorder_ids.append(order["id"])
+                else:
+                    orders.append((order, by_account[order["account_id"]]))
+            referrals = await _referral_rewards(conn, user_id, referrer_id, [o for o, _ in orders], percent)
+            if preorder_ids:
+                await notify(conn, INVENTORY_CHANNEL, str(category_id))
+
+    logger.info(
+        f"PURCHASE: user={user_id}, cat={category_id}, qty={qty}, exclusive={exclusive}, charged={total_price if charge else 0}, "
+        f"orders={[o['id'] for o, _ in orders]}, preorders={preorder_ids}"
+    )
+    return {
+        "status": "ok" if orders else "preorder",
+        "total_price": total_price,
+        "orders": orders,
+        "preorder_ids": preorder_ids,
+        "referrals": referrals,
+    }
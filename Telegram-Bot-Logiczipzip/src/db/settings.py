@@ -1,20 +1,21 @@
 from src.db.database import get_pool
+from src.db.cache import settings_cache, publish_invalidation
 
 
 async def get_setting(key: str) -> str | None:
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        row = await conn.fetchrow("SELECT value FROM settings WHERE key = $1", key)
-        return row["value"] if row else None
+    settings = await settings_cache.get()
+    return settings.get(key)
 
 
 async def set_setting(key: str, value: str):
     pool = await get_pool()
     async with pool.acquire() as conn:
-        await conn.execute(
-            "INSERT INTO settings (key, value) VALUES ($1, $2) ON CONFLICT (key) DO UPDATE SET value = $2",
-            key, value
-        )
+        async with conn.transaction():
+            await conn.execute(
+                "INSERT INTO settings (key, value) VALUES ($1, $2) ON CONFLICT (key) DO UPDATE SET value = $2",
+                key, value
+            )
+            await publish_invalidation(conn, "settings")
 
 
 async def get_deposit_amount() -> float:
@@ -0,0 +1,53 @@
+import logging
+
+from src.db.database import get_pool
+
+logger = logging.getLogger(__name__)
+
+COMPACT_CHUNK_SIZE = 5000
+
+# DO UPDATE ... WHERE FALSE row-locks existing rows without writing them, so compact_signatures skips them.
+_ENSURE_SQL = """
+    INSERT INTO account_signatures (account_id, category_id)
+    SELECT a.id, c.id
+    FROM accounts a CROSS JOIN categories c
+    WHERE ($1::int[] IS NULL OR a.id = ANY($1::int[]))
+      AND ($2::int[] IS NULL OR c.id = ANY($2::int[]))
+    ORDER BY a.id, c.id
+    ON CONFLICT (account_id, category_id) DO UPDATE SET account_id = EXCLUDED.account_id WHERE FALSE
+"""
+
+_COMPACT_SQL = """
+    DELETE FROM account_signatures
+    WHERE id IN (
+        SELECT id FROM account_signatures
+        WHERE id BETWEEN $1 AND $2
+          AND max_signatures IS NULL
+          AND COALESCE(used_signatures, 0) = 0
+          AND reserved_by IS NULL
+          AND last_issued_at IS NULL
+        FOR UPDATE SKIP LOCKED
+    )
+"""
+
+
+async def ensure_signature_rows(conn, account_ids: list[int] | None = None, category_ids: list[int] | None = None) -> int:
+    result = await conn.execute(_ENSURE_SQL, account_ids, category_ids)
+    return int(result.split()[-1])
+
+
+async def compact_signatures(chunk_size: int | None = COMPACT_CHUNK_SIZE) -> int:
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        bounds = await conn.fetchrow("SELECT MIN(id) AS first_id, MAX(id) AS last_id FROM account_signatures")
+        if bounds["first_id"] is None:
+            return 0
+        first_id, last_id = bounds["first_id"], bounds["last_id"]
+        step = chunk_size or (last_id - first_id + 1)
+        removed = 0
+        for start in range(first_id, last_id + 1, step):
+            result = await conn.execute(_COMPACT_SQL, start, min(start + step - 1, last_id))
+            removed += int(result.split()[-1])
+        if removed:
+            logger.info(f"SIGNATURES: removed {removed} default account_signatures rows")
+        return removed
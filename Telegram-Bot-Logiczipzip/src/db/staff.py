@@ -0,0 +1,70 @@
+from dataclasses import dataclass
+
+from src.db.cache import staff_cache, settings_cache
+
+
+@dataclass(frozen=True)
+class Roles:
+    user_id: int
+    is_admin: bool = False
+    is_owner: bool = False
+    is_operator: bool = False
+    operator_role: str | None = None
+    operator_notifications: bool = False
+
+    @property
+    def is_staff(self) -> bool:
+        return self.is_admin or self.is_operator
+
+
+_routes: dict | None = None
+_routes_source: tuple = (None, None)
+
+
+async def get_staff() -> dict[str, dict[int, dict]]:
+    return await staff_cache.get()
+
+
+async def resolve_roles(user_id: int) -> Roles:
+    staff = await staff_cache.get()
+    admin = staff["admins"].get(user_id)
+    operator = staff["operators"].get(user_id)
+    return Roles(
+        user_id=user_id,
+        is_admin=admin is not None,
+        is_owner=admin is not None and admin["role"] == "owner",
+        is_operator=operator is not None,
+        operator_role=operator["role"] if operator else None,
+        operator_notifications=bool(operator["notifications_enabled"]) if operator else False,
+    )
+
+
+def _build_routes(staff: dict, settings: dict) -> dict[str, list[int]]:
+    admins = list(staff["admins"])
+    operators = staff["operators"]
+    return {
+        "admins": admins,
+        "notified_admins": [a for a in admins if settings.get(f"admin_notify_{a}") != "0"],
+        "operators": list(operators),
+        "order_operators": [t for t, o in operators.items() if o["role"] == "orders"],
+        "notified_order_operators": [
+            t for t, o in operators.items() if o["role"] == "orders" and o["notifications_enabled"] == 1
+        ],
+        "support_operators": [t for t, o in operators.items() if o["role"] == "support"],
+        "preorder_operators": [t for t, o in operators.items() if o["role"] == "preorders"],
+    }
+
+
+async def get_notification_routes() -> dict[str, list[int]]:
+    global _routes, _routes_source
+    staff = await staff_cache.get()
+    settings = await settings_cache.get()
+    if _routes is None or _routes_source[0] is not staff or _routes_source[1] is not settings:
+        _routes = _build_routes(staff, settings)
+        _routes_source = (staff, settings)
+    return _routes
+
+
+async def get_route(name: str) -> list[int]:
+    routes = await get_notification_routes()
+    return list(routes[name])
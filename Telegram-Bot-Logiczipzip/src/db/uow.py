@@ -0,0 +1,113 @@
+import asyncio
+from contextlib import AbstractAsyncContextManager, asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, Protocol
+
+import asyncpg
+from asyncpg.pool import PoolConnectionProxy
+
+DBConnection = asyncpg.Connection | PoolConnectionProxy
+
+_current: ContextVar["UnitOfWork | None"] = ContextVar("unit_of_work", default=None)
+
+
+class ConnectionSource(Protocol):
+    def acquire(self) -> AbstractAsyncContextManager[DBConnection]: ...
+
+    async def execute(self, query: str, *args: Any, **kwargs: Any) -> str: ...
+
+    async def fetch(self, query: str, *args: Any, **kwargs: Any) -> list[asyncpg.Record]: ...
+
+    async def fetchrow(self, query: str, *args: Any, **kwargs: Any) -> asyncpg.Record | None: ...
+
+    async def fetchval(self, query: str, *args: Any, **kwargs: Any) -> Any: ...
+
+
+class _Acquire:
+    def __init__(self, uow: "UnitOfWork"):
+        self.uow = uow
+
+    async def __aenter__(self) -> DBConnection:
+        return await self.uow.connection()
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __await__(self):
+        return self.uow.connection().__await__()
+
+
+class UnitOfWork:
+    def __init__(self, pool: asyncpg.Pool):
+        self.pool = pool
+        self.task = asyncio.current_task()
+        self.conn: DBConnection | None = None
+        self.closed = False
+
+    def owns_current_task(self) -> bool:
+        return not self.closed and asyncio.current_task() is self.task
+
+    async def connection(self) -> DBConnection:
+        if self.conn is None:
+            self.conn = await self.pool.acquire()
+        return self.conn
+
+    def acquire(self) -> _Acquire:
+        return _Acquire(self)
+
+    async def release(self, conn):
+        if conn is not self.conn:
+            await self.pool.release(conn)
+
+    async def execute(self, query: str, *args, **kwargs):
+        conn = await self.connection()
+        return await conn.execute(query, *args, **kwargs)
+
+    async def fetch(self, query: str, *args, **kwargs):
+        conn = await self.connection()
+        return await conn.fetch(query, *args, **kwargs)
+
+    async def fetchrow(self, query: str, *args, **kwargs):
+        conn = await self.connection()
+        return await conn.fetchrow(query, *args, **kwargs)
+
+    async def fetchval(self, query: str, *args, **kwargs):
+        conn = await self.connection()
+        return await conn.fetchval(query, *args, **kwargs)
+
+    async def close(self):
+        self.closed = True
+        if self.conn is not None:
+            conn, self.conn = self.conn, None
+            await self.pool.release(conn)
+
+
+def current_unit_of_work() -> UnitOfWork | None:
+    uow = _current.get()
+    if uow is not None and uow.owns_current_task():
+        return uow
+    return None
+
+
+@asynccontextmanager
+async def unit_of_work():
+    existing = current_unit_of_work()
+    if existing is not None:
+        yield existing
+        return
+    from src.db.database import get_pool
+    uow = UnitOfWork(await get_pool())
+    token = _current.set(uow)
+    try:
+        yield uow
+    finally:
+        _current.reset(token)
+        await uow.close()
+
+
+@asynccontextmanager
+async def transaction():
+    async with unit_of_work() as uow:
+        conn = await uow.connection()
+        async with conn.transaction():
+            yield conn
@@ -166,3 +166,35 @@ async def get_admin_user_profile_data(telegram_id: int) -> dict | None:
             telegram_id
         )
         return dict(row) if row else None
+
+
+async def deactivate_users(telegram_ids: list[int]) -> int:
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        result = await conn.execute(
+            "UPDATE users SET is_active = 0 WHERE telegram_id = ANY($1::bigint[]) AND is_active = 1",
+            telegram_ids
+        )
+        return int(result.split()[-1])
+
+
+async def reactivate_user(telegram_id: int):
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        await conn.execute(
+            "UPDATE users SET is_active = 1 WHERE telegram_id = $1 AND is_active = 0",
+            telegram_id
+        )
+
+
+async def get_recent_buyer_ids(days: int) -> list[int]:
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(
+            """SELECT DISTINCT o.user_id FROM orders o
+               JOIN users u ON u.telegram_id = o.user_id
+               WHERE o.created_at > NOW() - make_interval(days => $1)
+                 AND u.is_active = 1 AND u.is_blocked = 0""",
+            days
+        )
+        return [r["user_id"] for r in rows]
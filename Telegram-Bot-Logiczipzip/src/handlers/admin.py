@@ -1,3 +1,4 @@
+import html
 import logging
 
 from aiogram import Router, F
@@ -9,6 +10,7 @@ from aiogram.exceptions import TelegramBadRequest
 logger = logging.getLogger(__name__)
 
 from src.db.admins import get_admin_ids, add_admin, remove_admin, is_admin, is_owner, get_all_admins, get_admin_stats
+from src.db.staff import Roles
 from datetime import datetime, timedelta
 import re
 import asyncio
@@ -26,11 +28,11 @@ from src.states.admin_states import (
 from src.db.categories import (
     get_all_categories, get_category, create_category, delete_category,
     rename_category, update_category_price, toggle_category_status,
-    update_category_max_signatures,
+    update_category_max_signatures, update_category_bb_price,
 )
 from src.db.accounts import (
     get_all_accounts, get_account, delete_account, parse_accounts_text,
-    bulk_add_accounts, search_accounts_by_phone, get_account_signatures,
+    import_accounts, search_accounts_by_phone, get_account_signatures,
     get_total_accounts_count, update_account_signature_max, set_account_priority,
     bulk_update_all_signature_max, reset_account_availability, reset_all_accounts_availability,
     assign_operator_to_account, bulk_assign_operator, get_accounts_availability, get_stats_by_date,
@@ -54,6 +56,8 @@ from src.db.users import (
 )
 from src.db.settings import get_deposit_amount, set_deposit_amount, has_user_deposit, get_user_deposit_amount, is_bot_paused, set_bot_paused, get_totp_limit, set_totp_limit, get_ticket_limit, set_ticket_limit, get_review_bonus, set_review_bonus, delete_user_deposit, has_actual_deposit, is_deposit_required
 from src.db.database import get_pool
+from src.db.inventory import update_signatures
+from src.storage.memory import FSMEntryTooLarge
 from src.keyboards.admin_kb import (
     admin_menu_kb, admin_categories_kb, admin_category_detail_kb,
     admin_accounts_menu_kb, admin_accounts_list_kb, admin_account_detail_kb,
@@ -74,7 +78,10 @@ from src.db.reputation import get_all_reputation_links, get_reputation_link, add
 from src.db.reviews import get_all_reviews, get_review, delete_review
 from src.db.settings import is_admin_notifications_enabled, set_admin_notifications, get_faq_text, set_faq_text
 from src.db.documents import get_pending_doc_requests, get_order_doc_count, get_order_documents
+from src.db.leases import get_job_leases
+from src.db.jobs import get_job_queue_stats
 from src.utils.formatters import format_order_status, get_category_emoji
+from src.utils.outbox import get_outbox_stats
 
 router = Router()
 
@@ -98,12 +105,12 @@ class AdminFilter:
 
 
 @router.message(Command("admin"))
-async def cmd_admin(message: Message, state: FSMContext):
-    if not await AdminFilter.check(message.from_user.id):
+async def cmd_admin(message: Message, state: FSMContext, roles: Roles):
+    if not roles.is_admin:
         return
     await state.clear()
     paused = await is_bot_paused()
-    owner = await is_owner(message.from_user.id)
+    owner = roles.is_owner
     status = "⏸ Приостановлен" if paused else "✅ В работе"
     await message.answer(
         f"⚙️ <b>Панель администратора</b>\n\n"
@@ -114,13 +121,47 @@ async def cmd_admin(message: Message, state: FSMContext):
     )
 
 
+@router.message(Command("jobs"))
+async def cmd_jobs(message: Message, roles: Roles):
+    if not roles.is_admin:
+        return
+    leases = await get_job_leases()
+    queue = await get_job_queue_stats()
+    outbox = get_outbox_stats()
+    lines = [
+        "📬 <b>Очередь задач</b>: "
+        f"в очереди {queue.get('queued', 0)}, выполняется {queue.get('running', 0)}, "
+        f"ошибок {queue.get('failed', 0)}, готово {queue.get('done', 0)}",
+        "✉️ <b>Исходящие сообщения</b>: "
+        f"в очереди {outbox['queued_user']} польз. / {outbox['queued_staff']} персонал "
+        f"({outbox['chats']} чатов, отправляется {outbox['in_flight']}), "
+        f"отправлено {outbox['sent']}, повторов {outbox['retried']}, ошибок {outbox['failed']}, "
+        f"задержка ср. {outbox['latency_avg']:.1f} с / p95 {outbox['latency_p95']:.1f} с\n",
+        "⚙️ <b>Фоновые задачи</b>\n",
+    ]
+    if not leases:
+        lines.append("Фоновые задачи ещё не запускались.")
+    for job in leases:
+        avg_ms = job["total_duration_ms"] // job["runs"] if job["runs"] else 0
+        heartbeat = job["heartbeat_at"].strftime("%d.%m %H:%M:%S") if job["heartbeat_at"] else "—"
+        lines.append(
+            f"<b>{job['name']}</b>\n"
+            f"  Лидер: <code>{job['leader'] or '—'}</code> (пульс {heartbeat})\n"
+            f"  Запусков: {job['runs']}, ошибок: {job['failures']}, "
+            f"последний: {job['last_duration_ms'] or 0} мс, средний: {avg_ms} мс"
+        )
+        if job["last_error"]:
+            lines.append(f"  Последняя ошибка: <code>{html.escape(job['last_error'][:200])}</code>")
+    await message.answer("\n".join(lines), parse_mode="HTML")
+
+
 @router.callback_query(F.data == "admin_menu")
-async def admin_menu(callback: CallbackQuery, state: FSMContext):
-    if not await AdminFilter.check(callback.from_user.id):
+async def admin_menu(callback: CallbackQuery, state: FSMContext, roles: Roles):
+    if not roles.is_admin:
         return
     await state.clear()
     paused = await is_bot_paused()
-    owner = await is_owner(callback.from_user.id)
+    owner = roles.is_owner
     status = "⏸ Приостановлен" if paused else "✅ В работе"
     try:
         await callback.message.edit_text(
@@ -438,6 +479,7 @@ async def admin_add_accounts(callback: CallbackQuery, state: FSMContext):
         "Формат 2 (из Excel):\n"
         "<code>1\n9053533283\nPompa65!\n3WU6ES3TYAU2YBK6GC2AJLR5A7MTQGT6</code>\n\n"
         "<code>2\n9053532725\nPompa65!\n46MTPWLJKDTKWVQ4BCDSHBISL5MEUOPC</code>\n\n"
+        "Можно отправить текстом или файлом <b>.txt</b> / <b>.csv</b> / <b>.xlsx</b> (до 20 МБ).\n"
         "Каждый аккаунт будет распределён на все категории.",
         parse_mode="HTML",
     )
@@ -445,11 +487,40 @@ async def admin_add_accounts(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
 
+@router.message(AdminAccountStates.waiting_bulk_data, F.document)
+async def process_bulk_accounts_document(message: Message, state: FSMContext):
+    if not await AdminFilter.check(message.from_user.id):
+        return
+    from src.utils.account_import import document_extension, import_accounts_document, MAX_DOCUMENT_SIZE
+    extension = document_extension(message.document)
+    if extension is None:
+        await message.answer(
+            "❌ Поддерживаются файлы <b>.txt</b>, <b>.csv</b> и <b>.xlsx</b>.",
+            parse_mode="HTML",
+        )
+        return
+    if (message.document.file_size or 0) > MAX_DOCUMENT_SIZE:
+        await message.answer("❌ Файл больше 20 МБ — разделите его на части.")
+        return
+    from src.bot.instance import bot
+    try:
+        added_ids = await import_accounts_document(bot, message, extension, message.from_user.id)
+    except Exception as e:
+        logger.error(f"ACCOUNT_IMPORT: {message.document.file_name} failed: {e}", exc_info=True)
+        await message.answer("❌ Ошибка при импорте файла. Уже загруженные части сохранены.")
+        return
+    if not added_ids:
+        await message.answer("⚠️ Новых аккаунтов в файле не найдено.")
+        await state.clear()
+        return
+    await _after_accounts_added(message, state, added_ids)
+
+
 @router.message(AdminAccountStates.waiting_bulk_data)
 async def process_bulk_accounts(message: Message, state: FSMContext):
     if not await AdminFilter.check(message.from_user.id):
         return
-    accounts_data = parse_accounts_text(message.text)
+    accounts_data = parse_accounts_text(message.text or "")
     if not accounts_data:
         await message.answer(
             "❌ Не удалось распознать ни одного аккаунта.\n\n"
@@ -457,8 +528,45 @@ async def process_bulk_accounts(message: Message, state: FSMContext):
             parse_mode="HTML",
         )
         return
-    added, added_ids = await bulk_add_accounts(accounts_data, added_by_admin_id=message.from_user.id)
-    await state.update_data(last_added_count=added, added_ids=added_ids)
+    result = await import_accounts(accounts_data, added_by_admin_id=message.from_user.id)
+    added_ids = result["added_ids"]
+    added = len(added_ids)
+    note = f"♻️ Пропущено дубликатов: <b>{len(result['duplicates'])}</b>\n" if result["duplicates"] else ""
+    if not added:
+        await message.answer(
+            f"⚠️ Новых аккаунтов нет — все номера уже есть в базе.\n\n{note}",
+            parse_mode="HTML",
+        )
+        await state.clear()
+        return
+    await _after_accounts_added(message, state, added_ids, note)
+
+
+def _pack_id_ranges(ids: list[int]) -> list[list[int]]:
+    ranges: list[list[int]] = []
+    for account_id in sorted(set(ids)):
+        if ranges and ranges[-1][1] + 1 == account_id:
+            ranges[-1][1] = account_id
+        else:
+            ranges.append([account_id, account_id])
+    return ranges
+
+
+def _unpack_id_ranges(ranges: list[list[int]]) -> list[int]:
+    return [account_id for start, end in ranges for account_id in range(start, end + 1)]
+
+
+async def _remember_added_ids(state: FSMContext, added_ids: list[int]):
+    try:
+        await state.update_data(last_added_count=len(added_ids), added_ranges=_pack_id_ranges(added_ids))
+    except FSMEntryTooLarge as e:
+        logger.warning(f"ACCOUNT_IMPORT: not keeping {len(added_ids)} added ids in FSM: {e}")
+        await state.update_data(last_added_count=len(added_ids), added_ranges=[])
+
+
+async def _after_accounts_added(message: Message, state: FSMContext, added_ids: list[int], note: str = ""):
+    added = len(added_ids)
+    await _remember_added_ids(state, added_ids)
     operators = await get_all_operators()
     order_ops = [op for op in operators if op.get("role") == "orders"]
     if order_ops:
@@ -472,24 +580,25 @@ async def process_bulk_accounts(message: Message, state: FSMContext):
         buttons.append([InlineKeyboardButton(text="⏩ Пропустить", callback_data="skip_assign_after_add")])
         kb = InlineKeyboardMarkup(inline_keyboard=buttons)
         await message.answer(
-            f"✅ Добавлено аккаунтов: <b>{added}</b> (выключены)\n\n"
+            f"✅ Добавлено аккаунтов: <b>{added}</b> (выключены)\n"
+            f"{note}\n"
             f"👷 Назначить оператора на добавленные аккаунты?",
             reply_markup=kb,
             parse_mode="HTML",
         )
     else:
-        await _show_enable_options(message, added, added_ids, state, use_answer=True)
+        await _show_enable_options(message, added, state, use_answer=True, note=note)
 
 
-async def _show_enable_options(target, added: int, added_ids: list[int], state: FSMContext, use_answer: bool = False):
-    await state.update_data(added_ids=added_ids, last_added_count=added)
+async def _show_enable_options(target, added: int, state: FSMContext, use_answer: bool = False, note: str = ""):
     kb = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="✅ Включить все", callback_data="enable_all_added")],
         [InlineKeyboardButton(text="📋 Включить по списку", callback_data="enable_by_list_added")],
         [InlineKeyboardButton(text="⏩ Оставить выключенными", callback_data="skip_enable_added")],
     ])
     text = (
-        f"✅ Добавлено аккаунтов: <b>{added}</b> (выключены)\n\n"
+        f"✅ Добавлено аккаунтов: <b>{added}</b> (выключены)\n"
+        f"{note}\n"
         f"Выберите, какие аккаунты включить:"
     )
     if use_answer:
@@ -508,7 +617,6 @@ async def assign_after_add(callback: CallbackQuery, state: FSMContext):
     op_id = int(callback.data.split("assign_after_add_")[1])
     data = await state.get_data()
     count = data.get("last_added_count", 0)
-    added_ids = data.get("added_ids", [])
     if count > 0:
         assigned = await assign_operator_to_latest(op_id, count)
         op = await get_operator(op_id)
@@ -519,7 +627,7 @@ async def assign_after_add(callback: CallbackQuery, state: FSMContext):
         )
     else:
         await callback.message.edit_text("❌ Нет аккаунтов для назначения.", parse_mode="HTML")
-    await _show_enable_options(callback.message, count, added_ids, state, use_answer=True)
+    await _show_enable_options(callback.message, count, state, use_answer=True)
     await callback.answer()
 
 
@@ -529,8 +637,7 @@ async def skip_assign_after_add(callback: CallbackQuery, state: FSMContext):
         return
     data = await state.get_data()
     count = data.get("last_added_count", 0)
-    added_ids = data.get("added_ids", [])
-    await _show_enable_options(callback.message, count, added_ids, state)
+    await _show_enable_options(callback.message, count, state)
     await callback.answer()
 
 
@@ -539,7 +646,7 @@ async def enable_all_added(callback: CallbackQuery, state: FSMContext):
     if not await AdminFilter.check(callback.from_user.id):
         return
     data = await state.get_data()
-    added_ids = data.get("added_ids", [])
+    added_ids = _unpack_id_ranges(data.get("added_ranges", []))
     if not added_ids:
         await state.clear()
         await callback.answer("❌ Данные о загруженных аккаунтах утеряны. Включите вручную в разделе аккаунтов.", show_alert=True)
@@ -559,10 +666,8 @@ async def enable_all_added(callback: CallbackQuery, state: FSMContext):
     )
     await callback.answer()
     if enabled > 0:
-        import asyncio
-        from src.utils.preorders import run_preorder_fulfillment
-        from src.bot.instance import get_bot
-        asyncio.create_task(run_preorder_fulfillment(get_bot()))
+        from src.utils.preorders import wake_preorders
+        wake_preorders()
 
 
 @router.callback_query(F.data == "enable_by_list_added")
@@ -570,7 +675,7 @@ async def enable_by_list_added(callback: CallbackQuery, state: FSMContext):
     if not await AdminFilter.check(callback.from_user.id):
         return
     data = await state.get_data()
-    if not data.get("added_ids"):
+    if not data.get("added_ranges"):
         await callback.answer("❌ Данные о загруженных аккаунтах утеряны. Включите вручную в разделе аккаунтов.", show_alert=True)
         return
     await state.set_state(AdminEnableAccountsStates.waiting_phone_list)
@@ -588,7 +693,7 @@ async def process_enable_phone_list(message: Message, state: FSMContext):
     if not await AdminFilter.check(message.from_user.id):
         return
     data = await state.get_data()
-    added_ids = data.get("added_ids", [])
+    added_ids = _unpack_id_ranges(data.get("added_ranges", []))
     import re as _re
     raw_phones = [line.strip() for line in message.text.strip().split("\n") if line.strip()]
     phones = list(dict.fromkeys(_re.sub(r"[^\d]", "", p) for p in raw_phones if _re.sub(r"[^\d]", "", p)))
@@ -611,10 +716,8 @@ async def process_enable_phone_list(message: Message, state: FSMContext):
         parse_mode="HTML",
     )
     if enabled > 0:
-        import asyncio
-        from src.utils.preorders import run_preorder_fulfillment
-        from src.bot.instance import get_bot
-        asyncio.create_task(run_preorder_fulfillment(get_bot()))
+        from src.utils.preorders import wake_preorders
+        wake_preorders()
 
 
 @router.callback_query(F.data == "skip_enable_added")
@@ -678,10 +781,8 @@ async def mass_enable_all(callback: CallbackQuery, state: FSMContext):
     )
     await callback.answer()
     if enabled > 0:
-        import asyncio
-        from src.utils.preorders import run_preorder_fulfillment
-        from src.bot.instance import get_bot
-        asyncio.create_task(run_preorder_fulfillment(get_bot()))
+        from src.utils.preorders import wake_preorders
+        wake_preorders()
 
 
 @router.callback_query(F.data == "mass_enable_by_list")
@@ -723,10 +824,8 @@ async def process_mass_enable_phone_list(message: Message, state: FSMContext):
         parse_mode="HTML",
     )
     if enabled > 0:
-        import asyncio
-        from src.utils.preorders import run_preorder_fulfillment
-        from src.bot.instance import get_bot
-        asyncio.create_task(run_preorder_fulfillment(get_bot()))
+        from src.utils.preorders import wake_preorders
+        wake_preorders()
 
 
 @router.callback_query(F.data == "admin_mass_disable")
@@ -1979,19 +2078,17 @@ async def _do_cancel_active_order(order_id: int, refund_amount: float):
                 order_id
             )
             if account_id and category_id and unused > 0:
-                await conn.execute(
-                    """UPDATE account_signatures 
-                       SET used_signatures = GREATEST(used_signatures - $1, 0),
-                           reserved_by = NULL,
-                           reserved_until = NULL
-                       WHERE account_id = $2 AND category_id = $3""",
+                await update_signatures(
+                    conn,
+                    "used_signatures = GREATEST(s.used_signatures - $1, 0), reserved_by = NULL, reserved_until = NULL",
+                    "s.account_id = $2 AND s.category_id = $3",
                     unused, account_id, category_id
                 )
             elif account_id:
-                await conn.execute(
-                    """UPDATE account_signatures 
-                       SET reserved_by = NULL, reserved_until = NULL
-                       WHERE account_id = $1""",
+                await update_signatures(
+                    conn,
+                    "reserved_by = NULL, reserved_until = NULL",
+                    "s.account_id = $1",
                     account_id
                 )
             if refund_amount > 0:
@@ -3642,13 +3739,8 @@ async def admin_toggle_pause(callback: CallbackQuery, state: FSMContext):
     if paused:
         await set_bot_paused(False)
         await callback.answer("▶️ Бот возобновлён. Покупки включены.", show_alert=True)
-        users = await get_all_users()
         from src.bot.instance import bot
-        for u in users:
-            try:
-                await bot.send_message(u["telegram_id"], "✅ Бот возобновил работу!", parse_mode="HTML")
-            except Exception:
-                pass
+        from src.utils.broadcasts import start_broadcast
         owner = await is_owner(callback.from_user.id)
         try:
             await callback.message.edit_text(
@@ -3660,6 +3752,8 @@ async def admin_toggle_pause(callback: CallbackQuery, state: FSMContext):
             )
         except TelegramBadRequest:
             pass
+        status = await callback.message.answer("📢 <b>Рассылка...</b>\n\n⏳ Отправка сообщений...", parse_mode="HTML")
+        await start_broadcast(bot, "✅ Бот возобновил работу!", callback.from_user.id, status.chat.id, status.message_id)
     else:
         await callback.message.edit_text(
             "⏸ <b>Приостановка бота</b>\n\n"
@@ -3677,28 +3771,19 @@ async def admin_pause_reason(message: Message, state: FSMContext):
     reason = message.text.strip() if message.text else "-"
     await state.clear()
     await set_bot_paused(True)
-    users = await get_all_users()
     from src.bot.instance import bot
+    from src.utils.broadcasts import start_broadcast
     if reason == "-":
         broadcast_text = "❌ Бот приостановлен."
     else:
         broadcast_text = f"❌ Бот приостановлен. Причина: {reason}"
-    sent = 0
-    for u in users:
-        try:
-            await bot.send_message(u["telegram_id"], broadcast_text, parse_mode="HTML")
-            sent += 1
-        except Exception:
-            pass
-    paused = await is_bot_paused()
-    owner = await is_owner(message.from_user.id)
-    await message.answer(
+    status = await message.answer(
         f"⏸ <b>Бот приостановлен</b>\n\n"
-        f"📢 Рассылка отправлена: {sent} пользователям\n"
+        f"📢 Рассылка запущена...\n"
         f"💬 Причина: {reason if reason != '-' else 'не указана'}",
-        reply_markup=admin_menu_kb(paused, show_admin_mgmt=owner),
         parse_mode="HTML",
     )
+    await start_broadcast(bot, broadcast_text, message.from_user.id, status.chat.id, status.message_id)
 
 
 @router.callback_query(F.data == "admin_broadcast")
@@ -3720,10 +3805,11 @@ async def process_broadcast_message(message: Message, state: FSMContext):
     if not await AdminFilter.check(message.from_user.id):
         return
     await state.update_data(broadcast_text=message.text)
-    users = await get_all_users()
+    from src.db.broadcasts import count_broadcast_recipients
+    recipients = await count_broadcast_recipients()
     await message.answer(
         f"📢 <b>Подтверждение рассылки</b>\n\n"
-        f"👥 Получателей: {len(users)}\n\n"
+        f"👥 Получателей: {recipients}\n\n"
         f"📝 Сообщение:\n{message.text}\n\n"
         f"Отправить?",
         reply_markup=InlineKeyboardMarkup(inline_keyboard=[
@@ -3744,30 +3830,14 @@ async def broadcast_confirm(callback: CallbackQuery, state: FSMContext):
     data = await state.get_data()
     text = data.get("broadcast_text", "")
     await state.clear()
-    users = await get_all_users()
     from src.bot.instance import bot
-    sent = 0
-    failed = 0
+    from src.utils.broadcasts import start_broadcast
     await callback.message.edit_text(
         "📢 <b>Рассылка...</b>\n\n⏳ Отправка сообщений...",
         parse_mode="HTML",
     )
     await callback.answer()
-    for u in users:
-        try:
-            await bot.send_message(u["telegram_id"], text, parse_mode="HTML")
-            sent += 1
-        except Exception:
-            failed += 1
-    paused = await is_bot_paused()
-    owner = await is_owner(callback.from_user.id)
-    await callback.message.edit_text(
-        f"📢 <b>Рассылка завершена!</b>\n\n"
-        f"✅ Отправлено: {sent}\n"
-        f"❌ Не доставлено: {failed}",
-        reply_markup=admin_menu_kb(paused, show_admin_mgmt=owner),
-        parse_mode="HTML",
-    )
+    await start_broadcast(bot, text, callback.from_user.id, callback.message.chat.id, callback.message.message_id)
 
 
 @router.callback_query(F.data.startswith("admin_op_role_"))
@@ -4050,12 +4120,7 @@ async def process_bb_price(message: Message, state: FSMContext):
         return
     data = await state.get_data()
     cat_id = data["bb_price_cat_id"]
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        if price == 0:
-            await conn.execute("UPDATE categories SET bb_price = NULL WHERE id = $1", cat_id)
-        else:
-            await conn.execute("UPDATE categories SET bb_price = $1 WHERE id = $2", price, cat_id)
+    await update_category_bb_price(cat_id, price if price > 0 else None)
     await state.clear()
     result_text = f"{price:.2f}$" if price > 0 else "убрана"
     await message.answer(f"✅ Цена ББ обновлена: {result_text}", parse_mode="HTML")
@@ -179,8 +179,7 @@ async def confirm_complete_order(callback: CallbackQuery):
     await callback.answer()
     try:
         bot = get_bot()
-        from src.db.admins import get_admin_ids
-        from src.db.settings import is_admin_notifications_enabled
+        from src.db.admins import get_notified_admin_ids
         from src.handlers.sim_sign import get_target_operator_ids
         user_name = callback.from_user.username or callback.from_user.full_name or str(callback.from_user.id)
         cat_name = order.get("category_name", "—")
@@ -204,13 +203,11 @@ async def confirm_complete_order(callback: CallbackQuery):
                 await bot.send_message(op_id, notify_text, parse_mode="HTML")
             except Exception:
                 pass
-        for admin_id in await get_admin_ids():
-            notify_enabled = await is_admin_notifications_enabled(admin_id)
-            if notify_enabled:
-                try:
-                    await bot.send_message(admin_id, notify_text, parse_mode="HTML")
-                except Exception:
-                    pass
+        for admin_id in await get_notified_admin_ids():
+            try:
+                await bot.send_message(admin_id, notify_text, parse_mode="HTML")
+            except Exception:
+                pass
     except Exception:
         pass
 
@@ -1,91 +1,129 @@
 import asyncio
 import json
 import logging
+import time
 
-from src.utils.cryptobot import check_invoice_paid
-from src.db.payments import get_payment_by_invoice, update_payment_status, confirm_balance_payment
+from src.utils.cryptobot import get_invoice_statuses
+from src.db.payments import get_payment_by_invoice, claim_order_payment, confirm_balance_payment, expire_payments
 from src.db.users import update_balance
+from src.db.jobs import enqueue_job
+from src.db.uow import transaction
+from src.config import CRYPTO_WEBHOOK_PATH
+from src.utils.outbox import enqueue
+from src.utils.taskqueue import register_job_handler, enqueue_notification, enqueue_notifications
 
 logger = logging.getLogger(__name__)
 
-_active_checks: dict[int, asyncio.Task] = {}
-_payment_semaphore = asyncio.Semaphore(30)
+POLL_INTERVAL = 60 if CRYPTO_WEBHOOK_PATH else 5
+PAYMENT_TTL = 1800
+
+_pending: dict[int, float] = {}
 
 
 async def start_payment_check(invoice_id: int):
-    if invoice_id in _active_checks:
+    if invoice_id in _pending:
         return
-    task = asyncio.create_task(_poll_payment(invoice_id))
-    _active_checks[invoice_id] = task
+    _pending[invoice_id] = time.monotonic() + PAYMENT_TTL
 
 
-async def _poll_payment(invoice_id: int):
-    async with _payment_semaphore:
-        await _poll_payment_inner(invoice_id)
+async def accept_paid_invoice(invoice_id: int):
+    await enqueue_job("invoice_paid", f"invoice_paid:{invoice_id}", {"invoice_id": invoice_id})
+    _pending.pop(invoice_id, None)
 
 
-async def _poll_payment_inner(invoice_id: int):
-    try:
-        for attempt in range(360):
-            await asyncio.sleep(5)
-            is_paid = await check_invoice_paid(invoice_id)
-            if is_paid:
-                payment = await get_payment_by_invoice(invoice_id)
-                if not payment:
-                    logger.error(f"PAY_POLL: invoice={invoice_id} paid but payment record not found!")
-                    break
-                if payment["status"] != "pending":
-                    logger.info(f"PAY_POLL: invoice={invoice_id} already processed (status={payment['status']})")
-                    break
-                purpose = payment.get("purpose", "balance")
-                if purpose == "order":
-                    await update_payment_status(invoice_id, "paid")
-                    logger.info(f"PAY_POLL: invoice={invoice_id} order payment confirmed, user={payment['user_id']}")
-                    await _process_order_payment(payment)
-                else:
-                    success = await confirm_balance_payment(invoice_id, payment["user_id"], payment["amount"])
-                    if success:
-                        logger.info(f"PAY_POLL: invoice={invoice_id} balance +{payment['amount']} for user={payment['user_id']} — SUCCESS")
-                        try:
-                            from src.bot.instance import bot
-                            await bot.send_message(
-                                payment["user_id"],
-                                f"✅ <b>Баланс пополнен!</b>\n\n"
-                                f"💵 Сумма: {payment['amount']:.2f} USDT\n\n"
-                                f"Средства зачислены на ваш баланс.",
-                                parse_mode="HTML",
-                            )
-                        except Exception as e:
-                            logger.warning(f"PAY_POLL: invoice={invoice_id} balance credited but notification failed: {e}")
-                    else:
-                        logger.warning(f"PAY_POLL: invoice={invoice_id} confirm_balance_payment returned False for user={payment['user_id']}")
-                break
-        else:
-            payment = await get_payment_by_invoice(invoice_id)
-            if payment and payment["status"] == "pending":
-                await update_payment_status(invoice_id, "expired")
-                logger.info(f"PAY_POLL: invoice={invoice_id} expired after 30min, purpose={payment.get('purpose')}")
-                if payment.get("purpose") == "order":
-                    try:
-                        from src.bot.instance import bot
-                        await bot.send_message(
-                            payment["user_id"],
-                            "⏰ <b>Время оплаты истекло.</b>\n\n"
-                            "Счёт на оплату заказа больше не действителен.\n"
-                            "Вы можете оформить заказ заново.",
-                            parse_mode="HTML",
-                        )
-                    except Exception:
-                        pass
-    except asyncio.CancelledError:
-        pass
-    except Exception as e:
-        logger.error(f"Payment check error for invoice {invoice_id}: {e}", exc_info=True)
-    finally:
-        _active_checks.pop(invoice_id, None)
+async def payment_poller():
+    while True:
+        await asyncio.sleep(POLL_INTERVAL)
+        try:
+            await _poll_pending()
+        except Exception as e:
+            logger.error(f"PAY_POLL: tick failed: {e}", exc_info=True)
+
+
+async def _poll_pending():
+    if not _pending:
+        return
+    invoice_ids = list(_pending)
+    statuses = await get_invoice_statuses(invoice_ids)
+    now = time.monotonic()
+    stale = []
+    for invoice_id in invoice_ids:
+        status = statuses.get(invoice_id)
+        if status == "paid":
+            await accept_paid_invoice(invoice_id)
+        elif status == "expired" or _pending.get(invoice_id, now) <= now:
+            _pending.pop(invoice_id, None)
+            stale.append(invoice_id)
+    if stale:
+        await _expire_stale(stale)
+
+
+async def _run_paid_invoice_job(payload: dict):
+    await _handle_paid_invoice(payload["invoice_id"])
+
+
+async def _handle_paid_invoice(invoice_id: int):
+    payment = await get_payment_by_invoice(invoice_id)
+    if not payment:
+        logger.error(f"PAY_POLL: invoice={invoice_id} paid but payment record not found!")
+        return
+    if payment["status"] != "pending":
+        logger.info(f"PAY_POLL: invoice={invoice_id} already processed (status={payment['status']})")
+        return
+    purpose = payment.get("purpose", "balance")
+    if purpose == "order":
+        async with transaction():
+            payment = await claim_order_payment(invoice_id)
+            if payment:
+                await enqueue_job("order_payment", f"order_payment:{invoice_id}", {"invoice_id": invoice_id})
+        if not payment:
+            logger.info(f"PAY_POLL: invoice={invoice_id} order payment already claimed")
+            return
+        logger.info(f"PAY_POLL: invoice={invoice_id} order payment confirmed, user={payment['user_id']}")
+        return
+    async with transaction():
+        success = await confirm_balance_payment(invoice_id, payment["user_id"], payment["amount"])
+        if success:
+            await enqueue_notification(
+                payment["user_id"],
+                f"✅ <b>Баланс пополнен!</b>\n\n"
+                f"💵 Сумма: {payment['amount']:.2f} USDT\n\n"
+                f"Средства зачислены на ваш баланс.",
+                f"balance_paid:{invoice_id}",
+            )
+    if not success:
+        logger.warning(f"PAY_POLL: invoice={invoice_id} confirm_balance_payment returned False for user={payment['user_id']}")
+        return
+    logger.info(f"PAY_POLL: invoice={invoice_id} balance +{payment['amount']} for user={payment['user_id']} — SUCCESS")
+
+
+async def _expire_stale(invoice_ids: list[int]):
+    expired = await expire_payments(invoice_ids)
+    if not expired:
+        return
+    logger.info(f"PAY_POLL: expired {len(expired)} invoices after 30min")
+    for payment in expired:
+        if payment["purpose"] != "order":
+            continue
+        enqueue(
+            payment["user_id"],
+            "⏰ <b>Время оплаты истекло.</b>\n\n"
+            "Счёт на оплату заказа больше не действителен.\n"
+            "Вы можете оформить заказ заново.",
+            parse_mode="HTML",
+        )
+
+
+async def _run_order_payment_job(payload: dict):
+    payment = await get_payment_by_invoice(payload["invoice_id"])
+    if not payment or payment["status"] != "paid":
+        logger.error(f"PAY_ORDER: invoice={payload['invoice_id']} job found no paid payment")
+        return
+    await _process_order_payment(payment)
 
 
 async def _process_order_payment(payment: dict):
+    key = f"order_payment:{payment['invoice_id']}"
     try:
         meta = json.loads(payment.get("payment_meta", "{}"))
     except (json.JSONDecodeError, TypeError):
@@ -98,57 +136,51 @@ async def _process_order_payment(payment: dict):
     custom_op = meta.get("custom_operator_name")
     is_bb = meta.get("is_bb", False)
 
-    from src.bot.instance import bot
     from src.db.categories import get_category
-    from src.db.accounts import try_reserve_account, try_reserve_account_exclusive, try_reserve_accounts_multi
-    from src.db.orders import create_order, create_preorder, get_order
-    from src.db.settings import is_admin_notifications_enabled
+    from src.db.users import get_user
     from src.db.operators import get_order_operator_ids
-    from src.db.admins import get_admin_ids
+    from src.db.admins import get_notified_admin_ids
     from src.utils.formatters import format_order_card_admin
     from src.keyboards.user_kb import order_detail_kb, go_to_orders_kb
 
     category = await get_category(category_id)
     if not category:
         await update_balance(payment["user_id"], payment["amount"])
-        try:
-            await bot.send_message(
-                payment["user_id"],
-                "❌ Категория не найдена. Средства зачислены на баланс.",
-                parse_mode="HTML",
-            )
-        except Exception:
-            pass
+        await enqueue_notification(
+            payment["user_id"],
+            "❌ Категория не найдена. Средства зачислены на баланс.",
+            f"{key}:refund",
+        )
         return
 
     user_id = payment["user_id"]
     total_price = payment["amount"]
-    order_id = None
-    orders_created = []
 
+    from src.db.purchases import purchase
     if is_bb:
-        from src.db.orders import generate_batch_group_id
         bb_pack_qty = meta.get("bb_pack_qty", 1)
-        bb_price = category.get("bb_price", total_price / bb_pack_qty if bb_pack_qty > 0 else total_price)
-        max_sigs = category.get("max_signatures", 1)
-        bg_id = generate_batch_group_id() if bb_pack_qty > 1 else None
-        bb_order_ids = []
-        bb_preorder_ids = []
-        try:
-            for _ in range(bb_pack_qty):
-                account = await try_reserve_account_exclusive(category_id, user_id)
-                if not account:
-                    oid = await create_preorder(user_id, category_id, bb_price, max_sigs, is_exclusive=True, batch_group_id=bg_id)
-                    bb_preorder_ids.append(oid)
-                else:
-                    batch_size = account.get("batch_size", max_sigs)
-                    oid = await create_order(user_id, account["id"], category_id, bb_price, batch_size, is_exclusive=True, batch_group_id=bg_id)
-                    bb_order_ids.append(oid)
-        except Exception:
-            created_count = len(bb_order_ids) + len(bb_preorder_ids)
-            refund = bb_price * (bb_pack_qty - created_count)
-            if refund > 0:
-                await update_balance(user_id, refund)
+        units = bb_pack_qty if bb_pack_qty > 0 else 1
+    else:
+        units = qty
+    try:
+        result = await purchase(
+            user_id, category_id, units, total_price / units, charge=False,
+            exclusive=is_bb, custom_operator_name=None if is_bb else custom_op,
+        )
+    except Exception as e:
+        logger.error(f"PAY_ORDER: purchase failed for user={user_id}, cat={category_id}: {e}", exc_info=True)
+        await update_balance(user_id, total_price)
+        await enqueue_notification(
+            user_id,
+            "❌ Ошибка при создании заказа. Средства зачислены на баланс.",
+            f"{key}:refund",
+        )
+        return
+
+    orders_created = result["orders"]
+    if is_bb:
+        bb_order_ids = [o["id"] for o, _ in orders_created]
+        bb_preorder_ids = result["preorder_ids"]
         lines = [f"✅ <b>Оплата получена!</b>\n"]
         if bb_order_ids:
             ids_str = ", ".join(f"#{oid}" for oid in bb_order_ids)
@@ -163,160 +195,77 @@ async def _process_order_payment(payment: dict):
             lines.append(f"\n⏰ Для предзаказов ожидайте — заказы будут выполнены автоматически.")
         if bb_order_ids:
             lines.append(f"\n📝 Нажмите «📋 Мои заказы» чтобы начать работу.")
-        try:
-            await bot.send_message(user_id, "\n".join(lines), reply_markup=go_to_orders_kb(), parse_mode="HTML")
-        except Exception:
-            pass
-        for oid in bb_order_ids:
-            o = await get_order(oid)
-            if o:
-                orders_created.append((o, None))
-    elif order_type == "custom":
-        allocations = await try_reserve_accounts_multi(category_id, user_id, qty)
-        if not allocations:
-            order_id = await create_preorder(user_id, category_id, total_price, qty, custom_op)
-            try:
-                await bot.send_message(
-                    user_id,
-                    f"✅ <b>Оплата получена!</b>\n\n"
-                    f"⏳ <b>Предзаказ #{order_id} оформлен!</b>\n\n"
-                    f"📂 Категория: Любой другой\n"
-                    f"🏢 Оператор: <b>{custom_op}</b>\n"
-                    f"📊 Подписей: {qty}\n"
-                    f"💰 Сумма: {total_price:.2f}$\n\n"
-                    f"⏰ Как только аккаунт появится — заказ будет выполнен автоматически.",
-                    reply_markup=go_to_orders_kb(),
-                    parse_mode="HTML",
-                )
-            except Exception:
-                pass
-            return
-        from src.db.orders import generate_batch_group_id
-        bg_id = generate_batch_group_id() if len(allocations) > 1 else None
-        price_per = category.get("price", 0)
-        orders_created = []
-        for alloc in allocations:
-            aq = alloc["batch_size"]
-            ap = price_per * aq
-            oid = await create_order(user_id, alloc["id"], category_id, ap, aq, custom_op, batch_group_id=bg_id)
-            o = await get_order(oid)
-            orders_created.append((o, alloc))
-        await _send_multi_order_message(bot, user_id, orders_created, category, total_price, qty, custom_op=custom_op)
+        await enqueue_notification(user_id, "\n".join(lines), f"{key}:user", reply_markup=go_to_orders_kb())
+    elif result["preorder_ids"]:
+        order_id = result["preorder_ids"][0]
+        cat_label = "Любой другой" if order_type == "custom" else category['name']
+        custom_line = f"🏢 Оператор: <b>{custom_op}</b>\n" if order_type == "custom" else ""
+        await enqueue_notification(
+            user_id,
+            f"✅ <b>Оплата получена!</b>\n\n"
+            f"⏳ <b>Предзаказ #{order_id} оформлен!</b>\n\n"
+            f"📂 Категория: {cat_label}\n"
+            f"{custom_line}"
+            f"📊 Подписей: {qty}\n"
+            f"💰 Сумма: {total_price:.2f}$\n\n"
+            f"⏰ Как только аккаунт появится — заказ будет выполнен автоматически.",
+            f"{key}:user",
+            reply_markup=go_to_orders_kb(),
+        )
+        return
     else:
-        allocations = await try_reserve_accounts_multi(category_id, user_id, qty)
-        if not allocations:
-            order_id = await create_preorder(user_id, category_id, total_price, qty)
-            try:
-                await bot.send_message(
-                    user_id,
-                    f"✅ <b>Оплата получена!</b>\n\n"
-                    f"⏳ <b>Предзаказ #{order_id} оформлен!</b>\n\n"
-                    f"📂 Категория: {category['name']}\n"
-                    f"📊 Подписей: {qty}\n"
-                    f"💰 Сумма: {total_price:.2f}$\n\n"
-                    f"⏰ Как только аккаунт появится — заказ будет выполнен автоматически.",
-                    reply_markup=go_to_orders_kb(),
-                    parse_mode="HTML",
-                )
-            except Exception:
-                pass
-            return
-        from src.db.orders import generate_batch_group_id
-        bg_id = generate_batch_group_id() if len(allocations) > 1 else None
-        price_per = category.get("price", 0)
-        orders_created = []
-        for alloc in allocations:
-            aq = alloc["batch_size"]
-            ap = price_per * aq
-            oid = await create_order(user_id, alloc["id"], category_id, ap, aq, batch_group_id=bg_id)
-            o = await get_order(oid)
-            orders_created.append((o, alloc))
-        await _send_multi_order_message(bot, user_id, orders_created, category, total_price, qty)
-
-    all_orders = []
-    if orders_created:
-        all_orders = [o for o, _ in orders_created]
-
-    for o in all_orders:
-        try:
-            from src.db.referrals import process_referral_reward
-            result = await process_referral_reward(user_id, o['id'], o.get('price_paid', 0))
-            if result:
-                try:
-                    await bot.send_message(
-                        result['referrer_id'],
-                        f"💰 <b>Реферальный бонус!</b>\n\n"
-                        f"Ваш реферал совершил покупку.\n"
-                        f"Начислено: <b>+{result['reward']:.2f}$</b>",
-                        parse_mode="HTML",
-                    )
-                except Exception:
-                    pass
-        except Exception:
-            pass
+        await _send_multi_order_message(
+            key, user_id, orders_created, category, total_price, qty,
+            custom_op=custom_op if order_type == "custom" else None,
+        )
+
+    all_orders = [o for o, _ in orders_created]
+
+    for r in result["referrals"]:
+        await enqueue_notification(
+            r['referrer_id'],
+            f"💰 <b>Реферальный бонус!</b>\n\n"
+            f"Ваш реферал совершил покупку.\n"
+            f"Начислено: <b>+{r['reward']:.2f}$</b>",
+            f"{key}:referral:{r['order_id']}",
+        )
 
     if all_orders:
+        user = await get_user(user_id) or {}
+        user_name = user.get("username") or user.get("full_name") or str(user_id)
         try:
-            user_obj = await bot.get_chat(user_id)
-            user_name = user_obj.username or user_obj.full_name or str(user_id)
-            if is_bb and len(all_orders) >= 1:
+            if is_bb:
                 from src.utils.formatters import format_bb_batch_card_admin
                 notify_text = format_bb_batch_card_admin(all_orders, user_name)
-                for admin_id in await get_admin_ids():
-                    notify_enabled = await is_admin_notifications_enabled(admin_id)
-                    if notify_enabled:
-                        try:
-                            await bot.send_message(admin_id, notify_text, parse_mode="HTML")
-                        except Exception:
-                            pass
-                op_ids = await get_order_operator_ids()
-                for op_id in op_ids:
-                    try:
-                        await bot.send_message(op_id, notify_text, parse_mode="HTML")
-                    except Exception:
-                        pass
             else:
                 from src.utils.formatters import format_batch_card_admin
                 notify_text = format_batch_card_admin(all_orders, user_name)
-                for admin_id in await get_admin_ids():
-                    notify_enabled = await is_admin_notifications_enabled(admin_id)
-                    if notify_enabled:
-                        try:
-                            await bot.send_message(admin_id, notify_text, parse_mode="HTML")
-                        except Exception:
-                            pass
-                op_ids = await get_order_operator_ids()
-                for op_id in op_ids:
-                    try:
-                        await bot.send_message(op_id, notify_text, parse_mode="HTML")
-                    except Exception:
-                        pass
-        except Exception:
-            pass
-
-
-async def _send_multi_order_message(bot, user_id, orders_created, category, total_price, qty, custom_op=None):
+        except Exception as e:
+            logger.error(f"PAY_ORDER: staff card failed for user={user_id}: {e}", exc_info=True)
+            return
+        staff_ids = list(await get_notified_admin_ids()) + list(await get_order_operator_ids())
+        await enqueue_notifications(staff_ids, notify_text, f"{key}:staff")
+
+
+async def _send_multi_order_message(key, user_id, orders_created, category, total_price, qty, custom_op=None):
     from src.keyboards.user_kb import order_detail_kb, go_to_orders_kb
     if len(orders_created) == 1:
         order, alloc = orders_created[0]
         cat_label = f"Любой другой" if custom_op else category['name']
         custom_line = f"🏢 Оператор: <b>{custom_op}</b>\n" if custom_op else ""
-        try:
-            await bot.send_message(
-                user_id,
-                f"✅ <b>Оплата получена! Заказ #{order['id']} оформлен!</b>\n\n"
-                f"📂 Категория: {cat_label}\n"
-                f"{custom_line}"
-                f"📊 Оплачено подписей: {alloc['batch_size']}\n"
-                f"💰 Сумма: {total_price:.2f}$\n\n"
-                f"📱 Телефон: <code>{alloc['phone']}</code>\n\n"
-                f"Аккаунт закреплён за вами на 72ч.\n"
-                f"📝 Нажмите «Получить подпись» в заказе, чтобы начать.",
-                reply_markup=order_detail_kb(order),
-                parse_mode="HTML",
-            )
-        except Exception:
-            pass
+        await enqueue_notification(
+            user_id,
+            f"✅ <b>Оплата получена! Заказ #{order['id']} оформлен!</b>\n\n"
+            f"📂 Категория: {cat_label}\n"
+            f"{custom_line}"
+            f"📊 Оплачено подписей: {alloc['batch_size']}\n"
+            f"💰 Сумма: {total_price:.2f}$\n\n"
+            f"📱 Телефон: <code>{alloc['phone']}</code>\n\n"
+            f"Аккаунт закреплён за вами на 72ч.\n"
+            f"📝 Нажмите «Получить подпись» в заказе, чтобы начать.",
+            f"{key}:user",
+            reply_markup=order_detail_kb(order),
+        )
     else:
         cat_label = f"Любой другой" if custom_op else category['name']
         custom_line = f"🏢 Оператор: <b>{custom_op}</b>\n" if custom_op else ""
@@ -337,12 +286,13 @@ async def _send_multi_order_message(bot, user_id, orders_created, category, tota
             "Работайте с каждым заказом по очереди.\n"
             "Откройте заказ в разделе «📋 Мои заказы»."
         )
-        try:
-            await bot.send_message(
-                user_id,
-                "\n".join(lines),
-                reply_markup=go_to_orders_kb(),
-                parse_mode="HTML",
-            )
-        except Exception:
-            pass
+        await enqueue_notification(
+            user_id,
+            "\n".join(lines),
+            f"{key}:user",
+            reply_markup=go_to_orders_kb(),
+        )
+
+
+register_job_handler("invoice_paid", _run_paid_invoice_job)
+register_job_handler("order_payment", _run_order_payment_job)
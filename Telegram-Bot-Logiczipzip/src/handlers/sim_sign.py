@@ -1,16 +1,17 @@
 import asyncio
+import logging
 
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.context import FSMContext
 from aiogram.exceptions import TelegramBadRequest
 
-from src.db.admins import get_admin_ids, is_admin
+from src.db.admins import get_admin_ids, get_notified_admin_ids, is_admin
 from src.db.categories import get_all_categories, get_category, get_active_categories
-from src.db.accounts import try_reserve_account, try_reserve_account_exclusive, try_reserve_accounts_multi, get_available_count, get_account_operator
-from src.db.orders import create_order, create_preorder, get_order, increment_totp_refresh, update_order_status, claim_signature, is_order_expired, start_claim, clear_pending_claim
-from src.db.users import get_user, update_balance, is_user_blocked, get_user_deposit_required, get_user_totp_limit
-from src.db.settings import get_deposit_amount, has_user_deposit, is_bot_paused, is_admin_notifications_enabled, get_totp_limit, get_user_effective_deposit
+from src.db.accounts import try_reserve_account, get_available_count, get_account_operator
+from src.db.orders import get_order, increment_totp_refresh, update_order_status, claim_signature, is_order_expired, start_claim, clear_pending_claim
+from src.db.users import is_user_blocked, get_user_deposit_required, get_user_totp_limit
+from src.db.settings import get_deposit_amount, has_user_deposit, is_bot_paused, get_totp_limit, get_user_effective_deposit
 from src.db.operators import get_order_operator_ids, is_operator_notifications_enabled, get_order_operators_with_notifications
 from src.utils.formatters import format_account_data, format_account_data_no_totp, format_order_card_admin
 from src.keyboards.user_kb import (
@@ -18,26 +19,41 @@ from src.keyboards.user_kb import (
     quantity_picker_kb, claim_qty_kb, CATEGORY_EMOJI, CATEGORY_ORDER,
 )
 from src.states.user_states import OrderStates
+from src.utils.outbox import enqueue, enqueue_many
+
+logger = logging.getLogger(__name__)
 
 router = Router()
 
 
 
-async def _notify_referral(user_id: int, order_id: int, amount: float):
-    from src.db.referrals import process_referral_reward
-    result = await process_referral_reward(user_id, order_id, amount)
-    if result:
-        try:
-            from src.bot.instance import bot
-            await bot.send_message(
-                result['referrer_id'],
-                f"💰 <b>Реферальный бонус!</b>\n\n"
-                f"Ваш реферал совершил покупку.\n"
-                f"Начислено: <b>+{result['reward']:.2f}$</b>",
-                parse_mode="HTML",
-            )
-        except Exception:
-            pass
+async def _notify_referrals(referrals: list[dict]):
+    for result in referrals:
+        enqueue(
+            result['referrer_id'],
+            f"💰 <b>Реферальный бонус!</b>\n\n"
+            f"Ваш реферал совершил покупку.\n"
+            f"Начислено: <b>+{result['reward']:.2f}$</b>",
+            parse_mode="HTML",
+        )
+
+
+async def _purchase_or_alert(callback: CallbackQuery, category_id: int, qty: int, unit_price: float, **kwargs) -> dict | None:
+    from src.db.purchases import purchase
+    try:
+        result = await purchase(callback.from_user.id, category_id, qty, unit_price, **kwargs)
+    except Exception as e:
+        logger.error(f"PURCHASE_FAIL: user={callback.from_user.id}, cat={category_id}, qty={qty}: {e}", exc_info=True)
+        await callback.answer("❌ Ошибка при создании заказа. Средства не списаны.", show_alert=True)
+        return None
+    if result["status"] == "insufficient_funds":
+        await callback.answer(
+            f"❌ Недостаточно средств. Нужно: {result['total_price']:.2f}$. Пополните баланс.",
+            show_alert=True,
+        )
+        return None
+    await _notify_referrals(result["referrals"])
+    return result
 
 
 async def get_target_operator_ids(account_id: int | None) -> list[int]:
@@ -296,19 +312,12 @@ async def confirm_preorder(callback: CallbackQuery, state: FSMContext):
                 )
                 return
 
-    if total_price > 0:
-        user = await get_user(callback.from_user.id)
-        if not user or user.get("balance", 0) < total_price:
-            await callback.answer(
-                f"❌ Недостаточно средств. Нужно: {total_price:.2f}$.",
-                show_alert=True,
-            )
-            return
-        await update_balance(callback.from_user.id, -total_price)
-
     data = await state.get_data()
     custom_op = data.get("preorder_operator_name")
-    order_id = await create_preorder(callback.from_user.id, category_id, total_price, qty, custom_op)
+    result = await _purchase_or_alert(callback, category_id, qty, price, custom_operator_name=custom_op, reserve=False)
+    if not result:
+        return
+    order_id = result["preorder_ids"][0]
     await state.clear()
     emoji = CATEGORY_EMOJI.get(category["name"], "⚪️")
     cat_label = category["name"]
@@ -326,22 +335,16 @@ async def confirm_preorder(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
     from src.db.operators import get_preorder_operator_ids
-    from src.bot.instance import bot
     try:
-        op_ids = await get_preorder_operator_ids()
-        for op_id in op_ids:
-            try:
-                await bot.send_message(
-                    op_id,
-                    f"📦 <b>Новый предзаказ #{order_id}</b>\n\n"
-                    f"👤 ID: <code>{callback.from_user.id}</code>\n"
-                    f"📂 Категория: {emoji} {cat_label}\n"
-                    f"📊 Подписей: {qty}\n"
-                    f"💰 Сумма: {total_price:.2f}$",
-                    parse_mode="HTML",
-                )
-            except Exception:
-                pass
+        enqueue_many(
+            await get_preorder_operator_ids(),
+            f"📦 <b>Новый предзаказ #{order_id}</b>\n\n"
+            f"👤 ID: <code>{callback.from_user.id}</code>\n"
+            f"📂 Категория: {emoji} {cat_label}\n"
+            f"📊 Подписей: {qty}\n"
+            f"💰 Сумма: {total_price:.2f}$",
+            parse_mode="HTML",
+        )
     except Exception:
         pass
 
@@ -602,22 +605,14 @@ async def confirm_custom_buy(callback: CallbackQuery, state: FSMContext):
     price = category.get("price", 0)
     total_price = price * qty
 
-    if total_price > 0:
-        user = await get_user(callback.from_user.id)
-        if not user or user.get("balance", 0) < total_price:
-            await callback.answer(
-                f"❌ Недостаточно средств. Нужно: {total_price:.2f}$. Пополните баланс.",
-                show_alert=True,
-            )
-            return
-        await update_balance(callback.from_user.id, -total_price)
+    result = await _purchase_or_alert(callback, category_id, qty, price, custom_operator_name=custom_operator_name)
+    if not result:
+        return
 
-    allocations = await try_reserve_accounts_multi(category_id, callback.from_user.id, qty)
-    if not allocations:
-        order_id = await create_preorder(callback.from_user.id, category_id, total_price, qty, custom_operator_name)
+    if result["preorder_ids"]:
         await state.clear()
         await callback.message.edit_text(
-            f"⏳ <b>Предзаказ #{order_id} оформлен!</b>\n\n"
+            f"⏳ <b>Предзаказ #{result['preorder_ids'][0]} оформлен!</b>\n\n"
             f"📂 Категория: Любой другой\n"
             f"🏢 Оператор: <b>{custom_operator_name}</b>\n"
             f"📊 Подписей: {qty}\n"
@@ -630,16 +625,7 @@ async def confirm_custom_buy(callback: CallbackQuery, state: FSMContext):
         await callback.answer()
         return
 
-    orders_created = []
-    for alloc in allocations:
-        alloc_qty = alloc["batch_size"]
-        alloc_price = price * alloc_qty
-        oid = await create_order(callback.from_user.id, alloc["id"], category_id, alloc_price, alloc_qty, custom_operator_name)
-        o = await get_order(oid)
-        orders_created.append((o, alloc))
-
-    for order, alloc in orders_created:
-        await _notify_referral(callback.from_user.id, order['id'], price * alloc['batch_size'])
+    orders_created = result["orders"]
 
     await state.clear()
 
@@ -683,23 +669,12 @@ async def confirm_custom_buy(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
     try:
-        from src.bot.instance import bot
         user_name = callback.from_user.username or callback.from_user.full_name or str(callback.from_user.id)
         for order, alloc in orders_created:
             notify_text = format_order_card_admin(order, user_name)
-            for admin_id in await get_admin_ids():
-                notify_enabled = await is_admin_notifications_enabled(admin_id)
-                if notify_enabled:
-                    try:
-                        await bot.send_message(admin_id, notify_text, parse_mode="HTML")
-                    except Exception:
-                        pass
+            enqueue_many(await get_notified_admin_ids(), notify_text, parse_mode="HTML")
             op_ids = await get_target_operator_ids(order.get("account_id"))
-            for op_id in op_ids:
-                try:
-                    await bot.send_message(op_id, notify_text, parse_mode="HTML")
-                except Exception:
-                    pass
+            enqueue_many(op_ids, notify_text, parse_mode="HTML")
     except Exception:
         pass
 
@@ -999,43 +974,12 @@ async def confirm_bb(callback: CallbackQuery):
                 )
                 return
     total_price = bb_price * pack_qty
-    max_sigs = category.get("max_signatures", 1)
-    if total_price > 0:
-        user = await get_user(callback.from_user.id)
-        if not user or user.get("balance", 0) < total_price:
-            await callback.answer(
-                f"❌ Недостаточно средств. Нужно: {total_price:.2f}$. Пополните баланс.",
-                show_alert=True,
-            )
-            return
-        await update_balance(callback.from_user.id, -total_price)
-    from src.db.orders import generate_batch_group_id
-    bg_id = generate_batch_group_id() if pack_qty > 1 else None
-    order_ids = []
-    preorder_ids = []
-    try:
-        for _ in range(pack_qty):
-            account = await try_reserve_account_exclusive(category_id, callback.from_user.id)
-            if not account:
-                oid = await create_preorder(callback.from_user.id, category_id, bb_price, max_sigs, is_exclusive=True, batch_group_id=bg_id)
-                preorder_ids.append(oid)
-            else:
-                batch_size = account.get("batch_size", max_sigs)
-                oid = await create_order(
-                    callback.from_user.id, account["id"], category_id,
-                    bb_price, batch_size, is_exclusive=True, batch_group_id=bg_id,
-                )
-                order_ids.append(oid)
-    except Exception:
-        created_count = len(order_ids) + len(preorder_ids)
-        refund = bb_price * (pack_qty - created_count)
-        if refund > 0:
-            await update_balance(callback.from_user.id, refund)
-        if created_count == 0:
-            await callback.answer("❌ Ошибка при создании заказов. Средства возвращены.", show_alert=True)
-            return
-    for oid in order_ids:
-        await _notify_referral(callback.from_user.id, oid, bb_price)
+    result = await _purchase_or_alert(callback, category_id, pack_qty, bb_price, exclusive=True)
+    if not result:
+        return
+    bb_orders = [o for o, _ in result["orders"]]
+    order_ids = [o["id"] for o in bb_orders]
+    preorder_ids = result["preorder_ids"]
     lines = []
     if order_ids:
         ids_str = ", ".join(f"#{oid}" for oid in order_ids)
@@ -1057,32 +1001,16 @@ async def confirm_bb(callback: CallbackQuery):
     )
     await callback.answer()
     try:
-        from src.bot.instance import bot
         from src.utils.formatters import format_bb_batch_card_admin
         user_name = callback.from_user.username or callback.from_user.full_name or str(callback.from_user.id)
-        bb_orders = []
-        for oid in order_ids:
-            order = await get_order(oid)
-            if order:
-                bb_orders.append(order)
         if bb_orders:
             notify_text = format_bb_batch_card_admin(bb_orders, user_name)
-            for admin_id in await get_admin_ids():
-                notify_enabled = await is_admin_notifications_enabled(admin_id)
-                if notify_enabled:
-                    try:
-                        await bot.send_message(admin_id, notify_text, parse_mode="HTML")
-                    except Exception:
-                        pass
+            enqueue_many(await get_notified_admin_ids(), notify_text, parse_mode="HTML")
             notified_ops = set()
             for order in bb_orders:
                 op_ids = await get_target_operator_ids(order.get("account_id"))
                 notified_ops.update(op_ids)
-            for op_id in notified_ops:
-                try:
-                    await bot.send_message(op_id, notify_text, parse_mode="HTML")
-                except Exception:
-                    pass
+            enqueue_many(notified_ops, notify_text, parse_mode="HTML")
     except Exception:
         pass
 
@@ -1118,22 +1046,14 @@ async def confirm_buy(callback: CallbackQuery, state: FSMContext):
     qty = data.get("buy_qty", max_sigs)
     total_price = price * qty
 
-    if total_price > 0:
-        user = await get_user(callback.from_user.id)
-        if not user or user.get("balance", 0) < total_price:
-            await callback.answer(
-                f"❌ Недостаточно средств. Нужно: {total_price:.2f}$. Пополните баланс.",
-                show_alert=True,
-            )
-            return
-        await update_balance(callback.from_user.id, -total_price)
+    result = await _purchase_or_alert(callback, category_id, qty, price)
+    if not result:
+        return
 
-    allocations = await try_reserve_accounts_multi(category_id, callback.from_user.id, qty)
-    if not allocations:
-        order_id = await create_preorder(callback.from_user.id, category_id, total_price, qty)
+    if result["preorder_ids"]:
         await state.clear()
         await callback.message.edit_text(
-            f"⏳ <b>Предзаказ #{order_id} оформлен!</b>\n\n"
+            f"⏳ <b>Предзаказ #{result['preorder_ids'][0]} оформлен!</b>\n\n"
             f"📂 Категория: {category['name']}\n"
             f"📊 Подписей: {qty}\n"
             f"💰 Сумма: {total_price:.2f}$\n\n"
@@ -1145,18 +1065,7 @@ async def confirm_buy(callback: CallbackQuery, state: FSMContext):
         await callback.answer()
         return
 
-    from src.db.orders import generate_batch_group_id
-    bg_id = generate_batch_group_id() if len(allocations) > 1 else None
-    orders_created = []
-    for alloc in allocations:
-        alloc_qty = alloc["batch_size"]
-        alloc_price = price * alloc_qty
-        oid = await create_order(callback.from_user.id, alloc["id"], category_id, alloc_price, alloc_qty, batch_group_id=bg_id)
-        o = await get_order(oid)
-        orders_created.append((o, alloc))
-
-    for order, alloc in orders_created:
-        await _notify_referral(callback.from_user.id, order['id'], price * alloc['batch_size'])
+    orders_created = result["orders"]
 
     await state.clear()
 
@@ -1196,44 +1105,23 @@ async def confirm_buy(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
     try:
-        from src.bot.instance import bot
         from src.utils.formatters import format_bb_batch_card_admin
         user_name = callback.from_user.username or callback.from_user.full_name or str(callback.from_user.id)
         all_orders = [o for o, _ in orders_created]
         if len(all_orders) > 1:
             notify_text = format_bb_batch_card_admin(all_orders, user_name)
-            for admin_id in await get_admin_ids():
-                notify_enabled = await is_admin_notifications_enabled(admin_id)
-                if notify_enabled:
-                    try:
-                        await bot.send_message(admin_id, notify_text, parse_mode="HTML")
-                    except Exception:
-                        pass
+            enqueue_many(await get_notified_admin_ids(), notify_text, parse_mode="HTML")
             notified_ops = set()
             for order in all_orders:
                 op_ids = await get_target_operator_ids(order.get("account_id"))
                 notified_ops.update(op_ids)
-            for op_id in notified_ops:
-                try:
-                    await bot.send_message(op_id, notify_text, parse_mode="HTML")
-                except Exception:
-                    pass
+            enqueue_many(notified_ops, notify_text, parse_mode="HTML")
         else:
             for order in all_orders:
                 notify_text = format_order_card_admin(order, user_name)
-                for admin_id in await get_admin_ids():
-                    notify_enabled = await is_admin_notifications_enabled(admin_id)
-                    if notify_enabled:
-                        try:
-                            await bot.send_message(admin_id, notify_text, parse_mode="HTML")
-                        except Exception:
-                            pass
+                enqueue_many(await get_notified_admin_ids(), notify_text, parse_mode="HTML")
                 op_ids = await get_target_operator_ids(order.get("account_id"))
-                for op_id in op_ids:
-                    try:
-                        await bot.send_message(op_id, notify_text, parse_mode="HTML")
-                    except Exception:
-                        pass
+                enqueue_many(op_ids, notify_text, parse_mode="HTML")
     except Exception:
         pass
 
@@ -1669,7 +1557,6 @@ async def confirm_signature_sent(callback: CallbackQuery, state: FSMContext):
     )
     await callback.answer()
     try:
-        from src.bot.instance import bot
         from src.keyboards.admin_kb import operator_confirm_sig_kb
         user_name = callback.from_user.username or callback.from_user.full_name or str(callback.from_user.id)
         from src.utils.formatters import get_category_emoji
@@ -1692,19 +1579,9 @@ async def confirm_signature_sent(callback: CallbackQuery, state: FSMContext):
             f"Нажмите «Готово» после проверки."
         )
         kb = operator_confirm_sig_kb(order_id, new_claimed)
-        for admin_id in await get_admin_ids():
-            notify_enabled = await is_admin_notifications_enabled(admin_id)
-            if notify_enabled:
-                try:
-                    await bot.send_message(admin_id, notify_text, reply_markup=kb, parse_mode="HTML")
-                except Exception:
-                    pass
+        enqueue_many(await get_notified_admin_ids(), notify_text, reply_markup=kb, parse_mode="HTML")
         op_ids = await get_target_operator_ids(order.get("account_id"))
-        for op_id in op_ids:
-            try:
-                await bot.send_message(op_id, notify_text, reply_markup=kb, parse_mode="HTML")
-            except Exception:
-                pass
+        enqueue_many(op_ids, notify_text, reply_markup=kb, parse_mode="HTML")
     except Exception:
         pass
 
@@ -1803,7 +1680,6 @@ async def _send_doc_request(callback, order, order_id, start_num, qty, claimed):
         range_text = f"#{start_num}—#{end_num}"
     await callback.answer(f"📄 Запрос на документы {range_text} отправлен! ({end_num}/{claimed})", show_alert=True)
     try:
-        from src.bot.instance import bot
         from src.keyboards.admin_kb import operator_send_doc_kb
         user_name = callback.from_user.username or callback.from_user.full_name or str(callback.from_user.id)
         custom_op = order.get('custom_operator_name')
@@ -1825,18 +1701,8 @@ async def _send_doc_request(callback, order, order_id, start_num, qty, claimed):
         )
         kb = operator_send_doc_kb(order_id, start_num, qty)
         op_ids = await get_target_operator_ids(order.get("account_id"))
-        for op_id in op_ids:
-            try:
-                await bot.send_message(op_id, notify_text, reply_markup=kb, parse_mode="HTML")
-            except Exception:
-                pass
-        for admin_id in await get_admin_ids():
-            notify_enabled = await is_admin_notifications_enabled(admin_id)
-            if notify_enabled:
-                try:
-                    await bot.send_message(admin_id, notify_text, reply_markup=kb, parse_mode="HTML")
-                except Exception:
-                    pass
+        enqueue_many(op_ids, notify_text, reply_markup=kb, parse_mode="HTML")
+        enqueue_many(await get_notified_admin_ids(), notify_text, reply_markup=kb, parse_mode="HTML")
     except Exception:
         pass
 
@@ -1882,7 +1748,6 @@ async def totp_ticket_handler(callback: CallbackQuery):
     )
     await callback.answer()
     try:
-        from src.bot.instance import bot
         user_name = callback.from_user.username or callback.from_user.full_name or str(callback.from_user.id)
         notify_text = (
             f"📩 <b>Обращение #{ticket_id} — TOTP лимит</b>\n\n"
@@ -1892,16 +1757,8 @@ async def totp_ticket_handler(callback: CallbackQuery):
             f"📱 Телефон: <code>{order.get('phone', '—')}</code>\n\n"
             f"Клиент исчерпал лимит TOTP и просит помощь."
         )
-        for admin_id in await get_admin_ids():
-            try:
-                await bot.send_message(admin_id, notify_text, parse_mode="HTML")
-            except Exception:
-                pass
+        enqueue_many(await get_admin_ids(), notify_text, parse_mode="HTML")
         op_ids = await get_target_operator_ids(order.get("account_id"))
-        for op_id in op_ids:
-            try:
-                await bot.send_message(op_id, notify_text, parse_mode="HTML")
-            except Exception:
-                pass
+        enqueue_many(op_ids, notify_text, parse_mode="HTML")
     except Exception:
         pass
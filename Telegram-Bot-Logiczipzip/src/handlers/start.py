@@ -3,17 +3,18 @@ import logging
 
 from aiogram import Router, F
 from aiogram.filters import CommandStart
-from aiogram.types import Message, CallbackQuery
+from aiogram.types import Message, CallbackQuery, ChatMemberUpdated
 from aiogram.fsm.context import FSMContext
 
-from src.db.users import get_or_create_user, is_user_blocked
+from src.db.users import get_or_create_user, is_user_blocked, reactivate_user
 from src.keyboards.user_kb import main_menu_kb, subscription_required_kb
 from src.db.admins import is_admin
+from src.utils.subscriptions import is_subscribed, record_member_update
 
 router = Router()
 
 
-async def check_user_subscriptions(bot, user_id: int) -> list[dict]:
+async def check_user_subscriptions(bot, user_id: int, fresh: bool = False) -> list[dict]:
     from src.db.channels import get_required_channels
     channels = await get_required_channels()
     if not channels:
@@ -21,15 +22,8 @@ async def check_user_subscriptions(bot, user_id: int) -> list[dict]:
     if await is_admin(user_id):
         return []
 
-    async def _check_one(ch):
-        try:
-            member = await bot.get_chat_member(ch["channel_id"], user_id)
-            return None if member.status not in ("left", "kicked") else ch
-        except Exception:
-            return ch
-
-    results = await asyncio.gather(*[_check_one(ch) for ch in channels])
-    return [ch for ch in results if ch is not None]
+    results = await asyncio.gather(*[is_subscribed(bot, user_id, ch["channel_id"], fresh) for ch in channels])
+    return [ch for ch, ok in zip(channels, results) if not ok]
 
 
 async def send_subscription_required(message_or_callback, not_subscribed: list[dict]):
@@ -55,11 +49,13 @@ async def cmd_start(message: Message, state: FSMContext):
     args = message.text.split(maxsplit=1)
     referral_arg = args[1] if len(args) > 1 else None
 
-    await get_or_create_user(
+    user = await get_or_create_user(
         telegram_id=message.from_user.id,
         username=message.from_user.username,
         full_name=message.from_user.full_name,
     )
+    if user.get("is_active") == 0:
+        await reactivate_user(message.from_user.id)
 
     if referral_arg and referral_arg.startswith("ref_"):
         try:
@@ -96,7 +92,7 @@ async def cmd_start(message: Message, state: FSMContext):
 @router.callback_query(F.data == "check_subscription")
 async def check_subscription_cb(callback: CallbackQuery):
     from src.bot.instance import bot
-    not_subscribed = await check_user_subscriptions(bot, callback.from_user.id)
+    not_subscribed = await check_user_subscriptions(bot, callback.from_user.id, fresh=True)
     if not_subscribed:
         await callback.answer("❌ Вы ещё не подписались на все каналы!", show_alert=True)
         await send_subscription_required(callback, not_subscribed)
@@ -114,6 +110,17 @@ async def check_subscription_cb(callback: CallbackQuery):
     await callback.answer()
 
 
+@router.chat_member()
+async def on_channel_member(event: ChatMemberUpdated):
+    from src.db.channels import get_required_channels
+    channels = await get_required_channels()
+    if not any(ch["channel_id"] == event.chat.id for ch in channels):
+        return
+    await record_member_update(
+        event.new_chat_member.user.id, event.chat.id, event.new_chat_member.status
+    )
+
+
 @router.callback_query(F.data == "user_back_menu")
 async def back_to_menu(callback: CallbackQuery, state: FSMContext):
     await state.clear()
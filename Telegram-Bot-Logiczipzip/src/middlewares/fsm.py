@@ -0,0 +1,22 @@
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.fsm.context import FSMContext
+from aiogram.types import TelegramObject
+
+
+class FSMBatchMiddleware(BaseMiddleware):
+    def __init__(self, storage):
+        self.storage = storage
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        context: FSMContext | None = data.get("state")
+        if context is None:
+            return await handler(event, data)
+        async with self.storage.batch(context.key, data.get("raw_state")):
+            return await handler(event, data)
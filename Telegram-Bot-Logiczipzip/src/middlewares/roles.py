@@ -0,0 +1,21 @@
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, User
+
+from src.db.staff import Roles, resolve_roles
+
+
+class RolesMiddleware(BaseMiddleware):
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        user: User | None = data.get("event_from_user")
+        if user is not None:
+            data["roles"] = await resolve_roles(user.id)
+        else:
+            data["roles"] = Roles(user_id=0)
+        return await handler(event, data)
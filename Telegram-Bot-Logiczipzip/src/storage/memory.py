@@ -0,0 +1,118 @@
+import json
+import logging
+import time
+from collections import OrderedDict
+from copy import copy
+from dataclasses import dataclass, field
+from typing import Any, Mapping
+
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+logger = logging.getLogger(__name__)
+
+
+class FSMEntryTooLarge(ValueError):
+    pass
+
+
+@dataclass
+class _Record:
+    state: str | None = None
+    data: dict[str, Any] = field(default_factory=dict)
+    size: int = 0
+    touched_at: float = field(default_factory=time.monotonic)
+
+
+def _entry_size(state: str | None, data: dict[str, Any]) -> int:
+    return len(state or "") + len(json.dumps(data, default=str, ensure_ascii=False).encode())
+
+
+class BoundedMemoryStorage(BaseStorage):
+    def __init__(self, ttl: float, max_entries: int, max_entry_bytes: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_entry_bytes = max_entry_bytes
+        self.storage: OrderedDict[StorageKey, _Record] = OrderedDict()
+        self.bytes = 0
+        self.counters = {"evicted_ttl": 0, "evicted_lru": 0, "rejected": 0}
+
+    def _get(self, key: StorageKey) -> _Record | None:
+        record = self.storage.get(key)
+        if record is None:
+            return None
+        if record.touched_at + self.ttl <= time.monotonic():
+            self._drop(key)
+            self.counters["evicted_ttl"] += 1
+            return None
+        record.touched_at = time.monotonic()
+        self.storage.move_to_end(key)
+        return record
+
+    def _drop(self, key: StorageKey):
+        record = self.storage.pop(key, None)
+        if record is not None:
+            self.bytes -= record.size
+
+    def _put(self, key: StorageKey, state: str | None, data: dict[str, Any]):
+        if state is None and not data:
+            self._drop(key)
+            return
+        size = _entry_size(state, data)
+        if size > self.max_entry_bytes:
+            self.counters["rejected"] += 1
+            raise FSMEntryTooLarge(
+                f"FSM entry for chat={key.chat_id} user={key.user_id} is {size} bytes "
+                f"(limit {self.max_entry_bytes})"
+            )
+        self._drop(key)
+        self.storage[key] = _Record(state, data, size)
+        self.bytes += size
+        while len(self.storage) > self.max_entries:
+            oldest, _ = next(iter(self.storage.items()))
+            self._drop(oldest)
+            self.counters["evicted_lru"] += 1
+
+    def evict_expired(self) -> int:
+        deadline = time.monotonic() - self.ttl
+        evicted = 0
+        while self.storage:
+            key, record = next(iter(self.storage.items()))
+            if record.touched_at > deadline:
+                break
+            self._drop(key)
+            evicted += 1
+        self.counters["evicted_ttl"] += evicted
+        return evicted
+
+    def get_stats(self) -> dict:
+        return {"entries": len(self.storage), "bytes": self.bytes, **self.counters}
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = self._get(key)
+        state = state.state if isinstance(state, State) else state
+        self._put(key, state, record.data if record else {})
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        record = self._get(key)
+        return record.state if record else None
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            msg = f"Data must be a dict or dict-like object, got {type(data).__name__}"
+            raise DataNotDictLikeError(msg)
+        record = self._get(key)
+        self._put(key, record.state if record else None, data.copy())
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        record = self._get(key)
+        return record.data.copy() if record else {}
+
+    async def get_value(self, storage_key: StorageKey, dict_key: str, default: Any | None = None) -> Any | None:
+        record = self._get(storage_key)
+        return copy(record.data.get(dict_key, default)) if record else default
+
+    async def close(self) -> None:
+        self.storage.clear()
+        self.bytes = 0
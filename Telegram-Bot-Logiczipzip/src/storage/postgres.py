@@ -0,0 +1,147 @@
+import json
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Mapping
+
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from src.db.database import get_pool
+
+_KEY_WHERE = (
+    "bot_id = $1 AND chat_id = $2 AND user_id = $3 AND thread_id = $4 "
+    "AND business_connection_id = $5 AND destiny = $6"
+)
+
+_UPSERT_SQL = """
+    INSERT INTO fsm_state (bot_id, chat_id, user_id, thread_id, business_connection_id, destiny, state, data, updated_at)
+    VALUES ($1, $2, $3, $4, $5, $6, $7, COALESCE($8::jsonb, '{}'::jsonb), NOW())
+    ON CONFLICT (bot_id, chat_id, user_id, thread_id, business_connection_id, destiny)
+    DO UPDATE SET
+        state = CASE WHEN $9 THEN EXCLUDED.state ELSE fsm_state.state END,
+        data = CASE WHEN $8::jsonb IS NOT NULL THEN EXCLUDED.data ELSE fsm_state.data END,
+        updated_at = NOW()
+"""
+
+_UNSET = object()
+
+
+@dataclass
+class _Entry:
+    state: Any = _UNSET
+    data: dict[str, Any] | None = None
+    dirty: bool = False
+
+
+_buffer: ContextVar[dict[StorageKey, _Entry] | None] = ContextVar("fsm_buffer", default=None)
+
+
+def _key_args(key: StorageKey) -> tuple:
+    return (
+        key.bot_id, key.chat_id, key.user_id, key.thread_id or 0,
+        key.business_connection_id or "", key.destiny,
+    )
+
+
+def _copy(data: Mapping[str, Any]) -> dict[str, Any]:
+    return json.loads(json.dumps(data))
+
+
+class PostgresStorage(BaseStorage):
+    @asynccontextmanager
+    async def batch(self, key: StorageKey | None = None, state: str | None = None):
+        if _buffer.get() is not None:
+            yield
+            return
+        buffer: dict[StorageKey, _Entry] = {}
+        if key is not None:
+            buffer[key] = _Entry(state=state)
+        token = _buffer.set(buffer)
+        try:
+            yield
+        finally:
+            _buffer.reset(token)
+            await self._flush(buffer)
+
+    def _entry(self, key: StorageKey) -> _Entry:
+        buffer = _buffer.get()
+        if buffer is None:
+            return _Entry()
+        return buffer.setdefault(key, _Entry())
+
+    async def _load(self, key: StorageKey, entry: _Entry):
+        pool = await get_pool()
+        async with pool.acquire() as conn:
+            row = await conn.fetchrow(f"SELECT state, data FROM fsm_state WHERE {_KEY_WHERE}", *_key_args(key))
+        if entry.state is _UNSET:
+            entry.state = row["state"] if row else None
+        if entry.data is None:
+            entry.data = json.loads(row["data"]) if row else {}
+
+    async def _save(self, key: StorageKey, entry: _Entry):
+        if _buffer.get() is not None:
+            entry.dirty = True
+            return
+        pool = await get_pool()
+        async with pool.acquire() as conn:
+            await self._write(conn, key, entry)
+
+    async def _write(self, conn, key: StorageKey, entry: _Entry):
+        if entry.state is None and entry.data == {}:
+            await conn.execute(f"DELETE FROM fsm_state WHERE {_KEY_WHERE}", *_key_args(key))
+            return
+        await conn.execute(
+            _UPSERT_SQL, *_key_args(key),
+            None if entry.state is _UNSET else entry.state,
+            None if entry.data is None else json.dumps(entry.data),
+            entry.state is not _UNSET,
+        )
+
+    async def _flush(self, buffer: dict[StorageKey, _Entry]):
+        dirty = [(k, e) for k, e in buffer.items() if e.dirty]
+        if not dirty:
+            return
+        pool = await get_pool()
+        async with pool.acquire() as conn:
+            for key, entry in dirty:
+                await self._write(conn, key, entry)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        entry = self._entry(key)
+        entry.state = state.state if isinstance(state, State) else state
+        await self._save(key, entry)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        entry = self._entry(key)
+        if entry.state is _UNSET:
+            await self._load(key, entry)
+        return entry.state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            msg = f"Data must be a dict or dict-like object, got {type(data).__name__}"
+            raise DataNotDictLikeError(msg)
+        entry = self._entry(key)
+        entry.data = _copy(data)
+        await self._save(key, entry)
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        entry = self._entry(key)
+        if entry.data is None:
+            await self._load(key, entry)
+        return _copy(entry.data)
+
+    async def close(self) -> None:
+        pass
+
+
+async def cleanup_fsm_states(ttl_seconds: float) -> int:
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        result = await conn.execute(
+            "DELETE FROM fsm_state WHERE updated_at < NOW() - make_interval(secs => $1)",
+            ttl_seconds
+        )
+        return int(result.split()[-1])
@@ -0,0 +1,192 @@
+import asyncio
+import codecs
+import csv
+import logging
+import tempfile
+import time
+from typing import AsyncIterator
+
+from aiogram.types import BufferedInputFile, Document, Message
+
+from src.db.accounts import AccountLineParser, import_accounts
+
+logger = logging.getLogger(__name__)
+
+IMPORT_BATCH_SIZE = 2000
+PROGRESS_INTERVAL = 2.0
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+MAX_DOCUMENT_SIZE = 20 * 1024 * 1024
+XLSX_ROWS_PER_READ = 1000
+
+SUPPORTED_EXTENSIONS = (".txt", ".csv", ".xlsx")
+
+
+def document_extension(document: Document) -> str | None:
+    name = (document.file_name or "").lower()
+    for ext in SUPPORTED_EXTENSIONS:
+        if name.endswith(ext):
+            return ext
+    return None
+
+
+def _cells_to_line(cells) -> str:
+    values = [str(c).strip() for c in cells if c is not None and str(c).strip()]
+    if len(values) >= 4 and values[0].isdigit() and len(values[0]) <= 5:
+        values = values[1:]
+    return " ".join(values)
+
+
+def _is_header(line: str) -> bool:
+    return len(line.split()) >= 3 and not any(ch.isdigit() for ch in line)
+
+
+async def _stream_text_lines(bot, file_path: str) -> AsyncIterator[str]:
+    url = bot.session.api.file_url(bot.token, file_path)
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    tail = ""
+    async for chunk in bot.session.stream_content(url, timeout=120, chunk_size=DOWNLOAD_CHUNK_SIZE):
+        text = tail + decoder.decode(chunk)
+        lines = text.split("\n")
+        tail = lines.pop()
+        for line in lines:
+            yield line.rstrip("\r")
+    tail += decoder.decode(b"", final=True)
+    if tail:
+        yield tail.rstrip("\r")
+
+
+async def _stream_csv_lines(bot, file_path: str) -> AsyncIterator[str]:
+    dialect = None
+    async for line in _stream_text_lines(bot, file_path):
+        if not line.strip():
+            yield ""
+            continue
+        first = dialect is None
+        if first:
+            try:
+                dialect = csv.Sniffer().sniff(line, delimiters=",;\t")
+            except csv.Error:
+                dialect = csv.excel
+        for row in csv.reader([line], dialect):
+            converted = _cells_to_line(row)
+            yield "" if first and _is_header(converted) else converted
+
+
+async def _stream_xlsx_lines(bot, file_path: str) -> AsyncIterator[str]:
+    from openpyxl import load_workbook
+
+    with tempfile.TemporaryFile() as tmp:
+        await bot.download_file(file_path, destination=tmp, timeout=120, chunk_size=DOWNLOAD_CHUNK_SIZE)
+        workbook = await asyncio.to_thread(load_workbook, tmp, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+
+            seen_data = False
+
+            def _read_rows() -> list[str]:
+                nonlocal seen_data
+                out = []
+                for row in rows:
+                    line = _cells_to_line(row)
+                    if line and not seen_data:
+                        seen_data = True
+                        if _is_header(line):
+                            line = ""
+                    out.append(line)
+                    if len(out) >= XLSX_ROWS_PER_READ:
+                        break
+                return out
+
+            while True:
+                lines = await asyncio.to_thread(_read_rows)
+                if not lines:
+                    break
+                for line in lines:
+                    yield line
+        finally:
+            workbook.close()
+
+
+_READERS = {
+    ".txt": _stream_text_lines,
+    ".csv": _stream_csv_lines,
+    ".xlsx": _stream_xlsx_lines,
+}
+
+
+def _progress_text(stats: dict, done: bool = False) -> str:
+    title = "✅ <b>Импорт завершён</b>" if done else "⏳ <b>Импорт аккаунтов...</b>"
+    return (
+        f"{title}\n\n"
+        f"📄 Строк обработано: {stats['lines']}\n"
+        f"✅ Добавлено: {stats['added']}\n"
+        f"♻️ Дубликатов: {stats['duplicates']}\n"
+        f"⚠️ Не распознано строк: {stats['rejected']}"
+    )
+
+
+def _report_file(duplicates: list[str], rejected: list[tuple[int, str]]) -> BufferedInputFile | None:
+    if not duplicates and not rejected:
+        return None
+    parts = []
+    if duplicates:
+        parts.append("Дубликаты (уже в базе или повтор в файле):")
+        parts.extend(duplicates)
+        parts.append("")
+    if rejected:
+        parts.append("Нераспознанные строки:")
+        parts.extend(f"{line_no}: {line}" for line_no, line in rejected)
+    return BufferedInputFile("\n".join(parts).encode(), filename="import_report.txt")
+
+
+async def import_accounts_document(bot, message: Message, extension: str, admin_id: int) -> list[int]:
+    document = message.document
+    status = await message.answer("⏳ <b>Импорт аккаунтов...</b>", parse_mode="HTML")
+    file = await bot.get_file(document.file_id)
+
+    parser = AccountLineParser()
+    stats = {"lines": 0, "added": 0, "duplicates": 0, "rejected": 0}
+    added_ids: list[int] = []
+    duplicates: list[str] = []
+    pending: list[dict] = []
+    last_progress = time.monotonic()
+
+    async def _flush():
+        nonlocal pending
+        if not pending:
+            return
+        batch, pending = pending, []
+        result = await import_accounts(batch, added_by_admin_id=admin_id)
+        added_ids.extend(result["added_ids"])
+        duplicates.extend(result["duplicates"])
+        stats["added"] = len(added_ids)
+        stats["duplicates"] = len(duplicates)
+
+    async for line in _READERS[extension](bot, file.file_path):
+        stats["lines"] += 1
+        pending.extend(parser.feed(line))
+        if len(pending) >= IMPORT_BATCH_SIZE:
+            await _flush()
+        if time.monotonic() - last_progress >= PROGRESS_INTERVAL:
+            last_progress = time.monotonic()
+            stats["rejected"] = len(parser.rejected)
+            try:
+                await status.edit_text(_progress_text(stats), parse_mode="HTML")
+            except Exception:
+                pass
+    pending.extend(parser.finish())
+    await _flush()
+    stats["rejected"] = len(parser.rejected)
+
+    logger.info(
+        f"ACCOUNT_IMPORT: admin={admin_id} file={document.file_name} lines={stats['lines']} "
+        f"added={stats['added']} duplicates={stats['duplicates']} rejected={stats['rejected']}"
+    )
+    try:
+        await status.edit_text(_progress_text(stats, done=True), parse_mode="HTML")
+    except Exception:
+        pass
+    report = _report_file(duplicates, parser.rejected)
+    if report is not None:
+        await message.answer_document(report, caption="📋 Отчёт об импорте: дубликаты и нераспознанные строки")
+    return added_ids
@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import time
+
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+from src.config import BROADCAST_RATE, BROADCAST_CONCURRENCY
+from src.db.broadcasts import (
+    create_broadcast, claim_stale_broadcasts, touch_broadcast, get_recipient_page, record_deliveries, finish_broadcast,
+)
+from src.utils.messaging import is_unreachable_error, mark_unreachable, flush_unreachable
+from src.utils.ratelimit import TokenBucket, telegram_bucket
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 200
+PROGRESS_INTERVAL = 5
+HEARTBEAT_INTERVAL = 30
+STALE_AFTER = 120
+MAX_SEND_ATTEMPTS = 3
+
+_bucket = TokenBucket(BROADCAST_RATE)
+_running: dict[int, asyncio.Task] = {}
+
+
+async def start_broadcast(bot, text: str, created_by: int, status_chat_id: int, status_message_id: int) -> dict:
+    broadcast = await create_broadcast(text, created_by, status_chat_id, status_message_id)
+    _spawn(bot, broadcast)
+    return broadcast
+
+
+async def resume_broadcasts(bot) -> int:
+    stale = await claim_stale_broadcasts(STALE_AFTER)
+    for broadcast in stale:
+        if broadcast["id"] not in _running:
+            logger.info(f"BROADCAST: resuming #{broadcast['id']} after user {broadcast['cursor_id']}")
+            _spawn(bot, broadcast)
+    return len(stale)
+
+
+async def _heartbeat(broadcast_id: int):
+    while True:
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+        try:
+            await touch_broadcast(broadcast_id)
+        except Exception as e:
+            logger.warning(f"BROADCAST: heartbeat failed for #{broadcast_id}: {e}")
+
+
+def _spawn(bot, broadcast: dict):
+    task = asyncio.create_task(_run_broadcast(bot, broadcast))
+    _running[broadcast["id"]] = task
+    task.add_done_callback(lambda _: _running.pop(broadcast["id"], None))
+
+
+async def _send(bot, chat_id: int, text: str) -> tuple[str, str | None]:
+    for _ in range(MAX_SEND_ATTEMPTS):
+        await _bucket.acquire()
+        await telegram_bucket.acquire()
+        try:
+            await bot.send_message(chat_id, text, parse_mode="HTML")
+            return "sent", None
+        except TelegramRetryAfter as e:
+            logger.warning(f"BROADCAST: flood wait {e.retry_after}s")
+            _bucket.pause(e.retry_after)
+            telegram_bucket.pause(e.retry_after)
+        except Exception as e:
+            if is_unreachable_error(e):
+                await mark_unreachable(chat_id)
+                return "unreachable", str(e)[:200]
+            return "failed", str(e)[:200]
+    return "failed", "retry_after"
+
+
+async def _run_broadcast(bot, broadcast: dict):
+    broadcast_id = broadcast["id"]
+    text = broadcast["text"]
+    cursor_id = broadcast["cursor_id"]
+    semaphore = asyncio.Semaphore(BROADCAST_CONCURRENCY)
+    last_progress = time.monotonic()
+
+    async def deliver(user: dict) -> tuple[int, str, str | None]:
+        async with semaphore:
+            status, error = await _send(bot, user["telegram_id"], text)
+        return user["telegram_id"], status, error
+
+    heartbeat = asyncio.create_task(_heartbeat(broadcast_id))
+    try:
+        while True:
+            page = await get_recipient_page(broadcast_id, cursor_id, PAGE_SIZE)
+            if not page:
+                break
+            results = await asyncio.gather(*(deliver(u) for u in page))
+            cursor_id = page[-1]["id"]
+            broadcast = await record_deliveries(broadcast_id, results, cursor_id)
+            if time.monotonic() - last_progress >= PROGRESS_INTERVAL:
+                last_progress = time.monotonic()
+                await _show_progress(bot, broadcast)
+        await flush_unreachable()
+        broadcast = await finish_broadcast(broadcast_id)
+        logger.info(f"BROADCAST: #{broadcast_id} done, sent={broadcast['sent']}, failed={broadcast['failed']}")
+        await _show_result(bot, broadcast)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.error(f"BROADCAST: #{broadcast_id} stopped at user {cursor_id}: {e}", exc_info=True)
+    finally:
+        heartbeat.cancel()
+
+
+async def _show_progress(bot, broadcast: dict):
+    done = broadcast["sent"] + broadcast["failed"]
+    try:
+        await bot.edit_message_text(
+            f"📢 <b>Рассылка...</b>\n\n"
+            f"⏳ Обработано: {done} / {broadcast['total']}\n"
+            f"✅ Отправлено: {broadcast['sent']}\n"
+            f"❌ Не доставлено: {broadcast['failed']}",
+            chat_id=broadcast["status_chat_id"],
+            message_id=broadcast["status_message_id"],
+            parse_mode="HTML",
+        )
+    except TelegramBadRequest:
+        pass
+    except Exception as e:
+        logger.warning(f"BROADCAST: progress update failed for #{broadcast['id']}: {e}")
+
+
+async def _show_result(bot, broadcast: dict):
+    from src.db.settings import is_bot_paused
+    from src.db.admins import is_owner
+    from src.keyboards.admin_kb import admin_menu_kb
+    paused = await is_bot_paused()
+    owner = await is_owner(broadcast["created_by"])
+    try:
+        await bot.edit_message_text(
+            f"📢 <b>Рассылка завершена!</b>\n\n"
+            f"✅ Отправлено: {broadcast['sent']}\n"
+            f"❌ Не доставлено: {broadcast['failed']}",
+            chat_id=broadcast["status_chat_id"],
+            message_id=broadcast["status_message_id"],
+            reply_markup=admin_menu_kb(paused, show_admin_mgmt=owner),
+            parse_mode="HTML",
+        )
+    except Exception as e:
+        logger.warning(f"BROADCAST: result update failed for #{broadcast['id']}: {e}")
@@ -1,3 +1,5 @@
+import hashlib
+import hmac
 import logging
 
 from aiocryptopay import AioCryptoPay, Networks
@@ -5,6 +7,8 @@ from src.config import CRYPTO_BOT_TOKEN
 
 logger = logging.getLogger(__name__)
 
+INVOICE_BATCH_SIZE = 100
+
 _crypto: AioCryptoPay | None = None
 
 
@@ -38,18 +42,38 @@ async def create_invoice(amount: float, description: str = "", expires_in: int =
         return None
 
 
-async def check_invoice_paid(invoice_id: int) -> bool:
+async def get_invoice_statuses(invoice_ids: list[int]) -> dict[int, str]:
     crypto = get_crypto()
-    if not crypto:
+    if not crypto or not invoice_ids:
+        return {}
+    statuses = {}
+    for i in range(0, len(invoice_ids), INVOICE_BATCH_SIZE):
+        batch = invoice_ids[i:i + INVOICE_BATCH_SIZE]
+        try:
+            invoices = await crypto.get_invoices(invoice_ids=batch, count=len(batch))
+        except Exception as e:
+            logger.warning(f"CRYPTO: get_invoice_statuses({len(batch)} ids) error: {e}")
+            continue
+        if not invoices:
+            continue
+        if not isinstance(invoices, list):
+            invoices = [invoices]
+        for inv in invoices:
+            statuses[inv.invoice_id] = inv.status
+    return statuses
+
+
+async def check_invoice_paid(invoice_id: int) -> bool:
+    statuses = await get_invoice_statuses([invoice_id])
+    return statuses.get(invoice_id) == "paid"
+
+
+def verify_webhook_signature(body: bytes, signature: str) -> bool:
+    if not CRYPTO_BOT_TOKEN or not signature:
         return False
-    try:
-        invoices = await crypto.get_invoices(invoice_ids=[invoice_id])
-        if invoices:
-            inv = invoices[0] if isinstance(invoices, list) else invoices
-            return inv.status == "paid"
-    except Exception as e:
-        logger.warning(f"CRYPTO: check_invoice_paid({invoice_id}) error: {e}")
-    return False
+    secret = hashlib.sha256(CRYPTO_BOT_TOKEN.encode()).digest()
+    expected = hmac.new(secret, body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
 
 
 async def close_crypto_session():
@@ -0,0 +1,106 @@
+import asyncio
+import heapq
+import logging
+import time
+
+from src.db.orders import get_order_deadlines
+from src.db.accounts import get_reservation_deadlines
+from src.db.listener import subscribe, on_reset, is_listening
+
+logger = logging.getLogger(__name__)
+
+EXPIRY_CHANNEL = "expiry_scheduled"
+EXPIRY_HORIZON = 3600
+WINDOW_LIMIT = 1000
+FALLBACK_RELOAD_INTERVAL = 60
+RETRY_DELAY = 5
+
+_heap: list[tuple[float, str]] = []
+_wake = asyncio.Event()
+_reload_at = 0.0
+_leading = False
+
+
+def schedule_expiry(kind: str, delay: float):
+    if not _leading or delay > EXPIRY_HORIZON:
+        return
+    entry = (time.monotonic() + max(delay, 0.0), kind)
+    heapq.heappush(_heap, entry)
+    if _heap[0] == entry:
+        _wake.set()
+
+
+def reload_expiry_window():
+    global _reload_at
+    _reload_at = 0.0
+    _wake.set()
+
+
+def lead_expiry():
+    global _leading
+    _leading = True
+    reload_expiry_window()
+
+
+def lose_expiry():
+    global _leading
+    _leading = False
+    _heap.clear()
+
+
+async def _load_window():
+    global _heap, _reload_at
+    previous, _heap = _heap, []
+    try:
+        order_delays = await get_order_deadlines(EXPIRY_HORIZON, WINDOW_LIMIT)
+        reservation_delays = await get_reservation_deadlines(EXPIRY_HORIZON, WINDOW_LIMIT)
+    except Exception:
+        _heap.extend(previous)
+        heapq.heapify(_heap)
+        raise
+    now = time.monotonic()
+    _heap.extend((now + d, "order") for d in order_delays)
+    _heap.extend((now + d, "reservation") for d in reservation_delays)
+    heapq.heapify(_heap)
+
+    interval = EXPIRY_HORIZON / 2 if is_listening() else FALLBACK_RELOAD_INTERVAL
+    for delays in (order_delays, reservation_delays):
+        if len(delays) >= WINDOW_LIMIT:
+            interval = min(interval, max(delays[-1], 0.0))
+    _reload_at = now + interval
+
+
+async def wait_for_expiry() -> set[str]:
+    global _reload_at
+    while True:
+        now = time.monotonic()
+        if now >= _reload_at:
+            try:
+                await _load_window()
+            except Exception as e:
+                logger.error(f"Expiry window load error: {e}")
+                _reload_at = time.monotonic() + RETRY_DELAY
+            now = time.monotonic()
+        due = set()
+        while _heap and _heap[0][0] <= now:
+            due.add(heapq.heappop(_heap)[1])
+        if due:
+            return due
+        deadline = min(_heap[0][0], _reload_at) if _heap else _reload_at
+        _wake.clear()
+        try:
+            await asyncio.wait_for(_wake.wait(), max(deadline - now, 0.0))
+        except asyncio.TimeoutError:
+            pass
+
+
+def _on_expiry_scheduled(payload: str):
+    kind, _, delay = payload.partition(":")
+    try:
+        schedule_expiry(kind, float(delay))
+    except ValueError:
+        reload_expiry_window()
+
+
+subscribe(EXPIRY_CHANNEL, _on_expiry_scheduled)
+on_reset(reload_expiry_window)
@@ -0,0 +1,61 @@
+import logging
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+
+from src.db.users import deactivate_users
+
+logger = logging.getLogger(__name__)
+
+FLUSH_SIZE = 100
+
+UNREACHABLE_MARKERS = (
+    "chat not found",
+    "user is deactivated",
+    "peer_id_invalid",
+    "bot was blocked",
+    "bot can't initiate conversation",
+)
+
+_unreachable: set[int] = set()
+
+
+def is_unreachable_error(error: Exception) -> bool:
+    if isinstance(error, TelegramForbiddenError):
+        return True
+    if isinstance(error, TelegramBadRequest):
+        text = str(error.message).lower()
+        return any(marker in text for marker in UNREACHABLE_MARKERS)
+    return False
+
+
+async def mark_unreachable(chat_id: int):
+    _unreachable.add(chat_id)
+    if len(_unreachable) >= FLUSH_SIZE:
+        await flush_unreachable()
+
+
+async def flush_unreachable() -> int:
+    if not _unreachable:
+        return 0
+    chat_ids = list(_unreachable)
+    _unreachable.clear()
+    try:
+        updated = await deactivate_users(chat_ids)
+    except Exception:
+        _unreachable.update(chat_ids)
+        raise
+    if updated:
+        logger.info(f"UNREACHABLE: deactivated {updated} users")
+    return updated
+
+
+async def safe_send(bot, chat_id: int, text: str, **kwargs) -> bool:
+    try:
+        await bot.send_message(chat_id, text, **kwargs)
+        return True
+    except Exception as e:
+        if is_unreachable_error(e):
+            await mark_unreachable(chat_id)
+        else:
+            logger.warning(f"SEND: chat={chat_id} failed: {e}")
+        return False
@@ -0,0 +1,173 @@
+import asyncio
+import itertools
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+
+from aiogram.exceptions import TelegramRetryAfter
+
+from src.config import OUTBOX_WORKERS
+from src.utils.messaging import is_unreachable_error, mark_unreachable, flush_unreachable
+from src.utils.ratelimit import telegram_bucket
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_USER = 0
+PRIORITY_STAFF = 1
+
+MAX_RETRY_AFTER_ATTEMPTS = 5
+
+
+@dataclass
+class OutgoingMessage:
+    chat_id: int
+    text: str
+    priority: int
+    kwargs: dict = field(default_factory=dict)
+    enqueued_at: float = field(default_factory=time.monotonic)
+    attempts: int = 0
+    result: asyncio.Future | None = None
+
+
+_chats: dict[int, deque[OutgoingMessage]] = {}
+_in_flight: set[int] = set()
+_ready: asyncio.PriorityQueue | None = None
+_seq = itertools.count()
+_workers: list[asyncio.Task] = []
+_latencies: deque[float] = deque(maxlen=1000)
+_counters = {"sent": 0, "failed": 0, "retried": 0}
+
+
+def _ready_queue() -> asyncio.PriorityQueue:
+    global _ready
+    if _ready is None:
+        _ready = asyncio.PriorityQueue()
+    return _ready
+
+
+def _push(message: OutgoingMessage):
+    queue = _chats.setdefault(message.chat_id, deque())
+    queue.append(message)
+    if message.chat_id not in _in_flight:
+        _ready_queue().put_nowait((message.priority, next(_seq), message.chat_id))
+
+
+def enqueue(chat_id: int, text: str, priority: int = PRIORITY_USER, **kwargs):
+    _push(OutgoingMessage(chat_id, text, priority, kwargs))
+
+
+def enqueue_many(chat_ids, text: str, priority: int = PRIORITY_STAFF, **kwargs):
+    for chat_id in chat_ids:
+        enqueue(chat_id, text, priority, **kwargs)
+
+
+async def deliver(chat_id: int, text: str, priority: int = PRIORITY_USER, **kwargs):
+    result = asyncio.get_running_loop().create_future()
+    _push(OutgoingMessage(chat_id, text, priority, kwargs, result=result))
+    await result
+
+
+def _settle(message: OutgoingMessage, error: Exception | None = None):
+    if message.result is None or message.result.done():
+        return
+    if error is None:
+        message.result.set_result(None)
+    else:
+        message.result.set_exception(error)
+
+
+async def _deliver(bot, message: OutgoingMessage) -> bool:
+    await telegram_bucket.acquire()
+    try:
+        await bot.send_message(message.chat_id, message.text, **message.kwargs)
+    except TelegramRetryAfter as e:
+        telegram_bucket.pause(e.retry_after)
+        message.attempts += 1
+        _counters["retried"] += 1
+        logger.warning(f"OUTBOX: flood wait {e.retry_after}s (chat={message.chat_id}, attempt={message.attempts})")
+        if message.attempts < MAX_RETRY_AFTER_ATTEMPTS:
+            return False
+        _counters["failed"] += 1
+        _settle(message, e)
+        return True
+    except Exception as e:
+        _counters["failed"] += 1
+        if is_unreachable_error(e):
+            await mark_unreachable(message.chat_id)
+            _settle(message)
+        else:
+            logger.warning(f"OUTBOX: chat={message.chat_id} send failed: {e}")
+            _settle(message, e)
+        return True
+    _counters["sent"] += 1
+    _latencies.append(time.monotonic() - message.enqueued_at)
+    _settle(message)
+    return True
+
+
+async def _worker(bot):
+    ready = _ready_queue()
+    while True:
+        _, _, chat_id = await ready.get()
+        queue = _chats.get(chat_id)
+        if chat_id in _in_flight or not queue:
+            continue
+        _in_flight.add(chat_id)
+        try:
+            if await _deliver(bot, queue[0]):
+                queue.popleft()
+        except Exception as e:
+            logger.error(f"OUTBOX: worker error for chat={chat_id}: {e}", exc_info=True)
+            _settle(queue.popleft(), e)
+        finally:
+            _in_flight.discard(chat_id)
+            if queue:
+                ready.put_nowait((queue[0].priority, next(_seq), chat_id))
+            elif _chats.get(chat_id) is queue:
+                del _chats[chat_id]
+
+
+def start_outbox(bot, workers: int = OUTBOX_WORKERS):
+    if _workers:
+        return
+    for _ in range(workers):
+        _workers.append(asyncio.create_task(_worker(bot)))
+
+
+async def stop_outbox(timeout: float = 10):
+    deadline = time.monotonic() + timeout
+    while _chats and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+    for task in _workers:
+        task.cancel()
+    _workers.clear()
+    if _chats:
+        logger.warning(f"OUTBOX: dropped {sum(len(q) for q in _chats.values())} unsent messages on shutdown")
+        for queue in _chats.values():
+            for message in queue:
+                if message.result is not None:
+                    message.result.cancel()
+    try:
+        await flush_unreachable()
+    except Exception as e:
+        logger.warning(f"OUTBOX: failed to flush unreachable chats: {e}")
+
+
+def get_outbox_stats() -> dict:
+    depth = {PRIORITY_USER: 0, PRIORITY_STAFF: 0}
+    for queue in _chats.values():
+        for message in queue:
+            depth[message.priority] = depth.get(message.priority, 0) + 1
+    latencies = sorted(_latencies)
+    return {
+        "queued_user": depth[PRIORITY_USER],
+        "queued_staff": depth[PRIORITY_STAFF],
+        "chats": len(_chats),
+        "in_flight": len(_in_flight),
+        "sent": _counters["sent"],
+        "failed": _counters["failed"],
+        "retried": _counters["retried"],
+        "latency_avg": sum(latencies) / len(latencies) if latencies else 0.0,
+        "latency_p95": latencies[int(len(latencies) * 0.95)] if latencies else 0.0,
+    }
@@ -1,12 +1,54 @@
 import asyncio
 import logging
 
-from src.db.orders import get_pending_preorders, fulfill_preorder, fulfill_preorder_multi, create_order, get_order
-from src.db.accounts import try_reserve_account_exclusive, try_reserve_accounts_multi
+from src.config import PREORDER_RESCAN_INTERVAL
+from src.db.orders import get_fulfillable_preorders
+from src.db.preorders import allocate_preorders
+from src.db.inventory import INVENTORY_CHANNEL, get_category_available
+from src.db.listener import subscribe, on_reset, is_listening
+from src.utils.outbox import enqueue, enqueue_many
 
 logger = logging.getLogger(__name__)
 
+FALLBACK_SCAN_INTERVAL = 60
+
 _fulfillment_lock = asyncio.Lock()
+_wake = asyncio.Event()
+_dirty: set[int] = set()
+_dirty_all = False
+
+
+def wake_preorders(category_ids: list[int] | None = None):
+    global _dirty_all
+    if category_ids is None:
+        _dirty_all = True
+    else:
+        _dirty.update(category_ids)
+    _wake.set()
+
+
+async def wait_for_preorder_wake() -> list[int] | None:
+    global _dirty_all
+    timeout = PREORDER_RESCAN_INTERVAL if is_listening() else FALLBACK_SCAN_INTERVAL
+    try:
+        await asyncio.wait_for(_wake.wait(), timeout)
+    except asyncio.TimeoutError:
+        return None
+    _wake.clear()
+    if _dirty_all:
+        _dirty_all = False
+        _dirty.clear()
+        return None
+    category_ids = sorted(_dirty)
+    _dirty.clear()
+    return category_ids
+
+
+def _on_inventory_changed(payload: str):
+    try:
+        wake_preorders([int(payload)])
+    except ValueError:
+        wake_preorders()
 
 
 async def _notify_fulfillment(bot, po, accounts_info: list[dict], order_ids: list[int]):
@@ -21,19 +63,16 @@ async def _notify_fulfillment(bot, po, accounts_info: list[dict], order_ids: lis
     phones_text = "\n".join(f"📱 <code>{a['phone']}</code>" for a in accounts_info)
     orders_text = ", ".join(f"#{oid}" for oid in order_ids)
 
-    try:
-        await bot.send_message(
-            po["user_id"],
-            f"✅ <b>Предзаказ #{po['id']} выполнен!</b>\n\n"
-            f"📂 Категория: {cat_name}\n"
-            f"{phones_text}\n"
-            f"📋 Заказы: {orders_text}\n\n"
-            f"Аккаунты закреплены за вами на 72ч.\n"
-            f"Нажмите «Получить подпись» в заказе.",
-            parse_mode="HTML",
-        )
-    except Exception:
-        pass
+    enqueue(
+        po["user_id"],
+        f"✅ <b>Предзаказ #{po['id']} выполнен!</b>\n\n"
+        f"📂 Категория: {cat_name}\n"
+        f"{phones_text}\n"
+        f"📋 Заказы: {orders_text}\n\n"
+        f"Аккаунты закреплены за вами на 72ч.\n"
+        f"Нажмите «Получить подпись» в заказе.",
+        parse_mode="HTML",
+    )
 
     try:
         from src.db.admins import get_admin_ids
@@ -46,17 +85,9 @@ async def _notify_fulfillment(bot, po, accounts_info: list[dict], order_ids: lis
             f"{phones_text}\n"
             f"📋 Заказы: {orders_text}"
         )
-        for admin_id in admin_ids:
-            try:
-                await bot.send_message(admin_id, notify_text, parse_mode="HTML")
-            except Exception:
-                pass
+        enqueue_many(admin_ids, notify_text, parse_mode="HTML")
         op_ids = await get_preorder_operator_ids()
-        for op_id in op_ids:
-            try:
-                await bot.send_message(op_id, notify_text, parse_mode="HTML")
-            except Exception:
-                pass
+        enqueue_many(op_ids, notify_text, parse_mode="HTML")
     except Exception:
         pass
 
@@ -72,70 +103,60 @@ async def _process_preorder_referral(bot, po, order_ids: list[int]):
         for oid in order_ids:
             result = await process_referral_reward(po["user_id"], oid, per_order)
             if result:
-                try:
-                    await bot.send_message(
-                        result['referrer_id'],
-                        f"💰 <b>Реферальный бонус!</b>\n\n"
-                        f"Ваш реферал совершил покупку.\n"
-                        f"Начислено: <b>+{result['reward']:.2f}$</b>",
-                        parse_mode="HTML",
-                    )
-                except Exception:
-                    pass
+                enqueue(
+                    result['referrer_id'],
+                    f"💰 <b>Реферальный бонус!</b>\n\n"
+                    f"Ваш реферал совершил покупку.\n"
+                    f"Начислено: <b>+{result['reward']:.2f}$</b>",
+                    parse_mode="HTML",
+                )
     except Exception:
         pass
 
 
-async def _fulfill_exclusive(bot, po) -> bool:
-    account = await try_reserve_account_exclusive(po["category_id"], po["user_id"])
-    if not account:
-        return False
-    await fulfill_preorder(po["id"], account["id"])
-    await _notify_fulfillment(bot, po, [account], [po["id"]])
-    await _process_preorder_referral(bot, po, [po["id"]])
-    return True
-
-
-async def _fulfill_regular(bot, po) -> bool:
-    qty = po.get("total_signatures", 1)
-    allocations = await try_reserve_accounts_multi(po["category_id"], po["user_id"], qty)
-    if not allocations:
-        return False
-
-    if len(allocations) == 1:
-        await fulfill_preorder(po["id"], allocations[0]["id"])
-        await _notify_fulfillment(bot, po, allocations, [po["id"]])
-        await _process_preorder_referral(bot, po, [po["id"]])
-    else:
-        order_ids = await fulfill_preorder_multi(po, allocations)
-        await _notify_fulfillment(bot, po, allocations, order_ids)
-        await _process_preorder_referral(bot, po, order_ids)
-
-    return True
-
-
-async def run_preorder_fulfillment(bot):
+async def _fulfill_category(bot, category_id: int, preorders: list[dict]) -> int:
+    fulfilled = 0
+    pending = preorders
+    while pending:
+        if await get_category_available(category_id) <= 0:
+            break
+        try:
+            results = await allocate_preorders(category_id, pending)
+        except Exception as e:
+            logger.error(f"Preorder allocation error for category {category_id}: {e}", exc_info=True)
+            break
+        if not results:
+            break
+        for r in results:
+            po = r["preorder"]
+            await _notify_fulfillment(bot, po, r["allocations"], r["order_ids"])
+            await _process_preorder_referral(bot, po, r["order_ids"])
+            logger.info(f"Fulfilled preorder #{po['id']} (exclusive={po.get('is_exclusive', 0)})")
+        fulfilled += len(results)
+        done = {r["preorder"]["id"] for r in results}
+        pending = [po for po in pending if po["id"] not in done]
+    return fulfilled
+
+
+async def run_preorder_fulfillment(bot, category_ids: list[int] | None = None):
     if not bot:
         logger.warning("run_preorder_fulfillment: bot is None, skipping")
         return 0
 
     if _fulfillment_lock.locked():
+        wake_preorders(category_ids)
         return 0
 
     async with _fulfillment_lock:
-        preorders = await get_pending_preorders()
-        fulfilled = 0
+        preorders = await get_fulfillable_preorders(category_ids)
+        by_category: dict[int, list[dict]] = {}
         for po in preorders:
-            try:
-                is_exclusive = po.get("is_exclusive", 0)
-                if is_exclusive:
-                    success = await _fulfill_exclusive(bot, po)
-                else:
-                    success = await _fulfill_regular(bot, po)
-
-                if success:
-                    fulfilled += 1
-                    logger.info(f"Fulfilled preorder #{po['id']} (exclusive={is_exclusive})")
-            except Exception as e:
-                logger.error(f"Preorder fulfill error #{po['id']}: {e}")
+            by_category.setdefault(po["category_id"], []).append(po)
+        fulfilled = 0
+        for category_id, queue in by_category.items():
+            fulfilled += await _fulfill_category(bot, category_id, queue)
         return fulfilled
+
+
+subscribe(INVENTORY_CHANNEL, _on_inventory_changed)
+on_reset(wake_preorders)
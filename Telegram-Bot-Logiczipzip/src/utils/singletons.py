@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import time
+
+from src.config import JOB_HEARTBEAT_INTERVAL
+from src.db.leases import INSTANCE_ID, connect_leases, try_acquire_lease, heartbeat_leases, record_job_run
+
+logger = logging.getLogger(__name__)
+
+RESTART_DELAY = 5
+
+_jobs: dict[str, dict] = {}
+_task: asyncio.Task | None = None
+
+
+def register_job(name: str, run, *, interval: float | None = None, wait=None,
+                 on_lead=None, on_lose=None, run_first: bool = True):
+    _jobs[name] = {
+        "name": name, "run": run, "interval": interval, "wait": wait,
+        "on_lead": on_lead, "on_lose": on_lose, "run_first": run_first,
+    }
+
+
+async def _run_once(job: dict, *args):
+    started = time.monotonic()
+    error = None
+    try:
+        await job["run"](*args)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        error = str(e) or type(e).__name__
+        logger.error(f"JOBS: {job['name']} failed: {e}", exc_info=True)
+    try:
+        await record_job_run(job["name"], time.monotonic() - started, error)
+    except Exception as e:
+        logger.warning(f"JOBS: could not record run of {job['name']}: {e}")
+
+
+async def _job_loop(job: dict):
+    if job["on_lead"]:
+        job["on_lead"]()
+    try:
+        await _lead(job)
+    finally:
+        if job["on_lose"]:
+            job["on_lose"]()
+
+
+async def _lead(job: dict):
+    if job["wait"] is None and job["interval"] is None:
+        await _run_once(job)
+        return
+    first = True
+    while True:
+        try:
+            if job["wait"] is not None:
+                await _run_once(job, await job["wait"]())
+                continue
+            if not (first and job["run_first"]):
+                await asyncio.sleep(job["interval"])
+            first = False
+            await _run_once(job)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"JOBS: {job['name']} loop error: {e}", exc_info=True)
+            await asyncio.sleep(RESTART_DELAY)
+
+
+async def _stop(tasks: dict[str, asyncio.Task]):
+    for task in tasks.values():
+        task.cancel()
+    for name, task in tasks.items():
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"JOBS: {name} stopped with error: {e}")
+    if tasks:
+        logger.info(f"JOBS: {INSTANCE_ID} gave up {', '.join(tasks)}")
+    tasks.clear()
+
+
+async def _run():
+    while True:
+        conn = None
+        leading: dict[str, asyncio.Task] = {}
+        try:
+            conn = await connect_leases()
+            while True:
+                for name, job in _jobs.items():
+                    if name not in leading and await try_acquire_lease(conn, name):
+                        logger.info(f"JOBS: {INSTANCE_ID} is now leading {name}")
+                        leading[name] = asyncio.create_task(_job_loop(job))
+                await heartbeat_leases(conn, list(leading), JOB_HEARTBEAT_INTERVAL)
+                await asyncio.sleep(JOB_HEARTBEAT_INTERVAL)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"JOBS: lease connection error: {e}")
+        finally:
+            await _stop(leading)
+            if conn is not None and not conn.is_closed():
+                conn.terminate()
+        await asyncio.sleep(RESTART_DELAY)
+
+
+def start_jobs():
+    global _task
+    if _task is None:
+        _task = asyncio.create_task(_run())
+
+
+async def stop_jobs():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
@@ -0,0 +1,118 @@
+import asyncio
+import logging
+import time
+
+from src.config import SUBSCRIPTION_TTL, SUBSCRIPTION_NEGATIVE_TTL
+from src.db.database import get_pool
+from src.db.listener import subscribe, notify
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIPTION_CHANNEL = "subscription_changed"
+MAX_ENTRIES = 200_000
+WARM_CONCURRENCY = 10
+
+NOT_MEMBER_STATUSES = ("left", "kicked")
+
+_status: dict[tuple[int, int], tuple[bool, float]] = {}
+_inflight: dict[tuple[int, int], asyncio.Future] = {}
+_counters = {"hits": 0, "misses": 0}
+
+
+def get_cached_status(user_id: int, channel_id: int) -> bool | None:
+    entry = _status.get((user_id, channel_id))
+    if entry is None:
+        return None
+    subscribed, expires_at = entry
+    if expires_at <= time.monotonic():
+        _status.pop((user_id, channel_id), None)
+        return None
+    return subscribed
+
+
+def set_status(user_id: int, channel_id: int, subscribed: bool):
+    if len(_status) >= MAX_ENTRIES:
+        _prune()
+    ttl = SUBSCRIPTION_TTL if subscribed else SUBSCRIPTION_NEGATIVE_TTL
+    _status[(user_id, channel_id)] = (subscribed, time.monotonic() + ttl)
+
+
+def forget(user_id: int, channel_id: int):
+    _status.pop((user_id, channel_id), None)
+
+
+def _prune():
+    now = time.monotonic()
+    for key in [k for k, (_, expires_at) in _status.items() if expires_at <= now]:
+        del _status[key]
+    if len(_status) >= MAX_ENTRIES:
+        _status.clear()
+
+
+async def _fetch_status(bot, user_id: int, channel_id: int) -> bool:
+    try:
+        member = await bot.get_chat_member(channel_id, user_id)
+        subscribed = member.status not in NOT_MEMBER_STATUSES
+    except Exception as e:
+        logger.debug(f"SUBS: get_chat_member({channel_id}, {user_id}) failed: {e}")
+        subscribed = False
+    set_status(user_id, channel_id, subscribed)
+    return subscribed
+
+
+async def is_subscribed(bot, user_id: int, channel_id: int, fresh: bool = False) -> bool:
+    cached = get_cached_status(user_id, channel_id)
+    if cached or (cached is False and not fresh):
+        _counters["hits"] += 1
+        return cached
+    _counters["misses"] += 1
+    key = (user_id, channel_id)
+    future = _inflight.get(key)
+    if future is None:
+        future = asyncio.ensure_future(_fetch_status(bot, user_id, channel_id))
+        _inflight[key] = future
+        future.add_done_callback(lambda _: _inflight.pop(key, None))
+    return await asyncio.shield(future)
+
+
+async def warm_subscriptions(bot, user_ids: list[int], channel_ids: list[int]) -> int:
+    missing = [
+        (u, c) for u in user_ids for c in channel_ids
+        if get_cached_status(u, c) is None
+    ]
+    if not missing:
+        return 0
+    sem = asyncio.Semaphore(WARM_CONCURRENCY)
+
+    async def _warm(user_id, channel_id):
+        async with sem:
+            await is_subscribed(bot, user_id, channel_id)
+
+    await asyncio.gather(*[_warm(u, c) for u, c in missing])
+    return len(missing)
+
+
+async def record_member_update(user_id: int, channel_id: int, status: str):
+    subscribed = status not in NOT_MEMBER_STATUSES
+    set_status(user_id, channel_id, subscribed)
+    try:
+        pool = await get_pool()
+        async with pool.acquire() as conn:
+            await notify(conn, SUBSCRIPTION_CHANNEL, f"{user_id}:{channel_id}:{int(subscribed)}")
+    except Exception as e:
+        logger.warning(f"SUBS: failed to publish member update for {user_id}:{channel_id}: {e}")
+
+
+def _on_notify(payload: str):
+    try:
+        user_id, channel_id, subscribed = (int(p) for p in payload.split(":"))
+    except ValueError:
+        return
+    set_status(user_id, channel_id, bool(subscribed))
+
+
+def get_subscription_cache_stats() -> dict:
+    return {"entries": len(_status), "inflight": len(_inflight), **_counters}
+
+
+subscribe(SUBSCRIPTION_CHANNEL, _on_notify)
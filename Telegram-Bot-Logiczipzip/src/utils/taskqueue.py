@@ -0,0 +1,139 @@
+import asyncio
+import json
+import logging
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.types import InlineKeyboardMarkup
+
+from src.config import JOB_WORKERS
+from src.db.jobs import JOBS_CHANNEL, enqueue_job, enqueue_jobs, claim_jobs, lock_claimed_job, complete_job, fail_job
+from src.db.listener import subscribe
+from src.db.uow import transaction
+from src.utils.outbox import PRIORITY_USER, PRIORITY_STAFF, deliver
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = 5
+BACKOFF_BASE = 5
+BACKOFF_MAX = 600
+
+_handlers: dict[str, tuple] = {}
+_wake = asyncio.Event()
+_workers: list[asyncio.Task] = []
+
+
+def register_job_handler(kind: str, handler, transactional: bool = True):
+    _handlers[kind] = (handler, transactional)
+
+
+def _backoff(attempts: int, error: Exception) -> float:
+    delay = min(BACKOFF_BASE * 2 ** max(attempts - 1, 0), BACKOFF_MAX)
+    if isinstance(error, TelegramRetryAfter):
+        delay = max(delay, error.retry_after)
+    return delay
+
+
+async def _execute(job: dict):
+    handler, transactional = _handlers[job["kind"]]
+    payload = json.loads(job["payload"])
+    if not transactional:
+        await handler(payload)
+        await complete_job(job["id"], job["attempts"])
+        return
+    async with transaction() as conn:
+        if not await lock_claimed_job(conn, job["id"], job["attempts"]):
+            logger.warning(f"JOB_QUEUE: #{job['id']} {job['kind']} lease lost, skipping")
+            return
+        await handler(payload)
+        await complete_job(job["id"], job["attempts"])
+
+
+async def _process(job: dict):
+    if job["kind"] not in _handlers:
+        await fail_job(job["id"], job["attempts"], f"no handler for {job['kind']}", BACKOFF_MAX)
+        return
+    try:
+        await _execute(job)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        delay = _backoff(job["attempts"], e)
+        status = await fail_job(job["id"], job["attempts"], str(e) or type(e).__name__, delay)
+        if status == "failed":
+            logger.error(f"JOB_QUEUE: #{job['id']} {job['kind']} gave up after {job['attempts']} attempts: {e}", exc_info=True)
+        else:
+            logger.warning(f"JOB_QUEUE: #{job['id']} {job['kind']} attempt {job['attempts']} failed, retry in {delay:.0f}s: {e}")
+
+
+async def _worker():
+    while True:
+        _wake.clear()
+        try:
+            jobs = await claim_jobs(1)
+        except Exception as e:
+            logger.error(f"JOB_QUEUE: claim failed: {e}")
+            await asyncio.sleep(POLL_INTERVAL)
+            continue
+        if not jobs:
+            try:
+                await asyncio.wait_for(_wake.wait(), POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        try:
+            await _process(jobs[0])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"JOB_QUEUE: #{jobs[0]['id']} could not be settled: {e}", exc_info=True)
+
+
+def start_job_workers(concurrency: int = JOB_WORKERS):
+    if _workers:
+        return
+    for _ in range(concurrency):
+        _workers.append(asyncio.create_task(_worker()))
+    logger.info(f"JOB_QUEUE: started {concurrency} workers")
+
+
+async def stop_job_workers():
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+
+
+def _notification_payload(chat_id: int, text: str, reply_markup: InlineKeyboardMarkup | None,
+                          parse_mode: str | None, priority: int) -> dict:
+    return {
+        "chat_id": chat_id,
+        "text": text,
+        "parse_mode": parse_mode,
+        "reply_markup": reply_markup.model_dump_json(exclude_none=True) if reply_markup else None,
+        "priority": priority,
+    }
+
+
+async def enqueue_notification(chat_id: int, text: str, key: str, reply_markup: InlineKeyboardMarkup | None = None,
+                               parse_mode: str | None = "HTML", priority: int = PRIORITY_USER) -> int | None:
+    payload = _notification_payload(chat_id, text, reply_markup, parse_mode, priority)
+    return await enqueue_job("notify", key, payload)
+
+
+async def enqueue_notifications(chat_ids, text: str, key: str, reply_markup: InlineKeyboardMarkup | None = None,
+                                parse_mode: str | None = "HTML", priority: int = PRIORITY_STAFF) -> list[int]:
+    return await enqueue_jobs("notify", [
+        (f"{key}:{chat_id}", _notification_payload(chat_id, text, reply_markup, parse_mode, priority))
+        for chat_id in dict.fromkeys(chat_ids)
+    ])
+
+
+async def _send_notification(payload: dict):
+    kwargs = {"parse_mode": payload.get("parse_mode")}
+    if payload.get("reply_markup"):
+        kwargs["reply_markup"] = InlineKeyboardMarkup.model_validate_json(payload["reply_markup"])
+    await deliver(payload["chat_id"], payload["text"], payload.get("priority", PRIORITY_USER), **kwargs)
+
+
+register_job_handler("notify", _send_notification, transactional=False)
+subscribe(JOBS_CHANNEL, lambda payload: _wake.set())
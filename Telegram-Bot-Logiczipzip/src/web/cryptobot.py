@@ -0,0 +1,31 @@
+import json
+import logging
+
+from aiohttp import web
+
+from src.utils.cryptobot import verify_webhook_signature
+from src.handlers.payment import accept_paid_invoice
+
+logger = logging.getLogger(__name__)
+
+SIGNATURE_HEADER = "crypto-pay-api-signature"
+
+
+async def cryptobot_webhook(request: web.Request) -> web.Response:
+    body = await request.read()
+    if not verify_webhook_signature(body, request.headers.get(SIGNATURE_HEADER, "")):
+        logger.warning(f"CRYPTO_HOOK: bad signature from {request.remote}")
+        return web.Response(status=401)
+    try:
+        update = json.loads(body)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return web.Response(status=400)
+    if update.get("update_type") != "invoice_paid":
+        return web.Response(text="ok")
+    invoice = update.get("payload") or {}
+    invoice_id = invoice.get("invoice_id")
+    if not invoice_id or invoice.get("status") != "paid":
+        return web.Response(text="ok")
+    logger.info(f"CRYPTO_HOOK: invoice={invoice_id} paid, update={update.get('update_id')}")
+    await accept_paid_invoice(int(invoice_id))
+    return web.Response(text="ok")
@@ -0,0 +1,54 @@
+import logging
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+
+from src.config import (
+    WEB_SERVER_HOST, WEB_SERVER_PORT, CRYPTO_WEBHOOK_PATH,
+    TELEGRAM_WEBHOOK_PATH, TELEGRAM_WEBHOOK_SECRET, UPDATE_CONCURRENCY, SHUTDOWN_DRAIN_TIMEOUT,
+)
+
+logger = logging.getLogger(__name__)
+
+_runner: web.AppRunner | None = None
+
+
+def build_app(dp: Dispatcher | None = None, bot: Bot | None = None) -> web.Application | None:
+    app = web.Application()
+    if CRYPTO_WEBHOOK_PATH:
+        from src.web.cryptobot import cryptobot_webhook
+        app.router.add_post(CRYPTO_WEBHOOK_PATH, cryptobot_webhook)
+    if dp is not None:
+        from aiogram.webhook.aiohttp_server import setup_application
+        from src.web.telegram import BoundedRequestHandler
+        handler = BoundedRequestHandler(
+            dp, bot,
+            concurrency=UPDATE_CONCURRENCY,
+            drain_timeout=SHUTDOWN_DRAIN_TIMEOUT,
+            secret_token=TELEGRAM_WEBHOOK_SECRET,
+        )
+        handler.register(app, path=TELEGRAM_WEBHOOK_PATH)
+        setup_application(app, dp, bot=bot)
+    if not app.router.routes():
+        return None
+    return app
+
+
+async def start_web_server(dp: Dispatcher | None = None, bot: Bot | None = None) -> bool:
+    global _runner
+    app = build_app(dp, bot)
+    if app is None:
+        return False
+    _runner = web.AppRunner(app)
+    await _runner.setup()
+    site = web.TCPSite(_runner, WEB_SERVER_HOST, WEB_SERVER_PORT)
+    await site.start()
+    logger.info(f"Web server listening on {WEB_SERVER_HOST}:{WEB_SERVER_PORT}")
+    return True
+
+
+async def stop_web_server():
+    global _runner
+    if _runner:
+        await _runner.cleanup()
+        _runner = None
@@ -0,0 +1,37 @@
+import asyncio
+import logging
+from typing import Any
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+
+logger = logging.getLogger(__name__)
+
+
+class BoundedRequestHandler(SimpleRequestHandler):
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, concurrency: int, drain_timeout: float, **kwargs: Any):
+        super().__init__(dispatcher, bot, handle_in_background=True, **kwargs)
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._drain_timeout = drain_timeout
+
+    async def _background_feed_update(self, bot: Bot, update: dict[str, Any]) -> None:
+        async with self._semaphore:
+            try:
+                await super()._background_feed_update(bot, update)
+            except Exception as e:
+                logger.error(f"WEBHOOK: update {update.get('update_id')} failed: {e}", exc_info=True)
+
+    async def drain(self):
+        tasks = set(self._background_feed_update_tasks)
+        if not tasks:
+            return
+        logger.info(f"WEBHOOK: draining {len(tasks)} in-flight updates")
+        done, pending = await asyncio.wait(tasks, timeout=self._drain_timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            logger.warning(f"WEBHOOK: cancelled {len(pending)} updates still running after {self._drain_timeout}s")
+
+    async def close(self) -> None:
+        await self.drain()
+        await super().close()
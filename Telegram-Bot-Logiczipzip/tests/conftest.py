@@ -0,0 +1,50 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL", "")
+if TEST_DATABASE_URL:
+    os.environ["DATABASE_URL"] = TEST_DATABASE_URL
+
+
+@pytest.fixture
+def run_db():
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+
+    def run(scenario):
+        async def main():
+            from src.db.database import get_pool, init_db, close_db
+            pool = await get_pool()
+            await pool.execute("DROP SCHEMA public CASCADE; CREATE SCHEMA public")
+            await init_db()
+            try:
+                await scenario()
+            finally:
+                await close_db()
+
+        asyncio.run(main())
+
+    return run
+
+
+async def add_enabled_accounts(count: int, prefix: str = "7900") -> list[int]:
+    from src.db.accounts import import_accounts, enable_accounts_by_ids
+    accounts = [{"phone": f"{prefix}{i:07d}", "password": "pw", "totp_secret": "SECRET"} for i in range(count)]
+    ids = (await import_accounts(accounts, added_by_admin_id=1))["added_ids"]
+    await enable_accounts_by_ids(ids)
+    return ids
+
+
+async def first_category(max_signatures: int | None = None) -> dict:
+    from src.db.database import get_pool
+    pool = await get_pool()
+    row = await pool.fetchrow(
+        "SELECT * FROM categories WHERE $1::int IS NULL OR max_signatures = $1 ORDER BY id LIMIT 1",
+        max_signatures
+    )
+    return dict(row)
@@ -0,0 +1,98 @@
+import hashlib
+import hmac
+import json
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from src.db.database import get_pool
+from src.db.jobs import claim_jobs
+from src.db.payments import create_payment, get_payment_by_invoice
+from src.db.users import get_or_create_user, get_user
+from src.handlers import payment
+from src.utils import cryptobot
+from src.utils.taskqueue import _process
+from src.web import server
+
+TOKEN = "12345:fake-crypto-pay-token"
+WEBHOOK_PATH = "/cryptobot/webhook"
+
+
+class FakeCryptoBot:
+    def __init__(self, client: TestClient):
+        self.client = client
+        self.update_id = 0
+
+    async def invoice_paid(self, invoice_id: int, token: str = TOKEN):
+        self.update_id += 1
+        body = json.dumps({
+            "update_id": self.update_id,
+            "update_type": "invoice_paid",
+            "payload": {"invoice_id": invoice_id, "status": "paid"},
+        }).encode()
+        secret = hashlib.sha256(token.encode()).digest()
+        signature = hmac.new(secret, body, hashlib.sha256).hexdigest()
+        return await self.client.post(
+            WEBHOOK_PATH, data=body,
+            headers={"crypto-pay-api-signature": signature, "Content-Type": "application/json"},
+        )
+
+
+async def _run_due_jobs():
+    pool = await get_pool()
+    await pool.execute("UPDATE jobs SET run_at = NOW() WHERE status = 'queued'")
+    for job in await claim_jobs(10):
+        await _process(job)
+
+
+def test_paid_invoice_survives_a_failed_handler(run_db, monkeypatch):
+    monkeypatch.setattr(cryptobot, "CRYPTO_BOT_TOKEN", TOKEN)
+    monkeypatch.setattr(server, "CRYPTO_WEBHOOK_PATH", WEBHOOK_PATH)
+
+    original = payment.confirm_balance_payment
+    calls = []
+
+    async def flaky_confirm(*args):
+        calls.append(args)
+        if len(calls) == 1:
+            raise RuntimeError("database hiccup")
+        return await original(*args)
+
+    monkeypatch.setattr(payment, "confirm_balance_payment", flaky_confirm)
+
+    async def scenario():
+        pool = await get_pool()
+        await get_or_create_user(500)
+        await create_payment(500, 42, 10.0, "https://pay.example/42")
+
+        async with TestClient(TestServer(server.build_app())) as client:
+            crypto = FakeCryptoBot(client)
+
+            resp = await crypto.invoice_paid(42, token="wrong-token")
+            assert resp.status == 401
+            assert await pool.fetchval("SELECT COUNT(*) FROM jobs") == 0
+
+            resp = await crypto.invoice_paid(42)
+            assert resp.status == 200
+            job = await pool.fetchrow("SELECT * FROM jobs WHERE kind = 'invoice_paid'")
+            assert json.loads(job["payload"]) == {"invoice_id": 42}
+            assert (await get_payment_by_invoice(42))["status"] == "pending"
+
+            await _run_due_jobs()
+            job = await pool.fetchrow("SELECT * FROM jobs WHERE kind = 'invoice_paid'")
+            assert (job["status"], job["attempts"]) == ("queued", 1)
+            assert (await get_payment_by_invoice(42))["status"] == "pending"
+            assert (await get_user(500))["balance"] == 0
+
+            resp = await crypto.invoice_paid(42)
+            assert resp.status == 200
+            assert await pool.fetchval("SELECT COUNT(*) FROM jobs WHERE kind = 'invoice_paid'") == 1
+
+            await _run_due_jobs()
+            assert (await pool.fetchrow("SELECT status FROM jobs WHERE kind = 'invoice_paid'"))["status"] == "done"
+            assert (await get_payment_by_invoice(42))["status"] == "paid"
+            assert (await get_user(500))["balance"] == 10.0
+            assert await pool.fetchval(
+                "SELECT COUNT(*) FROM jobs WHERE kind = 'notify' AND idempotency_key = 'balance_paid:42'"
+            ) == 1
+
+    run_db(scenario)
@@ -0,0 +1,45 @@
+import asyncio
+
+from src.utils import expiry
+from src.utils.singletons import _job_loop, register_job, _jobs
+
+
+def test_standby_instances_do_not_queue_expiry_deadlines():
+    expiry.lose_expiry()
+    for _ in range(100):
+        expiry._on_expiry_scheduled("order:30")
+    assert expiry._heap == []
+
+    expiry.lead_expiry()
+    expiry._on_expiry_scheduled("order:30")
+    expiry._on_expiry_scheduled("reservation:7200")
+    assert [kind for _, kind in expiry._heap] == ["order"]
+
+    expiry.lose_expiry()
+    assert expiry._heap == []
+
+
+def test_losing_leadership_runs_on_lose():
+    events = []
+
+    async def wait_forever():
+        await asyncio.Event().wait()
+
+    async def run(*args):
+        pass
+
+    register_job(
+        "test_job", run, wait=wait_forever,
+        on_lead=lambda: events.append("lead"), on_lose=lambda: events.append("lose"),
+    )
+    job = _jobs.pop("test_job")
+
+    async def scenario():
+        task = asyncio.create_task(_job_loop(job))
+        await asyncio.sleep(0)
+        assert events == ["lead"]
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(scenario())
+    assert events == ["lead", "lose"]
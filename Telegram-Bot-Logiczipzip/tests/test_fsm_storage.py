@@ -0,0 +1,50 @@
+import asyncio
+
+import pytest
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+
+from src.handlers.admin import _remember_added_ids, _unpack_id_ranges
+from src.storage.memory import BoundedMemoryStorage, FSMEntryTooLarge
+
+
+def _context(max_entry_bytes: int = 2048) -> tuple[BoundedMemoryStorage, FSMContext]:
+    storage = BoundedMemoryStorage(ttl=60, max_entries=10, max_entry_bytes=max_entry_bytes)
+    return storage, FSMContext(storage, StorageKey(bot_id=1, chat_id=1, user_id=1))
+
+
+def test_oversize_entry_is_rejected():
+    storage, state = _context()
+    with pytest.raises(FSMEntryTooLarge):
+        asyncio.run(state.update_data(blob="x" * 4096))
+    assert storage.counters["rejected"] == 1
+    assert storage.get_stats()["entries"] == 0
+
+
+def test_large_import_keeps_added_ids_as_ranges():
+    storage, state = _context()
+    added_ids = list(range(100_000, 150_000))
+
+    async def scenario():
+        await _remember_added_ids(state, added_ids[::-1])
+        return await state.get_data()
+
+    data = asyncio.run(scenario())
+    assert data["last_added_count"] == len(added_ids)
+    assert data["added_ranges"] == [[100_000, 149_999]]
+    assert _unpack_id_ranges(data["added_ranges"]) == added_ids
+    assert storage.counters["rejected"] == 0
+
+
+def test_scattered_import_degrades_when_ids_do_not_fit():
+    storage, state = _context()
+    added_ids = list(range(1, 4000, 2))
+
+    async def scenario():
+        await state.update_data(note="kept")
+        await _remember_added_ids(state, added_ids)
+        return await state.get_data()
+
+    data = asyncio.run(scenario())
+    assert data == {"note": "kept", "last_added_count": len(added_ids), "added_ranges": []}
+    assert storage.counters["rejected"] == 1
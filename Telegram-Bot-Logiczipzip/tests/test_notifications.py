@@ -0,0 +1,62 @@
+import json
+
+from src.db.database import get_pool
+from src.db.jobs import claim_jobs
+from src.utils import outbox
+from src.utils.taskqueue import _process, enqueue_notification, enqueue_notifications
+
+
+class FakeBot:
+    def __init__(self, failures: int = 0):
+        self.sent = []
+        self.failures = failures
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("telegram is down")
+        self.sent.append((chat_id, text))
+
+
+async def _run_due_jobs():
+    pool = await get_pool()
+    await pool.execute("UPDATE jobs SET run_at = NOW() WHERE status = 'queued'")
+    for job in await claim_jobs(10):
+        await _process(job)
+
+
+def test_staff_notifications_are_inserted_in_one_batch(run_db):
+    async def scenario():
+        pool = await get_pool()
+        ids = await enqueue_notifications([11, 12, 12, 13], "new order", "order:1:staff")
+        assert len(ids) == 3
+        assert await enqueue_notifications([11, 12, 13], "new order", "order:1:staff") == []
+        payloads = [json.loads(r["payload"]) for r in await pool.fetch("SELECT payload FROM jobs ORDER BY id")]
+        assert [p["chat_id"] for p in payloads] == [11, 12, 13]
+        assert {p["priority"] for p in payloads} == {outbox.PRIORITY_STAFF}
+
+    run_db(scenario)
+
+
+def test_notify_jobs_go_through_the_outbox_in_chat_order(run_db):
+    async def scenario():
+        pool = await get_pool()
+        bot = FakeBot(failures=1)
+        before = outbox.get_outbox_stats()
+        outbox.start_outbox(bot, workers=2)
+        try:
+            await enqueue_notification(7, "payment received", "balance_paid:1")
+            await _run_due_jobs()
+            job = await pool.fetchrow("SELECT status, attempts FROM jobs")
+            assert (job["status"], job["attempts"]) == ("queued", 1)
+
+            outbox.enqueue(7, "reply from the handler")
+            await _run_due_jobs()
+            assert (await pool.fetchrow("SELECT status FROM jobs"))["status"] == "done"
+            assert bot.sent == [(7, "reply from the handler"), (7, "payment received")]
+            stats = outbox.get_outbox_stats()
+            assert (stats["sent"] - before["sent"], stats["failed"] - before["failed"]) == (2, 1)
+        finally:
+            await outbox.stop_outbox()
+
+    run_db(scenario)
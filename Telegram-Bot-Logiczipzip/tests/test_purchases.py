@@ -0,0 +1,33 @@
+import asyncio
+
+from src.db.database import get_pool
+from src.db.inventory import reconcile_inventory
+from src.db.purchases import purchase
+
+from conftest import add_enabled_accounts, first_category
+
+
+def test_concurrent_purchases_never_oversell(run_db):
+    async def scenario():
+        pool = await get_pool()
+        cat = await first_category()
+        await add_enabled_accounts(2)
+        capacity = 2 * cat["max_signatures"]
+        buyers = capacity + 5
+
+        results = await asyncio.gather(*(
+            purchase(1000 + i, cat["id"], 1, 1.0, charge=False) for i in range(buyers)
+        ))
+
+        sold = sum(len(r["orders"]) for r in results)
+        assert sold == capacity
+        assert sum(len(r["preorder_ids"]) for r in results) == buyers - capacity
+        rows = await pool.fetch(
+            "SELECT s.used_signatures, COALESCE(s.max_signatures, c.max_signatures) AS max_signatures "
+            "FROM account_signatures s JOIN categories c ON c.id = s.category_id WHERE s.category_id = $1",
+            cat["id"]
+        )
+        assert all(r["used_signatures"] <= r["max_signatures"] for r in rows)
+        assert await reconcile_inventory() == []
+
+    run_db(scenario)
@@ -0,0 +1,138 @@
+import asyncio
+
+import pytest
+
+from src.db import accounts
+from src.db.accounts import try_reserve_account
+from src.db.database import get_pool
+from src.db.inventory import reconcile_inventory
+
+from conftest import add_enabled_accounts, first_category
+
+RESERVATION_KEYS = {"id", "phone", "password", "totp_secret", "batch_size"}
+
+
+def test_concurrent_reservations_stay_within_capacity(run_db):
+    async def scenario():
+        cat = await first_category()
+        ids = await add_enabled_accounts(3)
+        capacity = len(ids) * cat["max_signatures"]
+        attempts = capacity + 10
+
+        results = await asyncio.gather(*(
+            try_reserve_account(cat["id"], 2000 + i, 1) for i in range(attempts)
+        ))
+
+        reserved = [r for r in results if r is not None]
+        assert len(reserved) == capacity
+        assert all(set(r) == RESERVATION_KEYS for r in reserved)
+        assert all(r["batch_size"] == 1 for r in reserved)
+        per_account = {}
+        for r in reserved:
+            per_account[r["id"]] = per_account.get(r["id"], 0) + r["batch_size"]
+        assert set(per_account) <= set(ids)
+        assert all(n <= cat["max_signatures"] for n in per_account.values())
+        assert await reconcile_inventory() == []
+
+    run_db(scenario)
+
+
+def test_concurrent_whole_account_reservations_take_each_account_once(run_db):
+    async def scenario():
+        cat = await first_category()
+        ids = await add_enabled_accounts(4)
+        attempts = 12
+
+        results = await asyncio.gather(*(
+            try_reserve_account(cat["id"], 3000 + i) for i in range(attempts)
+        ))
+
+        reserved = [r for r in results if r is not None]
+        assert len(reserved) == len(ids)
+        assert sorted(r["id"] for r in reserved) == sorted(ids)
+        assert all(set(r) == RESERVATION_KEYS for r in reserved)
+        assert all(r["batch_size"] == cat["max_signatures"] for r in reserved)
+        assert await reconcile_inventory() == []
+
+    run_db(scenario)
+
+
+def test_sparse_reservations_skip_rows_being_created_elsewhere(run_db):
+    async def scenario():
+        pool = await get_pool()
+        cat = await first_category()
+        ids = await add_enabled_accounts(6)
+
+        async with pool.acquire() as other:
+            creating = other.transaction()
+            await creating.start()
+            await other.execute("SELECT pg_advisory_xact_lock($1, $2)", cat["id"], ids[0])
+            await other.execute(
+                "INSERT INTO account_signatures (account_id, category_id) VALUES ($1, $2)", ids[0], cat["id"]
+            )
+            results = await asyncio.wait_for(asyncio.gather(*(
+                try_reserve_account(cat["id"], 6000 + i) for i in range(len(ids) - 1)
+            )), timeout=10)
+            await creating.rollback()
+
+        assert sorted(r["id"] for r in results) == sorted(ids[1:])
+        rows = await pool.fetch("SELECT account_id, used_signatures FROM account_signatures")
+        assert sorted(r["account_id"] for r in rows) == sorted(ids[1:])
+        assert all(r["used_signatures"] == cat["max_signatures"] for r in rows)
+        assert await reconcile_inventory() == []
+
+    run_db(scenario)
+
+
+def test_multi_reservation_spreads_and_rolls_back_on_error(run_db, monkeypatch):
+    async def scenario():
+        pool = await get_pool()
+        cat = await first_category()
+        ids = await add_enabled_accounts(3)
+        quantity = 2 * cat["max_signatures"] + 1
+
+        original = accounts._lock_candidates
+
+        async def failing_lock(*args):
+            await original(*args)
+            raise RuntimeError("connection reset")
+
+        monkeypatch.setattr(accounts, "_lock_candidates", failing_lock)
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                with pytest.raises(RuntimeError):
+                    await accounts._reserve_multi(conn, cat["id"], 4000, quantity)
+                assert await conn.fetchval("SELECT COUNT(*) FROM account_signatures") == 0
+        monkeypatch.setattr(accounts, "_lock_candidates", original)
+
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                allocations = await accounts._reserve_multi(conn, cat["id"], 4000, quantity)
+        assert sum(a["batch_size"] for a in allocations) == quantity
+        assert {a["id"] for a in allocations} == set(ids)
+        assert all(set(a) == RESERVATION_KEYS for a in allocations)
+        assert await reconcile_inventory() == []
+
+    run_db(scenario)
+
+
+def test_expired_reservations_release_in_batches_skipping_locked_rows(run_db):
+    async def scenario():
+        pool = await get_pool()
+        cat = await first_category()
+        ids = await add_enabled_accounts(5)
+        for i in range(len(ids)):
+            assert await try_reserve_account(cat["id"], 5000 + i)
+        await pool.execute("UPDATE account_signatures SET reserved_until = NOW() - INTERVAL '1 second'")
+
+        async with pool.acquire() as other:
+            async with other.transaction():
+                await other.execute(
+                    "SELECT 1 FROM account_signatures WHERE account_id = $1 FOR UPDATE", ids[0]
+                )
+                assert await accounts.release_expired_reservations(batch_size=2) == len(ids) - 1
+        assert await accounts.release_expired_reservations(batch_size=2) == 1
+        assert await pool.fetchval("SELECT COUNT(*) FROM account_signatures WHERE reserved_by IS NOT NULL") == 0
+        assert await reconcile_inventory() == []
+
+    run_db(scenario)
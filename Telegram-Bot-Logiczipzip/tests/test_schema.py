@@ -0,0 +1,26 @@
+import asyncio
+
+from src.db.database import get_pool, init_db
+
+TRIGGERS = ("trg_inventory_increase", "trg_order_expiry", "trg_reservation_expiry")
+
+
+def test_concurrent_init_db_creates_each_trigger_once(run_db):
+    async def scenario():
+        pool = await get_pool()
+        for _ in range(5):
+            for trigger, table in await pool.fetch(
+                "SELECT tgname, tgrelid::regclass::text FROM pg_trigger WHERE tgname = ANY($1::text[])",
+                list(TRIGGERS)
+            ):
+                await pool.execute(f"DROP TRIGGER {trigger} ON {table}")
+
+            await asyncio.gather(*(init_db() for _ in range(4)))
+
+            rows = await pool.fetch(
+                "SELECT tgname, COUNT(*) AS n FROM pg_trigger WHERE tgname = ANY($1::text[]) GROUP BY tgname",
+                list(TRIGGERS)
+            )
+            assert {r["tgname"]: r["n"] for r in rows} == {t: 1 for t in TRIGGERS}
+
+    run_db(scenario)
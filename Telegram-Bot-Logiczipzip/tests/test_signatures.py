@@ -0,0 +1,42 @@
+from src.db import accounts
+from src.db.database import get_pool
+from src.db.inventory import reconcile_inventory
+from src.db.signatures import compact_signatures, ensure_signature_rows
+
+from conftest import add_enabled_accounts, first_category
+
+
+def test_admin_edits_survive_concurrent_compaction(run_db, monkeypatch):
+    async def scenario():
+        pool = await get_pool()
+        cat = await first_category()
+        ids = await add_enabled_accounts(3)
+        async with pool.acquire() as conn:
+            await ensure_signature_rows(conn, [ids[0]], [cat["id"]])
+
+        original = accounts.ensure_signature_rows
+        compacted = []
+
+        async def ensure_then_compact(conn, *args):
+            inserted = await original(conn, *args)
+            compacted.append(await compact_signatures())
+            return inserted
+
+        monkeypatch.setattr(accounts, "ensure_signature_rows", ensure_then_compact)
+        await accounts.update_account_signature_max(ids[0], cat["id"], cat["max_signatures"] + 3)
+        await accounts.update_account_used_signatures(ids[1], cat["id"], 1)
+        await accounts.bulk_update_all_signature_max(cat["id"] + 1, 9)
+
+        assert compacted == [0, 0, 0]
+        rows = await pool.fetch(
+            "SELECT account_id, category_id, max_signatures, used_signatures FROM account_signatures "
+            "WHERE account_id = ANY($1::int[]) ORDER BY account_id, category_id",
+            ids
+        )
+        by_key = {(r["account_id"], r["category_id"]): r for r in rows}
+        assert by_key[(ids[0], cat["id"])]["max_signatures"] == cat["max_signatures"] + 3
+        assert by_key[(ids[1], cat["id"])]["used_signatures"] == 1
+        assert all(by_key[(a, cat["id"] + 1)]["max_signatures"] == 9 for a in ids)
+        assert await reconcile_inventory() == []
+
+    run_db(scenario)